@@ -0,0 +1,188 @@
+import secrets
+import struct
+import zlib
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Preferred order when the client accepts several encodings equally
+ENCODINGS = [encoding for encoding, available in (
+    ("zstd", zstandard is not None), ("br", brotli is not None), ("gzip", True)) if available]
+# Bulky feature data, compressed with any encoding
+DATA_TYPES = (
+    "application/geo+json", "application/x-ndjson", "application/vnd.mapbox-vector-tile",
+    "application/flatgeobuf", "application/vnd.apache.arrow.stream",
+)
+# Responses that can reflect input next to tokens or CSRF values, only
+# compressed with a length masked gzip
+MASKED_TYPES = ("text/", "application/json", "application/xml", "application/javascript")
+UNCOMPRESSED_TYPES = ("text/html",)
+
+
+class GzipCompressor:
+    def __init__(self):
+        # wbits 31 writes the gzip header and trailer
+        self.compressor = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class BrotliCompressor:
+    def __init__(self):
+        self.compressor = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_LEVEL)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+class ZstdCompressor:
+    def __init__(self):
+        self.compressor = zstandard.ZstdCompressor(
+            level=settings.COMPRESSION_ZSTD_LEVEL).compressobj()
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class MaskedGzipCompressor(GzipCompressor):
+    """
+    gzip with a file name of random length in the header, as Django's
+    GZipMiddleware writes against BREACH: the compressed length no longer
+    tells whether a guessed secret matched the response.
+    """
+
+    def __init__(self):
+        # Raw deflate, the header and trailer are written here
+        self.compressor = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, -15)
+        name = secrets.token_hex(secrets.randbelow(settings.COMPRESSION_MAX_RANDOM_BYTES) + 1)
+        # Magic, deflate, FNAME flag, no time, unknown OS
+        self.header = b"\x1f\x8b\x08\x08\x00\x00\x00\x00\x00\xff" + name.encode("ascii") + b"\x00"
+        self.crc = 0
+        self.size = 0
+
+    def compress(self, data):
+        self.crc = zlib.crc32(data, self.crc)
+        self.size += len(data)
+        header, self.header = self.header, b""
+        return header + self.compressor.compress(data)
+
+    def finish(self):
+        header, self.header = self.header, b""
+        return header + self.compressor.flush() + struct.pack("<II", self.crc, self.size & 0xFFFFFFFF)
+
+
+COMPRESSORS = {"gzip": GzipCompressor, "br": BrotliCompressor, "zstd": ZstdCompressor}
+
+
+def acceptedEncoding(header, encodings=None):
+    """Best supported encoding of an Accept-Encoding header, None for identity."""
+    qualities = {}
+    for item in header.split(","):
+        parts = [part.strip() for part in item.split(";")]
+        if not parts[0]:
+            continue
+        quality = 1.0
+        for part in parts[1:]:
+            if part.startswith("q="):
+                try:
+                    quality = float(part[2:])
+                except ValueError:
+                    quality = 0.0
+        qualities[parts[0].lower()] = quality
+    wildcard = qualities.get("*", 0.0)
+    best, bestQuality = None, 0.0
+    for encoding in encodings or ENCODINGS:
+        quality = qualities.get(encoding, wildcard)
+        if quality > bestQuality:
+            best, bestQuality = encoding, quality
+    return best
+
+
+def compressStream(chunks, compressor):
+    # Every chunk is flushed so clients receive data while it is produced
+    for chunk in chunks:
+        if chunk:
+            data = compressor.compress(chunk) + compressor.flush()
+            if data:
+                yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware:
+    """
+    Compresses feature data with zstd, brotli or gzip, whichever the client
+    prefers of those installed, and other JSON, XML and text (except HTML)
+    with a length masked gzip. Responses smaller than COMPRESSION_MIN_SIZE,
+    already encoded, partial or of binary types that do not compress are
+    passed through. Streaming responses are compressed chunk by chunk.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        contentType = response.get("Content-Type", "")
+        masked = not contentType.startswith(DATA_TYPES)
+        if masked and (not contentType.startswith(MASKED_TYPES) or contentType.startswith(UNCOMPRESSED_TYPES)):
+            return response
+        patch_vary_headers(response, ("Accept-Encoding",))
+        if response.has_header("Content-Encoding") or response.status_code == 206 or \
+                response.has_header("Content-Range"):
+            return response
+        encoding = acceptedEncoding(request.META.get("HTTP_ACCEPT_ENCODING", ""),
+                                    ["gzip"] if masked else None)
+        if encoding is None:
+            return response
+        compressorType = MaskedGzipCompressor if masked else COMPRESSORS[encoding]
+
+        if response.streaming:
+            if getattr(response, "is_async", False):
+                return response
+            response.streaming_content = compressStream(
+                response.streaming_content, compressorType())
+            del response["Content-Length"]
+        else:
+            if len(response.content) < settings.COMPRESSION_MIN_SIZE:
+                return response
+            compressor = compressorType()
+            compressed = compressor.compress(response.content) + compressor.finish()
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response["Content-Length"] = str(len(compressed))
+
+        # The encoded body is a different representation of the same entity
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        response["Content-Encoding"] = encoding
+        return response
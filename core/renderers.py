@@ -0,0 +1,33 @@
+import orjson
+from rest_framework.encoders import JSONEncoder
+from rest_framework.renderers import BaseRenderer
+
+# Types orjson does not know (Decimal, lazy translations, querysets, ...)
+# are converted the same way as by DRF's encoder
+encoder = JSONEncoder()
+
+
+def dumps(data, indent=False):
+    option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    return orjson.dumps(data, default=encoder.default, option=option)
+
+
+class ORJSONRenderer(BaseRenderer):
+    """
+    JSON renderer on orjson. numpy arrays and scalars are serialized
+    natively, NaN and infinity become null.
+    """
+    media_type = "application/json"
+    format = "json"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        indent = False
+        if accepted_media_type:
+            # Browsable API and clients asking for application/json; indent=4
+            indent = "indent=" in accepted_media_type
+        return dumps(data, indent)
@@ -61,6 +61,7 @@ INSTALLED_APPS = [
     "django.contrib.messages",
     "django.contrib.staticfiles",
     "django.contrib.humanize",
+    "django.contrib.gis",
     "channels",
     "rest_framework",
     "rest_framework_simplejwt",
@@ -72,6 +73,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "core.middleware.CompressionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -222,9 +224,154 @@ else:
 # ILWIS
 ILWIS_WORKING_DIR = os.getenv("ILWIS_WORKING_DIR")
 
+# Maximum number of operations of a single workflow running concurrently
+WORKFLOW_MAX_WORKERS = int(os.getenv("WORKFLOW_MAX_WORKERS", 4))
+# Upper bound of the maxWorkers a request or workflow may ask for
+WORKFLOW_MAX_WORKERS_LIMIT = int(os.getenv("WORKFLOW_MAX_WORKERS_LIMIT", 16))
+
+# Shared HTTP client for upstream OGC/REST servers, timeouts in seconds
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", 20))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", 20))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 60))
+# Read timeout of calls that execute a remote process
+HTTP_EXECUTE_READ_TIMEOUT = float(os.getenv("HTTP_EXECUTE_READ_TIMEOUT", 600))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", 3))
+HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", 0.5))
+
+# Downloads of remote rasters, fetched in parallel parts of
+# RASTER_DOWNLOAD_PART_SIZE bytes when the server accepts range requests
+# and kept for reuse for RASTER_DOWNLOAD_TTL seconds after their last use
+RASTER_DOWNLOAD_DIR = os.getenv(
+    "RASTER_DOWNLOAD_DIR", os.path.join(MEDIA_ROOT, "cache", "downloads"))
+RASTER_DOWNLOAD_PART_SIZE = int(
+    os.getenv("RASTER_DOWNLOAD_PART_SIZE", 16 * 1024 ** 2))
+RASTER_DOWNLOAD_WORKERS = int(os.getenv("RASTER_DOWNLOAD_WORKERS", 4))
+RASTER_DOWNLOAD_RETRIES = int(os.getenv("RASTER_DOWNLOAD_RETRIES", 5))
+RASTER_DOWNLOAD_MAX_SIZE = int(
+    os.getenv("RASTER_DOWNLOAD_MAX_SIZE", 20 * 1024 ** 3))
+RASTER_DOWNLOAD_TTL = int(os.getenv("RASTER_DOWNLOAD_TTL", 24 * 3600))
+
+# Content-addressed store of raster and vector results, files that are
+# not referenced by a task or execution are evicted least recently used
+# first beyond STORE_MAX_SIZE bytes. STORE_BASE_URL is the public URL of
+# STORE_DIR, e.g. https://<host>/media/store, required for outputs that
+# are handed to other servers
+STORE_DIR = os.getenv("STORE_DIR", os.path.join(MEDIA_ROOT, "store"))
+STORE_BASE_URL = os.getenv("STORE_BASE_URL", "")
+STORE_MAX_SIZE = int(os.getenv("STORE_MAX_SIZE", 50 * 1024 ** 3))
+
+# Conversion to Cloud-Optimized GeoTIFF (tiled, compressed, with internal
+# overviews) of rasters before they are published and, when
+# COG_CONVERT_OUTPUTS is set and the store has a STORE_BASE_URL, of
+# coverage outputs, which are replaced by the URL of the stored COG
+COG_CONVERT_PUBLISH = os.getenv("COG_CONVERT_PUBLISH", "True") == "True"
+COG_CONVERT_OUTPUTS = os.getenv("COG_CONVERT_OUTPUTS", "False") == "True"
+COG_WORKERS = int(os.getenv("COG_WORKERS", 2))
+# Seconds a conversion may take before it is killed and the original file
+# is used instead
+COG_TIMEOUT = int(os.getenv("COG_TIMEOUT", 600))
+COG_BLOCK_SIZE = int(os.getenv("COG_BLOCK_SIZE", 512))
+COG_COMPRESSION = os.getenv("COG_COMPRESSION", "DEFLATE")
+# Nearest keeps the values of the raster, overviews are also sampled for
+# the SLD class breaks
+COG_OVERVIEW_RESAMPLING = os.getenv("COG_OVERVIEW_RESAMPLING", "NEAREST")
+
+# Capabilities catalog: concurrent fetches and deadlines in seconds
+CAPABILITIES_MAX_WORKERS = int(os.getenv("CAPABILITIES_MAX_WORKERS", 16))
+CAPABILITIES_SERVER_TIMEOUT = float(os.getenv("CAPABILITIES_SERVER_TIMEOUT", 15))
+CAPABILITIES_REQUEST_TIMEOUT = float(
+    os.getenv("CAPABILITIES_REQUEST_TIMEOUT", 25))
+
+# Polling of asynchronous (RESTful WPS) jobs, intervals in seconds
+WPS_JOB_POLL_INTERVAL = float(os.getenv("WPS_JOB_POLL_INTERVAL", 1))
+WPS_JOB_POLL_MAX_INTERVAL = float(os.getenv("WPS_JOB_POLL_MAX_INTERVAL", 30))
+WPS_JOB_POLL_FACTOR = float(os.getenv("WPS_JOB_POLL_FACTOR", 2))
+WPS_JOB_TIMEOUT = float(os.getenv("WPS_JOB_TIMEOUT", 3600))
+# Concurrent status requests and the read timeout of each of them
+WPS_JOB_POLL_WORKERS = int(os.getenv("WPS_JOB_POLL_WORKERS", 4))
+WPS_JOB_POLL_TIMEOUT = float(os.getenv("WPS_JOB_POLL_TIMEOUT", 10))
+
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL")
 CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND")
 
+# Cache of operation results, backend is "filesystem", "redis" or "none"
+RESULT_CACHE_BACKEND = os.getenv("RESULT_CACHE_BACKEND", "filesystem")
+RESULT_CACHE_URL = os.getenv("RESULT_CACHE_URL", CELERY_BROKER_URL)
+RESULT_CACHE_DIR = os.getenv(
+    "RESULT_CACHE_DIR", os.path.join(MEDIA_ROOT, "cache", "results"))
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", 7 * 24 * 3600))
+RESULT_CACHE_MAX_SIZE = int(os.getenv("RESULT_CACHE_MAX_SIZE", 1024 ** 3))
+# Process labels that are not deterministic and never cached
+RESULT_CACHE_EXCLUDE = [
+    label for label in os.getenv("RESULT_CACHE_EXCLUDE", "").split(",") if label
+]
+# Resources with side effects, publishing to GeoServer must always run
+RESULT_CACHE_EXCLUDE_RESOURCES = ["GeoServer"]
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # Shared between the web and worker processes when Redis is available
+    "capabilities": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": CELERY_BROKER_URL,
+    } if CELERY_BROKER_URL else {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "capabilities",
+    },
+    "tiles": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": CELERY_BROKER_URL,
+        "KEY_PREFIX": "tiles",
+    } if CELERY_BROKER_URL else {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "tiles",
+    },
+    "credentials": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": CELERY_BROKER_URL,
+        "KEY_PREFIX": "credentials",
+    } if CELERY_BROKER_URL else {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "credentials",
+    },
+}
+
+# Parsed capabilities documents are served from the cache for
+# CAPABILITIES_CACHE_TTL seconds, then served stale for up to
+# CAPABILITIES_CACHE_MAX_STALE seconds while they are revalidated
+CAPABILITIES_CACHE = "capabilities"
+CAPABILITIES_CACHE_TTL = int(os.getenv("CAPABILITIES_CACHE_TTL", 3600))
+CAPABILITIES_CACHE_MAX_STALE = int(
+    os.getenv("CAPABILITIES_CACHE_MAX_STALE", 7 * 24 * 3600))
+# Concurrent DescribeSensor requests per SOS catalog and how long sensor
+# positions are kept
+SOS_DESCRIBE_SENSOR_WORKERS = int(
+    os.getenv("SOS_DESCRIBE_SENSOR_WORKERS", 8))
+SOS_SENSOR_CACHE_TTL = int(os.getenv("SOS_SENSOR_CACHE_TTL", 30 * 24 * 3600))
+# Seconds a request may fetch missing observations of a series before
+# another request takes over
+SOS_FETCH_LEASE = int(os.getenv("SOS_FETCH_LEASE", 120))
+# Seconds a request waits for another one that fetches the same series,
+# then it answers with what is stored and fetching set
+SOS_FETCH_WAIT = float(os.getenv("SOS_FETCH_WAIT", 3))
+
+# Vector tiles, cached tiles are dropped when their layer is reloaded
+TILE_CACHE = "tiles"
+TILE_CACHE_TTL = int(os.getenv("TILE_CACHE_TTL", 7 * 24 * 3600))
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+TILE_MAX_ZOOM = int(os.getenv("TILE_MAX_ZOOM", 22))
+
+# Class breaks of published rasters: quantile, equal (interval) or jenks
+# (natural breaks), computed on a sample of SLD_SAMPLE_SIZE valid pixels,
+# natural breaks on a subsample of SLD_JENKS_SAMPLE_SIZE
+SLD_CLASSIFICATION = os.getenv("SLD_CLASSIFICATION", "quantile")
+SLD_SAMPLE_SIZE = int(os.getenv("SLD_SAMPLE_SIZE", 1000000))
+SLD_JENKS_SAMPLE_SIZE = int(os.getenv("SLD_JENKS_SAMPLE_SIZE", 1000))
+
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
@@ -248,7 +395,11 @@ USE_THOUSAND_SEPARATOR = True  # False by default
 THOUSAND_SEPARATOR = "\xa0"
 
 ILWIS_API = ""
-GEOJAR_FILE = os.path.join(BASE_DIR, "libs/gs/GeoPub.jar")
+# Rasters of a batch published to GeoServer concurrently
+GEOSERVER_PUBLISH_WORKERS = int(os.getenv("GEOSERVER_PUBLISH_WORKERS", 4))
+# Seconds a publish password waits in the credentials cache for its task
+GEOSERVER_CREDENTIALS_CACHE = "credentials"
+GEOSERVER_CREDENTIALS_TTL = int(os.getenv("GEOSERVER_CREDENTIALS_TTL", 3600))
 
 
 CORS_ALLOWED_ORIGINS = [
@@ -265,9 +416,28 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework_simplejwt.authentication.JWTAuthentication',
-    )
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'core.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
+# Responses of at least COMPRESSION_MIN_SIZE bytes are compressed with
+# zstd, brotli or gzip, as negotiated with Accept-Encoding. JSON, XML and
+# text that may carry secrets are only gzipped, with up to
+# COMPRESSION_MAX_RANDOM_BYTES of random padding against BREACH
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+COMPRESSION_MAX_RANDOM_BYTES = int(os.getenv("COMPRESSION_MAX_RANDOM_BYTES", 100))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", 6))
+COMPRESSION_BROTLI_LEVEL = int(os.getenv("COMPRESSION_BROTLI_LEVEL", 5))
+COMPRESSION_ZSTD_LEVEL = int(os.getenv("COMPRESSION_ZSTD_LEVEL", 3))
+
 SIMPLE_JWT = {    
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=180),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=50),
@@ -5,6 +5,13 @@ import json
 class ServicesConfig(AppConfig):
     name = 'services'
 
+    def ready(self):
+        import services.signals
+        from services.store import ResultReferences
+        from utils.store import ResultStore
+        ResultStore.pinned = ResultReferences.referenced
+        return super().ready()
+
     # def ready(self):
     #     from services.models import Server
 
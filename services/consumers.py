@@ -0,0 +1,65 @@
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import AccessToken
+from urllib.parse import parse_qs
+from services.models import Execution
+from services.serializers import ExecutionStatusSerializer
+
+
+class ExecutionConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Streams the progress of one execution. On connect the current state is
+    sent, afterwards every operation start, finish (with its output) and
+    failure as published by services.tasks.publishEvent.
+    """
+
+    async def connect(self):
+        self.executionID = self.scope["url_route"]["kwargs"]["pk"]
+        self.group = executionGroup(self.executionID)
+        # Joined before the snapshot is taken, events published meanwhile
+        # are delivered after it instead of being lost
+        await self.channel_layer.group_add(self.group, self.channel_name)
+        snapshot = await self.getSnapshot()
+        if snapshot is None:
+            await self.channel_layer.group_discard(self.group, self.channel_name)
+            await self.close(code=4404)
+            return
+        await self.accept()
+        await self.send_json({
+            "event": "execution.snapshot",
+            "execution": str(self.executionID),
+            "snapshot": snapshot
+        })
+
+    async def disconnect(self, code):
+        if hasattr(self, "group"):
+            await self.channel_layer.group_discard(self.group, self.channel_name)
+
+    async def execution_event(self, event):
+        await self.send_json(event["payload"])
+
+    def getUserID(self):
+        user = self.scope.get("user")
+        if user is not None and user.is_authenticated:
+            return user.id
+        # Browsers cannot set headers on a WebSocket, the JWT access token
+        # is therefore also accepted as ?token=
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        if "token" in query:
+            try:
+                return AccessToken(query["token"][0]).payload.get("user_id")
+            except TokenError:
+                return None
+        return None
+
+    @database_sync_to_async
+    def getSnapshot(self):
+        execution = Execution.findVisible(self.executionID, self.getUserID())
+        if execution is None:
+            return None
+        return ExecutionStatusSerializer(instance=execution).data
+
+
+def executionGroup(key):
+    return "execution_" + str(key)
@@ -0,0 +1,138 @@
+import io
+import json
+import time
+import tracemalloc
+import xmltodict
+from django.core.management.base import BaseCommand
+from utils import Util
+
+
+def legacyWfs(text, url, limit):
+    # Parsing used before the streaming parsers, kept here for comparison only
+    jsonResponse = xmltodict.parse(text)
+    root = 'wfs:WFS_Capabilities'
+    if root not in jsonResponse:
+        root = 'WFS_Capabilities'
+    features = []
+    for row in jsonResponse[root]['FeatureTypeList']['FeatureType']:
+        if len(features) > limit:
+            continue
+        features.append({'url': url + row['Name'], 'name': row['Name'],
+                        'title': row['Title'], 'abstract': row.get('Abstract')})
+    return features
+
+
+def legacyWps(text, url, limit):
+    d = json.loads(json.dumps(xmltodict.parse(text)))
+    processes = []
+    for row in d['wps:Capabilities']['wps:ProcessOfferings']['wps:Process']:
+        if len(processes) > limit:
+            break
+        processes.append({'id': row['ows:Identifier'],
+                         'longname': row['ows:Title']})
+    return processes
+
+
+def legacyWcs(text, url, limit):
+    jsonResponse = xmltodict.parse(text)
+    root = 'wcs:CoverageDescription'
+    if root not in jsonResponse:
+        root = 'CoverageDescription'
+    coverages = []
+    for row in jsonResponse[root].get('wcs:CoverageOffering', []):
+        if len(coverages) > limit:
+            continue
+        coverages.append({'name': row['wcs:name'], 'title': row['wcs:label']})
+    return coverages
+
+
+KINDS = {
+    "wfs": (legacyWfs, Util.parseWfsCapabilities),
+    "wps": (legacyWps, lambda results, url, limit: Util.parseWpsProcesses(results, url, limit, "")),
+    "wcs": (legacyWcs, Util.parseWcsCapabilities),
+}
+
+
+def detectKind(data):
+    head = data[:2000]
+    if b"WFS_Capabilities" in head:
+        return "wfs"
+    if b"CoverageDescription" in head:
+        return "wcs"
+    return "wps"
+
+
+def generateWfs(size):
+    # Synthetic GeoServer-like document, every feature type carries the
+    # keywords and bounding boxes that make real documents large
+    rows = []
+    for i in range(size):
+        keywords = "".join(
+            f"<ows:Keyword>keyword{k}</ows:Keyword>" for k in range(20))
+        rows.append(
+            f"<FeatureType><Name>workspace:layer{i}</Name><Title>Layer {i}</Title>"
+            f"<Abstract>Synthetic layer {i} {'lorem ipsum ' * 20}</Abstract>"
+            f"<ows:Keywords>{keywords}</ows:Keywords>"
+            f"<DefaultCRS>urn:ogc:def:crs:EPSG::4326</DefaultCRS>"
+            f"<ows:WGS84BoundingBox><ows:LowerCorner>-180 -90</ows:LowerCorner>"
+            f"<ows:UpperCorner>180 90</ows:UpperCorner></ows:WGS84BoundingBox></FeatureType>")
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<wfs:WFS_Capabilities xmlns:wfs="http://www.opengis.net/wfs/2.0" '
+        'xmlns="http://www.opengis.net/wfs/2.0" xmlns:ows="http://www.opengis.net/ows/1.1">'
+        '<ows:ServiceIdentification><ows:ServiceTypeVersion>2.0.0</ows:ServiceTypeVersion>'
+        '</ows:ServiceIdentification><FeatureTypeList>' + "".join(rows) +
+        '</FeatureTypeList></wfs:WFS_Capabilities>').encode("utf-8")
+
+
+class BufferedResponse:
+    status_code = 200
+
+    def __init__(self, data):
+        self.raw = io.BytesIO(data)
+
+
+def measure(function):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function()
+    elapsed = (time.perf_counter() - start) * 1000
+    peak = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+class Command(BaseCommand):
+    help = "Benchmark the streaming capabilities parsers against full xmltodict parsing"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--file", action="append", default=[],
+                            help="Capabilities document saved from a server, repeatable")
+        parser.add_argument("--generate", default="1000,10000",
+                            help="Sizes of synthetic WFS documents, empty to skip")
+        parser.add_argument("--limits", default="100,100000")
+
+    def handle(self, *args, **options):
+        documents = []
+        for path in options["file"]:
+            with open(path, "rb") as f:
+                data = f.read()
+            documents.append((path, detectKind(data), data))
+        for size in filter(None, options["generate"].split(",")):
+            documents.append(
+                (f"synthetic wfs {size}", "wfs", generateWfs(int(size))))
+        limits = [int(limit) for limit in options["limits"].split(",")]
+
+        self.stdout.write(
+            f"{'document':<32}{'MB':>8}{'limit':>8}{'entries':>9}{'legacy ms':>11}{'legacy MB':>11}{'stream ms':>11}{'stream MB':>11}")
+        for name, kind, data in documents:
+            legacy, streaming = KINDS[kind]
+            text = data.decode("utf-8")
+            for limit in limits:
+                _, legacyTime, legacyPeak = measure(
+                    lambda: legacy(text, "", limit))
+                result, streamTime, streamPeak = measure(
+                    lambda: streaming(BufferedResponse(data), "", limit))
+                self.stdout.write(
+                    f"{name[-32:]:<32}{len(data) / 1024 ** 2:>8.1f}{limit:>8}{len(result or []):>9}"
+                    f"{legacyTime:>11.1f}{legacyPeak:>11.1f}{streamTime:>11.1f}{streamPeak:>11.1f}")
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.transform import from_bounds
+from rasterio.windows import Window
+from django.core.management.base import BaseCommand
+from utils import classification
+
+
+def legacyBreaks(ds):
+    # Class breaks as computed by generateSLD before the sampling, kept here
+    # for comparison only
+    pixArr = ds.read(1).flatten()
+    pixArr = sorted(set(pixArr))
+    pixArr = np.array(pixArr)
+    n = int(len(pixArr) / 7)
+    return pixArr[list(range(0, len(pixArr) - 1, n))]
+
+
+def generateRaster(path, size, overviews=False, nodata=-9999.0, block=512, seed=0):
+    # Float32 surface with noise and a nodata border, written block by block
+    rng = np.random.default_rng(seed)
+    profile = {"driver": "GTiff", "width": size, "height": size, "count": 1, "dtype": "float32",
+               "nodata": nodata, "tiled": True, "blockxsize": 256, "blockysize": 256,
+               "compress": "deflate", "crs": "EPSG:4326",
+               "transform": from_bounds(0, 0, 1, 1, size, size)}
+    with rasterio.open(path, "w", **profile) as ds:
+        for row in range(0, size, block):
+            for col in range(0, size, block):
+                height, width = min(block, size - row), min(block, size - col)
+                y, x = np.mgrid[row:row + height, col:col + width] / size
+                data = (np.sin(x * 6) * np.cos(y * 4) * 100 +
+                        rng.normal(0, 5, (height, width))).astype(np.float32)
+                data[(x < 0.05) | (y < 0.05)] = nodata
+                ds.write(data, 1, window=Window(col, row, width, height))
+        if overviews:
+            ds.build_overviews([2, 4, 8, 16, 32], Resampling.nearest)
+
+
+class Command(BaseCommand):
+    help = "Benchmark SLD class breaks from samples against reading the whole band"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="2000,8000,20000")
+        parser.add_argument("--legacy-max-size", type=int, default=2000,
+                            help="Largest raster the whole band is read for")
+        parser.add_argument("--sample-size", type=int, default=1000000)
+        parser.add_argument("--jenks-sample-size", type=int, default=1000)
+
+    def measure(self, function):
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = function()
+        elapsed = (time.perf_counter() - start) * 1000
+        peak = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+        tracemalloc.stop()
+        return result, elapsed, peak
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'size':>8}{'overviews':>11}{'method':>10}{'time (ms)':>12}"
+                          f"{'peak (MB)':>12}  breaks")
+        with tempfile.TemporaryDirectory() as directory:
+            for size in [int(size) for size in options["sizes"].split(",")]:
+                for overviews in (False, True):
+                    path = os.path.join(directory, "%d_%d.tif" % (size, overviews))
+                    generateRaster(path, size, overviews)
+                    with rasterio.open(path) as ds:
+                        runs = [(method, lambda method=method: classification.breaks(
+                            ds, method, 7, options["sample_size"], options["jenks_sample_size"]))
+                            for method in classification.METHODS]
+                        if size <= options["legacy_max_size"] and not overviews:
+                            runs.insert(0, ("legacy", lambda: legacyBreaks(ds)))
+                        for method, function in runs:
+                            edges, elapsed, peak = self.measure(function)
+                            self.stdout.write(
+                                f"{size:>8}{str(overviews):>11}{method:>10}{elapsed:>12.1f}{peak:>12.1f}  "
+                                + ", ".join("%.1f" % edge for edge in edges))
+                    os.remove(path)
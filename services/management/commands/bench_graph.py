@@ -0,0 +1,94 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from utils.graph import WorkflowGraph
+
+
+def legacyOrder(workflow):
+    # Ordering used before WorkflowGraph, kept here for comparison only
+    operations = workflow["operations"]
+    connections = workflow["connections"]
+    nodeIDs = set()
+    operIDs = set()
+    for operation in operations:
+        operIDs.add(operation["id"])
+        for connection in connections:
+            if connection["fromOperationID"] == operation["id"]:
+                nodeIDs.add(operation["id"])
+                break
+
+    def recursiveF(orderID, id):
+        for connection in connections:
+            if connection["toOperationID"] == id:
+                if connection["fromOperationID"] in orderID:
+                    orderID.remove(connection["fromOperationID"])
+                orderID.insert(0, connection["fromOperationID"])
+                recursiveF(orderID, connection["fromOperationID"])
+
+    leafIDs = list(operIDs.difference(nodeIDs))
+    orderID = list(leafIDs)
+    for id in leafIDs:
+        recursiveF(orderID, id)
+    return orderID
+
+
+def generateWorkflow(size, shape, seed=0):
+    rnd = random.Random(seed)
+    operations = [{"id": i, "inputs": [], "outputs": [{"type": "geom"}]}
+                  for i in range(size)]
+    connections = []
+    if shape == "chain":
+        for i in range(1, size):
+            connections.append({"fromOperationID": i - 1, "toOperationID": i})
+    elif shape == "diamond":
+        # Layers of four operations, every operation reads two operations of
+        # the previous layer so ancestors are shared many times
+        width = 4
+        for i in range(width, size):
+            layer = i // width
+            for parent in rnd.sample(range((layer - 1) * width, layer * width), 2):
+                connections.append(
+                    {"fromOperationID": parent, "toOperationID": i})
+    else:
+        for i in range(1, size):
+            for parent in rnd.sample(range(i), min(i, 2)):
+                connections.append(
+                    {"fromOperationID": parent, "toOperationID": i})
+    return {"operations": operations, "connections": connections}
+
+
+class Command(BaseCommand):
+    help = "Benchmark the workflow execution ordering on generated workflows"
+
+    def add_arguments(self, parser):
+        # The small sizes are also ordered with the legacy recursion
+        parser.add_argument("--sizes", default="25,50,1000,2500,5000,10000")
+        parser.add_argument(
+            "--shapes", default="chain,diamond,random")
+        parser.add_argument("--legacy-max", type=int, default=50,
+                            help="Largest workflow also ordered with the legacy recursion, "
+                                 "which grows exponentially on shared ancestors")
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options["sizes"].split(",")]
+        shapes = options["shapes"].split(",")
+        self.stdout.write(
+            f"{'shape':<10}{'nodes':>8}{'edges':>8}{'graph (ms)':>14}{'levels':>8}{'legacy (ms)':>14}")
+        for shape in shapes:
+            for size in sizes:
+                workflow = generateWorkflow(size, shape)
+                start = time.perf_counter()
+                graph = WorkflowGraph(workflow)
+                levels = graph.levels()
+                elapsed = (time.perf_counter() - start) * 1000
+
+                legacy = "-"
+                if size <= options["legacy_max"]:
+                    start = time.perf_counter()
+                    try:
+                        legacyOrder(workflow)
+                        legacy = f"{(time.perf_counter() - start) * 1000:.1f}"
+                    except RecursionError:
+                        legacy = "recursion"
+                self.stdout.write(
+                    f"{shape:<10}{size:>8}{len(workflow['connections']):>8}{elapsed:>14.1f}{len(levels):>8}{legacy:>14}")
@@ -0,0 +1,105 @@
+import datetime
+import random
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from core.middleware import ENCODINGS, COMPRESSORS
+from core.renderers import ORJSONRenderer
+from services.management.commands.bench_transform import generateLayer
+
+
+def generateCatalog(size, seed=0):
+    # Layer list as returned for WFS capabilities
+    rnd = random.Random(seed)
+    return [{
+        "url": "https://example.org/geoserver/wfs?service=WFS&request=GetFeature&typeName=ws:layer_" + str(i),
+        "name": "ws:layer_" + str(i),
+        "title": "Layer " + str(i),
+        "abstract": " ".join(rnd.choice(("land", "water", "road", "parcel", "census")) for _ in range(30)),
+        "defaultCRS": "urn:ogc:def:crs:EPSG::4326",
+    } for i in range(size)]
+
+
+def generateWorkflows(size, operations=20, seed=0):
+    # Serialized Workflow rows with their graph in content
+    rnd = random.Random(seed)
+    created = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    workflows = []
+    for i in range(size):
+        content = {"workflows": [{"operations": [{
+            "id": j,
+            "metadata": {"longname": "Operation " + str(j), "url": "https://example.org/wps"},
+            "inputs": [{"name": "input" + str(k), "identifier": "input" + str(k), "type": "geom",
+                        "value": str(j - 1) + "_to_" + str(k)} for k in range(3)],
+            "outputs": [{"name": "result", "identifier": "result", "type": "geom"}],
+            "position": [rnd.uniform(0, 1000), rnd.uniform(0, 1000)],
+        } for j in range(operations)]}]}
+        workflows.append({"id": i, "title": "Workflow " + str(i), "description": None,
+                          "executions": rnd.randint(0, 100), "created": created,
+                          "updated": created, "content": content})
+    return workflows
+
+
+def generateObservations(size, seed=0):
+    # Columnar SOS observations, numpy arrays are converted by DRF first
+    rng = np.random.default_rng(seed)
+    return {"timestamps": np.arange(size, dtype=np.int64) * 60000,
+            "sensors": ["sensor_" + str(i % 8) for i in range(size)],
+            "values": rng.normal(20, 5, size)}
+
+
+class Command(BaseCommand):
+    help = "Benchmark JSON rendering and compression of the largest API payloads"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--layers", type=int, default=20000)
+        parser.add_argument("--features", type=int, default=100000)
+        parser.add_argument("--workflows", type=int, default=500)
+        parser.add_argument("--observations", type=int, default=500000)
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def timed(self, function, repeat):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = function()
+            elapsed = (time.perf_counter() - start) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        return result, best
+
+    def handle(self, *args, **options):
+        payloads = [
+            ("capabilities", generateCatalog(options["layers"])),
+            ("geojson", generateLayer(options["features"])),
+            ("workflows", generateWorkflows(options["workflows"])),
+            ("observations", generateObservations(options["observations"])),
+        ]
+        repeat = options["repeat"]
+        drf, fast = JSONRenderer(), ORJSONRenderer()
+
+        self.stdout.write(
+            f"{'payload':>14}{'size (MB)':>12}{'drf (ms)':>12}{'orjson (ms)':>14}{'speedup':>10}")
+        rendered = []
+        for name, data in payloads:
+            if name == "observations":
+                # DRF's encoder only handles arrays through tolist()
+                body, legacy = self.timed(lambda: drf.render(
+                    {key: value.tolist() if hasattr(value, "tolist") else value for key, value in data.items()}), repeat)
+            else:
+                body, legacy = self.timed(lambda: drf.render(data), repeat)
+            body, current = self.timed(lambda: fast.render(data), repeat)
+            rendered.append((name, body))
+            self.stdout.write(f"{name:>14}{len(body) / 1024 ** 2:>12.1f}{legacy:>12.1f}"
+                              f"{current:>14.1f}{legacy / current:>9.1f}x")
+
+        self.stdout.write("")
+        self.stdout.write(f"{'payload':>14}{'encoding':>10}{'ratio':>8}{'time (ms)':>12}")
+        for name, body in rendered:
+            for encoding in ENCODINGS:
+                def compress():
+                    compressor = COMPRESSORS[encoding]()
+                    return compressor.compress(body) + compressor.finish()
+                compressed, elapsed = self.timed(compress, repeat)
+                self.stdout.write(f"{name:>14}{encoding:>10}{len(body) / len(compressed):>8.1f}"
+                                  f"{elapsed:>12.1f}")
@@ -0,0 +1,70 @@
+import copy
+import json
+import random
+import time
+from django.core.management.base import BaseCommand
+from osgeo import ogr, osr
+from utils.transform import TransformService
+
+
+def legacyTransform(geojson, fromSRID, toSRID):
+    # Per feature OGR round-trip used before TransformService, kept here for
+    # comparison only
+    source = osr.SpatialReference()
+    source.ImportFromEPSG(int(fromSRID))
+    source.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    target = osr.SpatialReference()
+    target.ImportFromEPSG(int(toSRID))
+    target.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    transform = osr.CoordinateTransformation(source, target)
+    for feature in geojson["features"]:
+        geometry = ogr.CreateGeometryFromJson(
+            json.dumps(feature.get("geometry")))
+        geometry.Transform(transform)
+        feature['geometry'] = json.loads(geometry.ExportToJson())
+    return geojson
+
+
+def generateLayer(size, seed=0):
+    # Mix of points and small polygons in lon/lat
+    rnd = random.Random(seed)
+    features = []
+    for i in range(size):
+        x, y = rnd.uniform(-170, 170), rnd.uniform(-80, 80)
+        if i % 2:
+            geometry = {"type": "Point", "coordinates": [x, y]}
+        else:
+            ring = [[x, y], [x + 0.1, y], [x + 0.1, y + 0.1],
+                    [x, y + 0.1], [x, y]]
+            geometry = {"type": "Polygon", "coordinates": [ring]}
+        features.append({"type": "Feature", "properties": {
+                        "id": i}, "geometry": geometry})
+    return {"type": "FeatureCollection", "features": features}
+
+
+class Command(BaseCommand):
+    help = "Benchmark GeoJSON reprojection of TransformService against the per feature OGR round-trip"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="1000,10000,100000")
+        parser.add_argument("--from-srid", type=int, default=4326)
+        parser.add_argument("--to-srid", type=int, default=3857)
+
+    def handle(self, *args, **options):
+        fromSRID, toSRID = options["from_srid"], options["to_srid"]
+        self.stdout.write(
+            f"{'features':>10}{'legacy (ms)':>14}{'service (ms)':>14}{'speedup':>10}")
+        for size in [int(size) for size in options["sizes"].split(",")]:
+            layer = generateLayer(size)
+            legacyLayer = copy.deepcopy(layer)
+
+            start = time.perf_counter()
+            legacyTransform(legacyLayer, fromSRID, toSRID)
+            legacy = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            TransformService.transformGeoJSON(layer, fromSRID, toSRID)
+            service = (time.perf_counter() - start) * 1000
+
+            self.stdout.write(
+                f"{size:>10}{legacy:>14.1f}{service:>14.1f}{legacy / service:>9.1f}x")
@@ -0,0 +1,19 @@
+# Generated by Django 5.0 on 2026-10-18 10:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("services", "0015_execution_content_execution_user"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="task",
+            name="fingerprint",
+            field=models.CharField(
+                blank=True, db_index=True, max_length=64, null=True
+            ),
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.0 on 2026-10-18 12:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("services", "0016_task_fingerprint"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ObservationSeries",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("url", models.CharField(max_length=255)),
+                ("offering", models.CharField(blank=True, default="", max_length=255)),
+                ("procedure", models.CharField(blank=True, default="", max_length=255)),
+                (
+                    "featureOfInterest",
+                    models.CharField(blank=True, default="", max_length=255),
+                ),
+                (
+                    "observedProperty",
+                    models.CharField(blank=True, default="", max_length=255),
+                ),
+                ("begin", models.BigIntegerField(null=True)),
+                ("latest", models.BigIntegerField(null=True)),
+                ("updated", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "db_table": "db_observation_series",
+                "unique_together": {
+                    (
+                        "url",
+                        "offering",
+                        "procedure",
+                        "featureOfInterest",
+                        "observedProperty",
+                    )
+                },
+            },
+        ),
+        migrations.CreateModel(
+            name="Observation",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("timestamp", models.BigIntegerField()),
+                ("sensor", models.CharField(blank=True, default="", max_length=255)),
+                ("value", models.CharField(max_length=64)),
+                (
+                    "series",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="observations",
+                        to="services.observationseries",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "db_observation",
+                "unique_together": {("series", "timestamp", "sensor")},
+            },
+        ),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 5.0 on 2026-10-18 14:12
+
+import django.contrib.gis.db.models.fields
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("services", "0017_observationseries_observation"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TileLayer",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=255)),
+                ("url", models.TextField(blank=True, null=True)),
+                ("srid", models.IntegerField(null=True)),
+                ("status", models.CharField(default="PENDING", max_length=100)),
+                ("message", models.TextField(blank=True, null=True)),
+                ("features", models.IntegerField(default=0)),
+                ("version", models.IntegerField(default=0)),
+                ("loaded", models.DateTimeField(null=True)),
+                ("created", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "task",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="services.task",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "db_tile_layer",
+                "ordering": ["-created"],
+            },
+        ),
+        migrations.CreateModel(
+            name="TileFeature",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "geometry",
+                    django.contrib.gis.db.models.fields.GeometryField(srid=3857),
+                ),
+                ("properties", models.JSONField(null=True)),
+                (
+                    "layer",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="tileFeatures",
+                        to="services.tilelayer",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "db_tile_feature",
+            },
+        ),
+    ]
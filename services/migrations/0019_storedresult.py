@@ -0,0 +1,46 @@
+# Generated by Django 5.0 on 2026-10-18 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("services", "0018_tilelayer_tilefeature"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StoredResult",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=100, unique=True)),
+                ("size", models.BigIntegerField(default=0)),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                (
+                    "executions",
+                    models.ManyToManyField(
+                        blank=True,
+                        related_name="storedResults",
+                        to="services.execution",
+                    ),
+                ),
+                (
+                    "tasks",
+                    models.ManyToManyField(
+                        blank=True, related_name="storedResults", to="services.task"
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "db_stored_result",
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0 on 2026-10-18 18:05
+
+import uuid
+from django.db import migrations, models
+
+
+def generateKeys(apps, schema_editor):
+    Execution = apps.get_model("services", "Execution")
+    for execution in Execution.objects.filter(key__isnull=True).only("pk"):
+        execution.key = uuid.uuid4()
+        execution.save(update_fields=["key"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("services", "0019_storedresult"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="execution",
+            name="key",
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.RunPython(generateKeys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="execution",
+            name="key",
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0 on 2026-10-18 18:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("services", "0020_execution_key"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="observationseries",
+            name="fetchingUntil",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
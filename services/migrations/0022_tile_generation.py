@@ -0,0 +1,22 @@
+# Generated by Django 5.0 on 2026-10-18 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("services", "0021_observationseries_fetchinguntil"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tilelayer",
+            name="generation",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="tilefeature",
+            name="generation",
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -1,3 +1,6 @@
+import uuid
+from django.contrib.gis.db.models import GeometryField
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.utils import timezone
 
@@ -50,7 +53,19 @@ class Workflow(models.Model):
 
 
 class Execution(models.Model):
+    PENDING = "PENDING"
+    RUNNING = "RUNNING"
+    SUCCESS = "SUCCESS"
+    FAILED = "FAILED"
+    # Task status of an operation whose output was taken from an earlier run
+    REUSED = "REUSED"
+
+    # Id of the execution in URLs, unguessable so that executions without
+    # a user are only readable by whoever submitted them
+    key = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
     workflow = models.ForeignKey(Workflow, on_delete=models.CASCADE, null=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True)
+    content = models.JSONField(null=True)
     status = models.CharField(max_length=100, blank=False, null=False)
     result = models.JSONField(null=True)
     created = models.DateTimeField(auto_now_add=True)
@@ -60,6 +75,20 @@ class Execution(models.Model):
         db_table = 'db_execution'
         ordering = ['-created']
 
+    @staticmethod
+    def findVisible(key, userID):
+        """
+        Execution with key, None when there is none or it belongs to another
+        user. Used by the REST API and the WebSocket consumer alike.
+        """
+        try:
+            execution = Execution.objects.filter(key=key).first()
+        except ValidationError:
+            return None
+        if execution is None or (execution.user_id and execution.user_id != userID):
+            return None
+        return execution
+
 
 class Task(models.Model):
     name = models.CharField(max_length=255, blank=False, null=False)
@@ -75,7 +104,93 @@ class Task(models.Model):
     started = models.DateTimeField(auto_now_add=True)
     completed = models.DateTimeField(auto_now=True)
     status = models.CharField(max_length=100, blank=False, null=True)
+    fingerprint = models.CharField(
+        max_length=64, blank=True, null=True, db_index=True)
 
     class Meta:
         db_table = 'db_task'
         ordering = ['-started']
+
+
+class ObservationSeries(models.Model):
+    url = models.CharField(max_length=255, blank=False, null=False)
+    offering = models.CharField(max_length=255, blank=True, default="")
+    procedure = models.CharField(max_length=255, blank=True, default="")
+    featureOfInterest = models.CharField(
+        max_length=255, blank=True, default="")
+    observedProperty = models.CharField(
+        max_length=255, blank=True, default="")
+    # Epoch seconds of the earliest requested time and the latest stored
+    # observation, everything in between is stored locally
+    begin = models.BigIntegerField(null=True)
+    latest = models.BigIntegerField(null=True)
+    updated = models.DateTimeField(auto_now=True)
+    # Set while a request fetches missing observations upstream, so
+    # concurrent requests do not fetch the same range twice
+    fetchingUntil = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'db_observation_series'
+        unique_together = [
+            ('url', 'offering', 'procedure', 'featureOfInterest', 'observedProperty')]
+
+
+class Observation(models.Model):
+    series = models.ForeignKey(
+        ObservationSeries, on_delete=models.CASCADE, related_name='observations')
+    timestamp = models.BigIntegerField()
+    sensor = models.CharField(max_length=255, blank=True, default="")
+    value = models.CharField(max_length=64)
+
+    class Meta:
+        db_table = 'db_observation'
+        # Also the index of the range queries of a series
+        unique_together = [('series', 'timestamp', 'sensor')]
+
+
+class TileLayer(models.Model):
+    name = models.CharField(max_length=255, blank=False, null=False)
+    # Source of the features, a GeoJSON url or the output of an operation
+    url = models.TextField(blank=True, null=True)
+    srid = models.IntegerField(null=True)
+    task = models.ForeignKey(Task, on_delete=models.SET_NULL, null=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True)
+    status = models.CharField(max_length=100, default="PENDING")
+    message = models.TextField(blank=True, null=True)
+    features = models.IntegerField(default=0)
+    # Part of every cached tile key, bumping it invalidates all tiles
+    version = models.IntegerField(default=0)
+    # Features of this generation are served, a reload stores the next one
+    # next to it and switches over once it is complete
+    generation = models.IntegerField(default=0)
+    loaded = models.DateTimeField(null=True)
+    created = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'db_tile_layer'
+        ordering = ['-created']
+
+
+class TileFeature(models.Model):
+    layer = models.ForeignKey(
+        TileLayer, on_delete=models.CASCADE, related_name='tileFeatures')
+    geometry = GeometryField(srid=3857)
+    properties = models.JSONField(null=True)
+    generation = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'db_tile_feature'
+
+
+class StoredResult(models.Model):
+    # Key of the file in the ResultStore, the SHA-256 of its content
+    key = models.CharField(max_length=100, unique=True)
+    size = models.BigIntegerField(default=0)
+    # A result is referenced as long as one of these rows exists
+    tasks = models.ManyToManyField(Task, related_name='storedResults', blank=True)
+    executions = models.ManyToManyField(
+        Execution, related_name='storedResults', blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'db_stored_result'
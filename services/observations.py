@@ -0,0 +1,146 @@
+import datetime
+import re
+import time
+from urllib.parse import parse_qs, unquote, urlsplit
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from services.models import Observation, ObservationSeries
+from utils import Util
+
+EVENT_TIME = re.compile(r"(eventTime=)([^&]*)", re.IGNORECASE)
+SERIES_PARAMETERS = ("offering", "procedure",
+                     "featureOfInterest", "observedProperty")
+
+
+class ObservationStore:
+    """
+    Local copy of SOS observation series. A GetObservation request only
+    fetches what is not stored yet, the observations from the latest stored
+    one onwards and anything before the earliest time requested so far, and
+    is then answered from the indexed timestamp column.
+    """
+
+    @staticmethod
+    def isStorable(url):
+        return ObservationStore.eventRange(url) is not None
+
+    @staticmethod
+    def eventRange(url):
+        """Begin and end epoch of the eventTime range of url, None without a valid range."""
+        match = EVENT_TIME.search(url)
+        if match is None:
+            return None
+        values = unquote(match.group(2)).split("/")
+        if len(values) < 2:
+            return None
+        try:
+            return ObservationStore.epoch(values[0]), ObservationStore.epoch(values[1])
+        except ValueError:
+            return None
+
+    @staticmethod
+    def epoch(value):
+        # Same local time interpretation as the parsed observations
+        naive = np.array([value.strip()[:19]], dtype="datetime64[s]")
+        return int(Util.localEpochs(naive.astype(np.int64))[0])
+
+    @staticmethod
+    def eventTime(epoch):
+        return datetime.datetime.fromtimestamp(epoch).strftime('%Y-%m-%dT%H:%M:%S')
+
+    @staticmethod
+    def missingRanges(begin, end, storedBegin, latest):
+        """Ranges to fetch to answer [begin, end] when [storedBegin, latest] is stored."""
+        if latest is None or storedBegin is None:
+            return [(begin, end)]
+        # The stored range only ever grows, so it stays without gaps
+        ranges = []
+        if begin < storedBegin:
+            ranges.append((begin, storedBegin))
+        if end > latest:
+            ranges.append((latest, end))
+        return ranges
+
+    @staticmethod
+    def observations(url):
+        """
+        Timestamps, sensors and values of the eventTime range of url, None
+        when nothing is stored and the upstream server did not answer, and
+        whether another request is still fetching part of the range. Such a
+        request is waited for SOS_FETCH_WAIT seconds at most, then what is
+        stored so far is returned.
+        """
+        begin, end = ObservationStore.eventRange(url)
+        query = parse_qs(urlsplit(url).query)
+        key = {name: query.get(name, [""])[0] for name in SERIES_PARAMETERS}
+        series, _ = ObservationSeries.objects.get_or_create(
+            url=url.split("?")[0], **key)
+        failed = False
+        fetching = False
+        deadline = time.time() + settings.SOS_FETCH_WAIT
+        while True:
+            series.refresh_from_db()
+            if not ObservationStore.missingRanges(begin, end, series.begin, series.latest):
+                break
+            # Concurrent requests for the same series wait for the one that
+            # holds the lease instead of fetching the same range twice
+            if ObservationStore.lease(series):
+                try:
+                    failed = not ObservationStore.update(series, url, begin, end)
+                finally:
+                    ObservationSeries.objects.filter(
+                        pk=series.pk).update(fetchingUntil=None)
+                break
+            if time.time() > deadline:
+                fetching = True
+                break
+            time.sleep(0.5)
+        if failed and series.latest is None:
+            return None, fetching
+
+        rows = list(Observation.objects.filter(series=series, timestamp__gte=begin, timestamp__lte=end).order_by(
+            "timestamp").values_list("timestamp", "sensor", "value"))
+        if not rows:
+            return (np.empty(0, dtype=np.int64), np.empty(0, dtype=str), np.empty(0, dtype=str)), fetching
+        timestamps, sensors, values = zip(*rows)
+        return (np.array(timestamps, dtype=np.int64), np.array(sensors), np.array(values)), fetching
+
+    @staticmethod
+    def lease(series):
+        now = timezone.now()
+        return ObservationSeries.objects.filter(
+            Q(fetchingUntil__isnull=True) | Q(fetchingUntil__lt=now), pk=series.pk
+        ).update(fetchingUntil=now + datetime.timedelta(seconds=settings.SOS_FETCH_LEASE)) == 1
+
+    @staticmethod
+    def update(series, url, begin, end):
+        """
+        Fetches the missing ranges outside of any transaction, then stores
+        every range in a short one. False when a range could not be fetched.
+        """
+        fetchedAll = True
+        for start, stop in ObservationStore.missingRanges(begin, end, series.begin, series.latest):
+            fetched = Util.fetchSweValues(EVENT_TIME.sub(
+                lambda match: match.group(1) + ObservationStore.eventTime(start) + "/" + ObservationStore.eventTime(stop), url, count=1))
+            if fetched is None:
+                # Served from what is stored, retried with the next request
+                fetchedAll = False
+                continue
+            timestamps, sensors, values = fetched
+            with transaction.atomic():
+                Observation.objects.bulk_create([
+                    Observation(series=series, timestamp=timestamp,
+                                sensor=sensor, value=value)
+                    for timestamp, sensor, value in zip(timestamps.tolist(), sensors.tolist(), values.tolist())
+                ], batch_size=5000, ignore_conflicts=True)
+                if len(timestamps):
+                    series.latest = max(series.latest or 0, int(timestamps.max()))
+                if start == begin and series.latest is not None:
+                    series.begin = begin if series.begin is None else min(
+                        series.begin, begin)
+                ObservationSeries.objects.filter(pk=series.pk).update(
+                    begin=series.begin, latest=series.latest, updated=timezone.now())
+        return fetchedAll
@@ -0,0 +1,98 @@
+import io
+from abc import ABC, abstractmethod
+import geopandas
+import numpy as np
+import pyarrow
+import pyarrow.ipc
+import shapely
+from core.renderers import ORJSONRenderer
+from rest_framework.renderers import BaseRenderer
+from rest_framework.settings import api_settings
+
+
+def featureFrame(data, precision=None):
+    """GeoDataFrame of a GeoJSON FeatureCollection, coordinates rounded to precision digits."""
+    crs = "EPSG:4326"
+    name = (data.get("crs") or {}).get("properties", {}).get("name")
+    if name:
+        crs = "EPSG:" + name.split(":")[-1]
+    frame = geopandas.GeoDataFrame.from_features(data["features"], crs=crs)
+    if precision is not None:
+        geometries = shapely.transform(np.asarray(
+            frame.geometry), lambda coords: np.round(coords, precision))
+        frame = frame.set_geometry(geopandas.GeoSeries(
+            geometries, index=frame.index, crs=crs))
+    return frame
+
+
+class VectorRenderer(BaseRenderer, ABC):
+    """
+    Binary encodings of FeatureCollections, selected with ?format= or the
+    Accept header. ?precision=<digits> rounds the coordinates and
+    ?bbox=true adds a bounding box index. Anything that is not a
+    FeatureCollection, such as error messages, is rendered as JSON.
+    """
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        renderer_context = renderer_context or {}
+        if not isinstance(data, dict) or data.get("type") != "FeatureCollection":
+            response = renderer_context.get("response")
+            if response is not None:
+                response["Content-Type"] = "application/json"
+            return ORJSONRenderer().render(data, "application/json", renderer_context)
+
+        request = renderer_context.get("request")
+        params = request.query_params if request is not None else {}
+        try:
+            precision = int(params["precision"])
+        except (KeyError, ValueError):
+            precision = None
+        bbox = params.get("bbox", "").lower() in ("1", "true", "yes")
+        buffer = io.BytesIO()
+        self.write(featureFrame(data, precision), buffer, bbox)
+        return buffer.getvalue()
+
+    @abstractmethod
+    def write(self, frame, buffer, bbox):
+        """Writes the encoded GeoDataFrame to buffer."""
+
+
+class FlatGeobufRenderer(VectorRenderer):
+    media_type = "application/flatgeobuf"
+    format = "fgb"
+
+    def write(self, frame, buffer, bbox):
+        # The packed Hilbert R-tree of FlatGeobuf is the bounding box index
+        frame.to_file(buffer, driver="FlatGeobuf", layer="features", engine="pyogrio",
+                      layer_options={"SPATIAL_INDEX": "YES" if bbox else "NO"})
+
+
+class GeoParquetRenderer(VectorRenderer):
+    media_type = "application/vnd.apache.parquet"
+    format = "parquet"
+
+    def write(self, frame, buffer, bbox):
+        frame.to_parquet(buffer, write_covering_bbox=bbox)
+
+
+class GeoArrowRenderer(VectorRenderer):
+    media_type = "application/vnd.apache.arrow.stream"
+    format = "arrow"
+
+    def write(self, frame, buffer, bbox):
+        table = pyarrow.table(frame.to_arrow(geometry_encoding="geoarrow"))
+        if bbox:
+            bounds = frame.geometry.bounds
+            table = table.append_column("bbox", pyarrow.StructArray.from_arrays(
+                [pyarrow.array(bounds[column].to_numpy())
+                 for column in ("minx", "miny", "maxx", "maxy")],
+                names=["xmin", "ymin", "xmax", "ymax"]))
+        with pyarrow.ipc.new_stream(buffer, table.schema) as writer:
+            writer.write_table(table)
+
+
+# GeoJSON stays the default, the binary formats are only used on request
+VECTOR_RENDERERS = list(api_settings.DEFAULT_RENDERER_CLASSES) + \
+    [FlatGeobufRenderer, GeoParquetRenderer, GeoArrowRenderer]
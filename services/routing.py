@@ -0,0 +1,6 @@
+from django.urls import path
+from services.consumers import ExecutionConsumer
+
+websocket_urlpatterns = [
+    path("ws/executions/<uuid:pk>/", ExecutionConsumer.as_asgi()),
+]
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from services.models import Server, Workflow, Execution, User, Task, UserServers
+from services.models import Server, Workflow, Execution, User, Task, UserServers, TileLayer
 
 
 class WpsCapabilitySerializer(serializers.Serializer):
@@ -36,6 +36,7 @@ class ServerCapabilitiesSerializer(serializers.Serializer):
 class SosObservationsSerializer(serializers.Serializer):
     success = serializers.BooleanField()
     observations = serializers.JSONField()
+    fetching = serializers.BooleanField(default=False)
 
 
 class GeoJsonSerializer(serializers.Serializer):
@@ -56,6 +57,27 @@ class ExecutionSerializer(serializers.Serializer):
     worklfow = serializers.JSONField()
 
 
+class TaskSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Task
+        fields = ('id', 'name', 'uuid', 'description',
+                  'status', 'outputs', 'started', 'completed')
+
+
+class ExecutionStatusSerializer(serializers.ModelSerializer):
+    id = serializers.UUIDField(source='key', read_only=True)
+    tasks = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Execution
+        fields = ('id', 'workflow', 'status', 'result',
+                  'created', 'updated', 'tasks')
+
+    def get_tasks(self, execution):
+        tasks = Task.objects.filter(execution=execution).order_by('started')
+        return TaskSerializer(tasks, many=True).data
+
+
 class WorkflowSerializer(serializers.ModelSerializer):
     class Meta:
         model = Workflow
@@ -63,3 +85,23 @@ class WorkflowSerializer(serializers.ModelSerializer):
                   'executions', 'created', 'updated', 'content')
         extra_kwargs = {'user': {'write_only': True,
                                  'required': False}, 'id': {'read_only': True}}
+
+
+class TileLayerSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TileLayer
+        fields = ('id', 'name', 'url', 'srid', 'task', 'status', 'message',
+                  'features', 'version', 'loaded', 'created')
+        read_only_fields = ('status', 'message', 'features',
+                            'version', 'loaded', 'created')
+
+    def validate(self, attrs):
+        if not attrs.get('url') and not attrs.get('task'):
+            raise serializers.ValidationError(
+                "Either url or task is required")
+        # Outputs of anonymous executions are only reachable by their
+        # execution key, a layer is made from the caller's own tasks only
+        task = attrs.get('task')
+        if task is not None and task.user != self.context['request'].user:
+            raise serializers.ValidationError({"task": "Task not found"})
+        return attrs
@@ -0,0 +1,27 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from services.models import Server
+from utils.capabilities import CapabilitiesCache
+
+
+@receiver(pre_save, sender=Server)
+def rememberServerUrl(sender, instance, **kwargs):
+    # The documents of the old url must be dropped as well when it changes
+    instance.previousUrl = None
+    if instance.pk is not None:
+        instance.previousUrl = Server.objects.filter(
+            pk=instance.pk).values_list("url", flat=True).first()
+
+
+@receiver(post_save, sender=Server)
+def invalidateServerCapabilities(sender, instance, **kwargs):
+    cache = CapabilitiesCache.default()
+    cache.invalidate(instance.url)
+    previousUrl = getattr(instance, "previousUrl", None)
+    if previousUrl and previousUrl != instance.url:
+        cache.invalidate(previousUrl)
+
+
+@receiver(post_delete, sender=Server)
+def invalidateDeletedServerCapabilities(sender, instance, **kwargs):
+    CapabilitiesCache.default().invalidate(instance.url)
@@ -0,0 +1,56 @@
+from django.db.models import Q
+from services.models import StoredResult
+from utils.store import ResultStore
+
+
+class ResultReferences:
+    """
+    Reference counts of ResultStore files. A stored result is referenced
+    by every task and execution whose outputs contain its URL, and is not
+    evicted while any of them exists.
+    """
+
+    @staticmethod
+    def keys(value, store):
+        if isinstance(value, dict):
+            for item in value.values():
+                yield from ResultReferences.keys(item, store)
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                yield from ResultReferences.keys(item, store)
+        else:
+            key = store.keyOf(value)
+            if key is not None:
+                yield key
+
+    @staticmethod
+    def record(value, task=None, execution=None):
+        store = ResultStore.default()
+        for key in set(ResultReferences.keys(value, store)):
+            stat = store.stat(key)
+            result, _ = StoredResult.objects.get_or_create(
+                key=key, defaults={"size": stat["size"] if stat else 0})
+            if task is not None:
+                result.tasks.add(task)
+            if execution is not None:
+                result.executions.add(execution)
+
+    @staticmethod
+    def referenced():
+        return set(StoredResult.objects.filter(
+            Q(tasks__isnull=False) | Q(executions__isnull=False)).values_list("key", flat=True))
+
+    @staticmethod
+    def count(key):
+        result = StoredResult.objects.filter(key=key).first()
+        if result is None:
+            return 0
+        return result.tasks.count() + result.executions.count()
+
+    @staticmethod
+    def stat(key):
+        """ResultStore.stat of key with its reference count."""
+        stat = ResultStore.default().stat(key)
+        if stat is not None:
+            stat["references"] = ResultReferences.count(key)
+        return stat
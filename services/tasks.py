@@ -0,0 +1,209 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from asgiref.sync import async_to_sync
+from celery import shared_task
+from channels.layers import get_channel_layer
+from django.conf import settings
+from services.consumers import executionGroup
+from services.models import Execution, Task, TileLayer
+from services.store import ResultReferences
+from services.tiles import TileStore
+from utils import Util
+from utils.executor import ExecutionListener
+from utils.geoserver import GeoServerClient, GeoServerCredentials
+from utils.graph import WorkflowGraph
+
+logger = logging.getLogger(__name__)
+
+
+def publishEvent(execution, payload):
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    payload["execution"] = str(execution.key)
+    try:
+        async_to_sync(layer.group_send)(
+            executionGroup(execution.key), {"type": "execution.event", "payload": payload})
+    except Exception:
+        # Progress notifications must never fail the execution itself
+        logger.exception("Could not publish event for execution %s", execution.pk)
+
+
+class TaskRecorder(ExecutionListener):
+    """
+    Writes the status, timing and outputs of every operation to Task rows
+    and publishes them to the WebSocket group of the execution.
+    """
+
+    def __init__(self, execution, fingerprints=None):
+        self.execution = execution
+        self.fingerprints = fingerprints if fingerprints is not None else {}
+        self.tasks = {}
+
+    def createTask(self, id, operation, status, outputs=None):
+        task = Task.objects.create(
+            name=operation["metadata"].get("label", ""),
+            uuid=str(id),
+            description=operation["metadata"].get("longname"),
+            execution=self.execution,
+            workflow=self.execution.workflow,
+            user=self.execution.user,
+            status=status,
+            outputs=outputs,
+            fingerprint=self.fingerprints.get(str(id))
+        )
+        self.tasks[str(id)] = task
+        return task
+
+    def operationStarted(self, id, operation):
+        task = self.createTask(id, operation, Execution.RUNNING)
+        self.publish("operation.started", task)
+
+    def operationReused(self, id, operation, output):
+        task = self.createTask(id, operation, Execution.REUSED, output)
+        ResultReferences.record(output, task=task)
+        self.publish("operation.reused", task,
+                     type=operation["outputs"][0]["type"], output=output)
+
+    def operationFinished(self, id, operation, output):
+        task = self.tasks[str(id)]
+        task.status = Execution.SUCCESS
+        task.outputs = output
+        task.save()
+        ResultReferences.record(output, task=task)
+        self.publish("operation.finished", task,
+                     type=operation["outputs"][0]["type"], output=output)
+
+    def operationFailed(self, id, operation, error):
+        task = self.tasks[str(id)]
+        task.status = Execution.FAILED
+        task.outputs = {"message": str(error)}
+        task.save()
+        self.publish("operation.failed", task, message=str(error))
+
+    def publish(self, event, task, **extra):
+        payload = {
+            "event": event,
+            "operation": task.uuid,
+            "task": task.id,
+            "name": task.name,
+            "status": task.status,
+            "started": task.started.isoformat(),
+            "completed": task.completed.isoformat(),
+        }
+        payload.update(extra)
+        publishEvent(self.execution, payload)
+
+
+def setStatus(execution, status, result=None):
+    execution.status = status
+    execution.result = result
+    execution.save()
+    ResultReferences.record(result, execution=execution)
+    publishEvent(execution, {
+        "event": "execution.status",
+        "status": status,
+        "result": result
+    })
+
+
+def getReusableOutputs(execution, fingerprints):
+    """
+    Outputs of the last successful execution of the same stored workflow
+    for every operation whose fingerprint did not change since.
+    """
+    if execution.workflow is None:
+        return {}
+    previous = Execution.objects.filter(workflow=execution.workflow, status=Execution.SUCCESS).exclude(
+        pk=execution.pk).order_by("-created").first()
+    if previous is None:
+        return {}
+    tasks = Task.objects.filter(execution=previous, status__in=[
+                                Execution.SUCCESS, Execution.REUSED], fingerprint__in=fingerprints.values())
+    stored = {task.fingerprint: task.outputs for task in tasks}
+    return {key: stored[fingerprint] for key, fingerprint in fingerprints.items() if fingerprint in stored}
+
+
+@shared_task
+def runExecution(executionID, maxWorkers=None, incremental=True):
+    execution = Execution.objects.get(pk=executionID)
+    setStatus(execution, Execution.RUNNING)
+    try:
+        fingerprints = WorkflowGraph(execution.content).fingerprints()
+        reuse = getReusableOutputs(
+            execution, fingerprints) if incremental else {}
+        outputs = Util.executeWorkflow(
+            execution.content, maxWorkers, TaskRecorder(execution, fingerprints), reuse)
+    except Exception as e:
+        setStatus(execution, Execution.FAILED, {"message": str(e)})
+        return execution.status
+
+    setStatus(execution, Execution.SUCCESS,
+              Util.formatWorkflowResults(outputs))
+    return execution.status
+
+
+@shared_task
+def loadTileLayer(layerID):
+    layer = TileLayer.objects.get(pk=layerID)
+    layer.status = Execution.RUNNING
+    layer.save()
+    try:
+        TileStore.load(layer)
+    except Exception as e:
+        logger.exception("Could not load tile layer %s", layerID)
+        layer.status = Execution.FAILED
+        layer.message = str(e)
+        layer.save()
+    return layer.status
+
+
+@shared_task
+def publishRasters(executionID, passwordToken=None):
+    """
+    Publishes the rasters of a batch to one GeoServer workspace, every
+    raster is recorded as a task of the execution. The password is read
+    once from GeoServerCredentials.
+    """
+    password = GeoServerCredentials.pop(passwordToken)
+    execution = Execution.objects.get(pk=executionID)
+    setStatus(execution, Execution.RUNNING)
+    content = execution.content
+    client = GeoServerClient(content["host"], content.get("username"), password)
+    try:
+        client.ensureWorkspace(content["workspace"])
+    except Exception as e:
+        setStatus(execution, Execution.FAILED, {"message": str(e)})
+        return execution.status
+
+    recorder = TaskRecorder(execution)
+    operations = {}
+    for i, raster in enumerate(content["rasters"]):
+        operations[str(i)] = {
+            "metadata": {"label": "GeoServer", "longname": "Publish " + raster["url"]},
+            "outputs": [{"type": "layer"}]
+        }
+        recorder.operationStarted(str(i), operations[str(i)])
+
+    results = []
+    failed = False
+    with ThreadPoolExecutor(settings.GEOSERVER_PUBLISH_WORKERS) as executor:
+        futures = {executor.submit(Util.publishRasterFile, client, content["workspace"],
+                                   raster["url"], raster.get("classification")): str(i)
+                   for i, raster in enumerate(content["rasters"])}
+        # Task rows are written from this thread only
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                output = future.result()
+            except Exception as e:
+                logger.exception("Could not publish %s", content["rasters"][int(key)]["url"])
+                recorder.operationFailed(key, operations[key], e)
+                failed = True
+                continue
+            recorder.operationFinished(key, operations[key], output)
+            results.append({"id": key, "result": output, "type": "layer"})
+
+    setStatus(execution, Execution.FAILED if failed else Execution.SUCCESS,
+              sorted(results, key=lambda result: int(result["id"])))
+    return execution.status
@@ -1,3 +1,519 @@
-from django.test import TestCase
+import base64
+import gzip
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import Future
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import rasterio
+import rasterio.transform
+import requests
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from core.middleware import CompressionMiddleware
+from services.observations import ObservationStore
+from utils.cache import ResultCache
+from utils.cog import CogConverter
+from utils.exceptions import CycleError, JobFailed
+from utils.executor import Deferred, WorkflowExecutor
+from utils.graph import WorkflowGraph
+from utils.jobs import JobPoller
+from utils.raster import IntegrityError, RasterFetcher
+from utils.store import ResultStore
+from utils import classification, timeseries
+
+
+def operation(id, *values):
+    return {"id": id, "metadata": {"label": "op" + str(id)},
+            "inputs": [{"identifier": "in", "value": value} for value in values],
+            "outputs": [{"identifier": "out", "type": "geom"}]}
+
+
+class WorkflowGraphTests(SimpleTestCase):
+    def testLevels(self):
+        # 1 -> 2 -> 4 and 1 -> 3 -> 4, 5 is independent
+        graph = WorkflowGraph({
+            "operations": [operation(4, "2_to_in", "3_to_in"), operation(2, "1_to_in"),
+                           operation(3), operation(1), operation(5)],
+            "connections": [{"fromOperationID": 1, "toOperationID": 3}]
+        })
+        levels = graph.levels()
+        self.assertEqual([sorted(level) for level in levels], [["1", "5"], ["2", "3"], ["4"]])
+        self.assertEqual(graph.order()[-1], 4)
+
+    def testDuplicateAndUnknownEdges(self):
+        graph = WorkflowGraph({
+            "operations": [operation(1), operation(2, "1_to_in", "9_to_in")],
+            "connections": [{"fromOperationID": 1, "toOperationID": 2}]
+        })
+        self.assertEqual(graph.upstream["2"], {"1"})
+        self.assertEqual(graph.downstream["1"], ["2"])
+
+    def testFindCycle(self):
+        # 1 -> 2 -> 3 -> 2, 4 depends on the cycle
+        graph = WorkflowGraph({
+            "operations": [operation(1), operation(2, "1_to_in", "3_to_in"),
+                           operation(3, "2_to_in"), operation(4, "3_to_in")]
+        })
+        with self.assertRaises(CycleError) as context:
+            graph.levels()
+        cycle = context.exception.cycle
+        self.assertEqual(cycle[0], cycle[-1])
+        self.assertEqual(sorted(cycle[:-1]), [2, 3])
+
+    def testSelfLoop(self):
+        graph = WorkflowGraph({"operations": [operation(1, "1_to_in")]})
+        with self.assertRaises(CycleError) as context:
+            graph.levels()
+        self.assertEqual(context.exception.cycle, [1, 1])
+
+
+@override_settings(WORKFLOW_MAX_WORKERS=1, WORKFLOW_MAX_WORKERS_LIMIT=4)
+class WorkflowExecutorTests(SimpleTestCase):
+    def testDeferredOutputsReleaseThePool(self):
+        # With a single pool thread the second operation only runs while
+        # the first one waits for its remote job
+        job = Future()
+        executed = []
+
+        def execute(operation):
+            executed.append(operation["id"])
+            if operation["id"] == 1:
+                return Deferred(job, lambda result: result + "!")
+            if operation["id"] == 2:
+                threading.Timer(0.05, job.set_result, ["done"]).start()
+            return "direct"
+
+        workflow = {"operations": [operation(1), operation(2), operation(3, "1_to_in")]}
+        result = WorkflowExecutor(workflow, WorkflowGraph(workflow), execute).run()
+        self.assertEqual({item["id"]: item["data"] for item in result},
+                         {1: "done!", 2: "direct", 3: "direct"})
+        self.assertEqual(executed[-1], 3)
+
+    def testFailedDeferredFailsTheWorkflow(self):
+        job = Future()
+        job.set_exception(JobFailed("http://example.org/jobs/1", "HTTP 404"))
+        workflow = {"operations": [operation(1)]}
+        executor = WorkflowExecutor(workflow, WorkflowGraph(workflow), lambda operation: Deferred(job))
+        with self.assertRaises(JobFailed):
+            executor.run()
+
+    def testResultsInOperationOrder(self):
+        workflow = {"operations": [operation(3, "1_to_in"), operation(1), operation(2, "3_to_in")]}
+        result = WorkflowExecutor(workflow, WorkflowGraph(workflow), lambda operation: operation["id"]).run()
+        self.assertEqual([item["id"] for item in result], [3, 1, 2])
+
+    def testMaxWorkers(self):
+        self.assertEqual(WorkflowExecutor.resolveMaxWorkers({}), 1)
+        self.assertEqual(WorkflowExecutor.resolveMaxWorkers({"metadata": {"maxWorkers": "3"}}), 3)
+        self.assertEqual(WorkflowExecutor.resolveMaxWorkers({}, "100"), 4)
+        for value in ("abc", "0", -2):
+            with self.assertRaises(ValueError):
+                WorkflowExecutor.resolveMaxWorkers({}, value)
+
+
+class TimeseriesTests(SimpleTestCase):
+    def testLttbKeepsEndsAndPeaks(self):
+        x = np.arange(100, dtype=float)
+        y = np.zeros(100)
+        y[37] = 10
+        indices = timeseries.lttb(x, y, 10)
+        self.assertEqual(len(indices), 10)
+        self.assertEqual((indices[0], indices[-1]), (0, 99))
+        self.assertIn(37, indices)
+        self.assertTrue(np.all(np.diff(indices) > 0))
+        self.assertEqual(len(timeseries.lttb(x, y, 200)), 100)
+
+    def testMinmax(self):
+        x = np.arange(8)
+        y = np.array([3, 1, 2, 5, 9, 7, 8, 0], dtype=float)
+        # Two buckets: 0-3 and 4-7
+        self.assertEqual(timeseries.minmax(x, y, 4).tolist(), [1, 3, 4, 7])
+
+    def testMeanPerDay(self):
+        day = 24 * 3600 * 1000
+        x = np.array([0, 1000, day + 5, 3 * day])
+        y = np.array([1, 3, np.nan, 4], dtype=float)
+        starts, means = timeseries.mean(x, y, "day")
+        self.assertEqual(starts.tolist(), [0, 3 * day])
+        self.assertEqual(means.tolist(), [2, 4])
+
+    def testDownsampleSkipsMissingValues(self):
+        x = np.arange(50)
+        y = np.arange(50, dtype=float)
+        y[::7] = np.nan
+        keptX, keptY = timeseries.downsample(x[::-1], y[::-1], "lttb", 5)
+        self.assertEqual(len(keptX), 5)
+        self.assertFalse(np.isnan(keptY).any())
+        self.assertTrue(np.all(np.diff(keptX) > 0))
+
+    def testDownsampleGroups(self):
+        x = np.tile(np.arange(20), 2)
+        groups = np.repeat(["a", "b"], 20)
+        y = np.concatenate((np.zeros(20), np.ones(20)))
+        keptX, keptGroups, keptY = timeseries.downsampleGroups(x, groups, y, "minmax", 4)
+        self.assertEqual(keptGroups.tolist().count("a"), len(keptX) // 2)
+        self.assertTrue(np.all(keptY[keptGroups == "b"] == 1))
+        with self.assertRaises(ValueError):
+            timeseries.downsampleGroups(x, groups, y, "median")
+
+
+class ObservationStoreTests(SimpleTestCase):
+    def testMissingRanges(self):
+        self.assertEqual(ObservationStore.missingRanges(10, 20, None, None), [(10, 20)])
+        self.assertEqual(ObservationStore.missingRanges(10, 20, 5, 30), [])
+        self.assertEqual(ObservationStore.missingRanges(0, 40, 5, 30), [(0, 5), (30, 40)])
+        self.assertEqual(ObservationStore.missingRanges(12, 40, 5, 30), [(30, 40)])
+        # No gap between a later range and what is stored
+        self.assertEqual(ObservationStore.missingRanges(50, 60, 5, 30), [(30, 60)])
+
+    def testEventRange(self):
+        url = "http://example.org/sos?service=SOS&eventTime=%s&offering=x"
+        begin, end = ObservationStore.eventRange(url % "2020-01-01T00:00:00/2020-01-02T00:00:00")
+        self.assertEqual(end - begin, 24 * 3600)
+        self.assertEqual(ObservationStore.eventRange(url % "2020-01-01T00%3A00%3A00%2F2020-01-02T00%3A00%3A00"),
+                         (begin, end))
+        self.assertIsNone(ObservationStore.eventRange(url % "2020-01-01T00:00:00"))
+        self.assertIsNone(ObservationStore.eventRange(url % "yesterday/today"))
+
+
+class ClassificationTests(SimpleTestCase):
+    def testJenksSeparatesClusters(self):
+        values = np.array([1, 2, 3, 10, 11, 12, 30, 31], dtype=float)
+        self.assertEqual(classification.jenks(values, 3).tolist(), [1, 10, 30, 31])
+        # Fewer values than classes
+        self.assertEqual(classification.jenks(np.array([5.0, 1.0]), 4).tolist(), [1, 5, 5])
+
+    def testQuantileAndEqual(self):
+        values = np.arange(101, dtype=float)
+        self.assertEqual(classification.quantile(values, 4).tolist(), [0, 25, 50, 75, 100])
+        self.assertEqual(classification.equal(np.array([2.0, 4.0, 10.0]), 4).tolist(), [2, 4, 6, 8, 10])
+
+    def testBreaks(self):
+        data = np.arange(100, dtype=np.float32).reshape(10, 10)
+        data[0, 0] = -9999
+        data[0, 1] = np.nan
+        with rasterio.io.MemoryFile() as memory:
+            with memory.open(driver="GTiff", width=10, height=10, count=1,
+                             dtype="float32", nodata=-9999, crs="EPSG:4326",
+                             transform=rasterio.transform.from_origin(0, 10, 1, 1)) as ds:
+                ds.write(data, 1)
+            with memory.open() as ds:
+                for method in classification.METHODS:
+                    edges = classification.breaks(ds, method, 7, 1000, 1000)
+                    self.assertEqual((edges[0], edges[-1]), (2, 99))
+                    self.assertTrue(np.all(np.diff(edges) > 0))
+                with self.assertRaises(ValueError):
+                    classification.breaks(ds, "median", 7, 1000, 1000)
+
+
+class FakeResponse:
+    def __init__(self, status, body, headers=None, failAt=None):
+        self.status_code = status
+        self.body = body
+        self.headers = headers or {}
+        self.failAt = failAt
+
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self.body), 512):
+            if self.failAt is not None and start >= self.failAt:
+                raise requests.ConnectionError("reset")
+            yield self.body[start:start + 512]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class FakeServer:
+    """Serves one file, with or without range support, and records the requested ranges."""
+
+    def __init__(self, content, ranges=True, headers=None, sizeUnknown=False):
+        self.content = content
+        self.ranges = ranges
+        self.headers = headers or {}
+        self.sizeUnknown = sizeUnknown
+        self.requested = []
+        # Range start -> offset into the answer after which the connection drops
+        self.failures = {}
+
+    def get(self, url, stream=False, headers=None, timeout=None):
+        header = (headers or {}).get("Range")
+        self.requested.append(header)
+        if header is None or not self.ranges:
+            return FakeResponse(200, self.content, dict(self.headers, **{"Content-Length": str(len(self.content))}))
+        start, end = [int(value) for value in header[len("bytes="):].split("-")]
+        total = "*" if self.sizeUnknown else str(len(self.content))
+        return FakeResponse(206, self.content[start:end + 1], dict(
+            self.headers, **{"Content-Range": "bytes %d-%d/%s" % (start, end, total)}),
+            self.failures.pop(start, None))
+
+
+@override_settings(RASTER_DOWNLOAD_PART_SIZE=4096, RASTER_DOWNLOAD_WORKERS=1,
+                   RASTER_DOWNLOAD_RETRIES=1, HTTP_RETRY_BACKOFF=0)
+class RasterFetcherTests(SimpleTestCase):
+    content = bytes(range(256)) * 40
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.settings = override_settings(RASTER_DOWNLOAD_DIR=self.directory)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.directory)
+
+    def download(self, server, checksum=None):
+        with mock.patch("utils.raster.HttpClient.default", return_value=server):
+            return RasterFetcher.download("http://example.org/a.tif", checksum)
+
+    def testPartsResume(self):
+        server = FakeServer(self.content, headers={"ETag": '"v1"'})
+        # The second part drops after 1024 bytes and resumes from there
+        server.failures[4096] = 1024
+        path = self.download(server)
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertEqual(server.requested, ["bytes=0-0", "bytes=0-4095", "bytes=4096-8191",
+                                            "bytes=5120-8191", "bytes=8192-10239"])
+
+    def testFailedDownloadKeepsCompletedParts(self):
+        server = FakeServer(self.content, headers={"ETag": '"v1"'})
+        server.failures[8192] = 0
+        with override_settings(RASTER_DOWNLOAD_RETRIES=0):
+            with self.assertRaises(requests.ConnectionError):
+                self.download(server)
+        server.requested = []
+        self.download(server)
+        self.assertEqual(server.requested, ["bytes=0-0", "bytes=8192-10239"])
+        # A finished download is reused while the ETag is the same
+        server.requested = []
+        self.download(server)
+        self.assertEqual(server.requested, ["bytes=0-0"])
+
+    def testDigests(self):
+        digest = base64.b64encode(hashlib.sha256(self.content).digest()).decode()
+        self.download(FakeServer(self.content, headers={"Repr-Digest": "sha-256=:" + digest + ":"}))
+        with self.assertRaises(IntegrityError):
+            self.download(FakeServer(self.content + b"x", headers={"Repr-Digest": "sha-256=:" + digest + ":"}))
+        with self.assertRaises(IntegrityError):
+            self.download(FakeServer(self.content, ranges=False), "sha256:" + "00" * 32)
+        self.download(FakeServer(self.content, ranges=False),
+                      "sha256:" + hashlib.sha256(self.content).hexdigest())
+        self.assertEqual([name for name in os.listdir(self.directory) if name.endswith(".part")], [])
+
+    def testRangeWithoutSize(self):
+        server = FakeServer(self.content, sizeUnknown=True)
+        path = self.download(server)
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertEqual(server.requested, ["bytes=0-0", None])
+
+
+class ResultStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = ResultStore(self.directory, 250, "http://example.org/store")
+        # Nothing is referenced unless a test says so
+        patcher = mock.patch.object(ResultStore, "pinned", set)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def source(self, data):
+        path = os.path.join(self.directory, "source")
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def testPutDeduplicates(self):
+        key = self.store.put(b"a" * 100, ".tif")
+        self.assertEqual(key, hashlib.sha256(b"a" * 100).hexdigest() + ".tif")
+        source = self.source(b"a" * 100)
+        self.assertEqual(self.store.put(source, ".tif", move=True), key)
+        self.assertFalse(os.path.exists(source))
+        self.assertEqual(self.store.stats()["entries"], 1)
+        self.assertEqual(self.store.keyOf(self.store.url(key)), key)
+
+    def testPutLinks(self):
+        source = self.source(b"b" * 100)
+        key = self.store.put(source, ".tif", link=True)
+        self.assertTrue(os.path.exists(source))
+        self.assertEqual(os.stat(source).st_ino, os.stat(self.store.get(key)).st_ino)
+
+    def testEvictsLeastRecentlyUsed(self):
+        first = self.store.put(b"1" * 100)
+        second = self.store.put(b"2" * 100)
+        os.utime(self.store.path(first), (1, 1))
+        os.utime(self.store.path(second), (2, 2))
+        third = self.store.put(b"3" * 100)
+        self.assertIsNone(self.store.get(first))
+        self.assertIsNotNone(self.store.get(second))
+        self.assertIsNotNone(self.store.get(third))
+        self.assertEqual(self.store.stats()["size"], 200)
+
+    def testKeepsPinnedResults(self):
+        first = self.store.put(b"1" * 100)
+        second = self.store.put(b"2" * 100)
+        os.utime(self.store.path(first), (1, 1))
+        os.utime(self.store.path(second), (2, 2))
+        with mock.patch.object(ResultStore, "pinned", lambda: {first}):
+            self.store.put(b"3" * 100)
+        self.assertIsNotNone(self.store.get(first))
+        self.assertIsNone(self.store.get(second))
+
+    def testKeepsHeldResultsUntilReleased(self):
+        first = self.store.put(b"1" * 100, hold=True)
+        # Held again by a second caller that stores the same content
+        self.assertEqual(self.store.put(b"1" * 100, hold=True), first)
+        os.utime(self.store.path(first), (1, 1))
+        self.store.put(b"2" * 100)
+        self.store.put(b"3" * 100)
+        self.assertIsNotNone(self.store.get(first))
+        self.store.release(first)
+        self.store.put(b"4" * 100)
+        self.assertIsNotNone(self.store.get(first))
+        self.store.release(first)
+        os.utime(self.store.path(first), (1, 1))
+        self.store.put(b"5" * 100)
+        self.assertIsNone(self.store.get(first))
+
+    def testSizeIsSharedBetweenInstances(self):
+        other = ResultStore(self.directory, 250)
+        first = self.store.put(b"1" * 100)
+        os.utime(self.store.path(first), (1, 1))
+        other.put(b"2" * 100)
+        self.store.put(b"3" * 100)
+        self.assertIsNone(self.store.get(first))
+
+
+class ResultCacheTests(SimpleTestCase):
+    class Backend:
+        def __init__(self):
+            self.entries = {}
+
+        def get(self, key):
+            return key in self.entries, self.entries.get(key)
+
+        def set(self, key, value):
+            self.entries[key] = value
+
+    def testEvictedStoreResultIsAMiss(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        store = ResultStore(directory, 1000, "http://example.org/store")
+        cache = ResultCache(ResultCacheTests.Backend())
+        executed = []
+
+        def execute(operation):
+            executed.append(operation["id"])
+            return store.url(store.put(b"cog"))
+
+        with mock.patch.object(ResultStore, "default", return_value=store), \
+                mock.patch.object(ResultStore, "pinned", set):
+            url = cache.memoize(operation(1), execute)
+            self.assertEqual(cache.memoize(operation(1), execute), url)
+            os.remove(store.path(store.keyOf(url)))
+            self.assertEqual(cache.memoize(operation(1), execute), url)
+        self.assertEqual(executed, [1, 1])
+        self.assertIsNotNone(store.get(store.keyOf(url)))
+
+
+class JobPollerTests(SimpleTestCase):
+    def testSlowStatusDoesNotBlockOtherJobs(self):
+        release = threading.Event()
+        calls = []
+
+        def get(url, **kwargs):
+            calls.append(kwargs)
+            if url.endswith("slow"):
+                release.wait(5)
+            return FakeResponse(200, b"", {})
+
+        client = mock.Mock(get=get)
+        poller = JobPoller(0.01, 0.01, 1, 5, workers=2, requestTimeout=1)
+        with mock.patch("utils.jobs.HttpClient.default", return_value=client), \
+                mock.patch.object(FakeResponse, "json", lambda self: {"StatusInfo": {"Status": "Succeeded"}},
+                                  create=True), \
+                mock.patch.object(FakeResponse, "raise_for_status", lambda self: None, create=True):
+            slow = poller.submit("http://example.org/jobs/slow")
+            fast = poller.submit("http://example.org/jobs/fast")
+            self.assertEqual(fast.result(2), {"Status": "Succeeded"})
+            self.assertFalse(slow.done())
+            release.set()
+            self.assertEqual(slow.result(2), {"Status": "Succeeded"})
+        self.assertTrue(all(kwargs["retry"] is False and kwargs["timeout"][1] == 1 for kwargs in calls))
+
+
+class CompressionMiddlewareTests(SimpleTestCase):
+    body = b'{"token": "secret", "values": [' + b"1, " * 1000 + b'1]}'
+
+    def respond(self, response, accept="gzip, br"):
+        request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING=accept)
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def testJsonIsGzippedWithRandomPadding(self):
+        lengths = set()
+        for _ in range(10):
+            response = self.respond(HttpResponse(self.body, content_type="application/json"))
+            self.assertEqual(response["Content-Encoding"], "gzip")
+            self.assertEqual(gzip.decompress(response.content), self.body)
+            lengths.add(len(response.content))
+        self.assertGreater(len(lengths), 1)
+        streamed = self.respond(StreamingHttpResponse(
+            [self.body[:100], self.body[100:]], content_type="application/json"))
+        self.assertEqual(gzip.decompress(b"".join(streamed.streaming_content)), self.body)
+
+    def testJsonIsNotCompressedWithoutGzip(self):
+        response = self.respond(HttpResponse(self.body, content_type="application/json"), "br")
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    def testHtmlIsNotCompressed(self):
+        response = self.respond(HttpResponse(self.body, content_type="text/html; charset=utf-8"))
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    def testFeatureDataUsesAnyEncoding(self):
+        response = self.respond(HttpResponse(self.body, content_type="application/geo+json"), "gzip")
+        self.assertEqual(gzip.decompress(response.content), self.body)
+
+
+@override_settings(COG_BLOCK_SIZE=256, COG_WORKERS=1)
+class CogConverterTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.source = os.path.join(self.directory, "source.tif")
+        with rasterio.open(self.source, "w", driver="GTiff", width=1024, height=1024, count=1, dtype="uint8",
+                           crs="EPSG:4326", transform=rasterio.transform.from_origin(0, 10, 0.01, 0.01)) as ds:
+            ds.write(np.random.default_rng(0).integers(0, 255, (1024, 1024), dtype=np.uint8), 1)
+
+    def testConvert(self):
+        self.assertFalse(CogConverter.isOptimized(self.source))
+        target = CogConverter.convert(self.source, os.path.join(self.directory, "target.tif"))
+        self.assertTrue(CogConverter.isOptimized(target))
+
+    def testFailedConversion(self):
+        with self.assertRaises(RuntimeError):
+            CogConverter.convert(os.path.join(self.directory, "missing.tif"),
+                                 os.path.join(self.directory, "target.tif"))
+
+    def testTimeoutKillsTheConversion(self):
+        with override_settings(COG_TIMEOUT=0):
+            with self.assertRaises(TimeoutError):
+                CogConverter.convert(self.source, os.path.join(self.directory, "target.tif"))
+        self.assertEqual(sorted(os.listdir(self.directory)), ["source.tif"])
+        # The slot was given back
+        target = CogConverter.convert(self.source, os.path.join(self.directory, "target.tif"))
+        self.assertTrue(CogConverter.isOptimized(target))
@@ -0,0 +1,124 @@
+import copy
+import json
+import math
+from django.conf import settings
+from django.contrib.gis.geos import GEOSGeometry
+from django.core.cache import caches
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+from services.models import Execution, TileFeature, TileLayer
+from utils.http import HttpClient
+from utils.transform import TransformService
+from utils.xmlstream import responseStream
+
+# Width of the EPSG:3857 world in meters
+WORLD_SIZE = 2 * math.pi * 6378137
+# Name of the layer inside every tile, used as source-layer by clients
+TILE_LAYER_NAME = "features"
+
+TILE_QUERY = """
+WITH bounds AS (SELECT ST_TileEnvelope(%s, %s, %s) AS geom),
+tile AS (
+    SELECT ST_AsMVTGeom(ST_Simplify(feature.geometry, %s, true), bounds.geom, %s, %s, true) AS geom,
+           feature.properties
+    FROM db_tile_feature AS feature, bounds
+    WHERE feature.layer_id = %s AND feature.generation = %s
+      AND feature.geometry && ST_Expand(bounds.geom, %s)
+)
+SELECT ST_AsMVT(tile.*, %s, %s, 'geom') FROM tile WHERE tile.geom IS NOT NULL
+"""
+
+
+class TileStore:
+    """
+    Features of a TileLayer are fetched once, reprojected to EPSG:3857 and
+    stored in PostGIS. Tiles are clipped and simplified to the tile
+    resolution by ST_AsMVT and cached under the layer version.
+    """
+
+    @staticmethod
+    def featureBatches(layer, batchSize=2000):
+        if layer.task_id is not None:
+            data = copy.deepcopy(layer.task.outputs) or {}
+            srid = layer.srid
+            name = (data.get("crs") or {}).get("properties", {}).get("name")
+            if srid is None and name:
+                srid = name.split(":")[-1]
+            features = data.get("features", [])
+            for i in range(0, len(features), batchSize):
+                yield TransformService.transformFeatures(features[i:i + batchSize], srid or 3857, 3857)
+            return
+
+        response = HttpClient.default().get(layer.url, stream=True)
+        try:
+            if response.status_code > 200:
+                raise ValueError("Could not fetch " + layer.url +
+                                 ": HTTP " + str(response.status_code))
+            yield from TransformService.featureBatches(responseStream(response), 3857, layer.srid, batchSize)
+        finally:
+            response.close()
+
+    @staticmethod
+    def load(layer):
+        """
+        Stores the features as the next generation of the layer, one batch
+        per statement, and switches the layer over once all are stored.
+        Tiles are served from the previous generation in the meantime.
+        """
+        generation = layer.generation + 1
+        # Leftovers of a load that did not finish
+        TileFeature.objects.filter(
+            layer=layer, generation__gte=generation).delete()
+        count = 0
+        try:
+            for batch in TileStore.featureBatches(layer):
+                rows = [TileFeature(layer=layer, properties=feature.get("properties"), generation=generation,
+                                    geometry=GEOSGeometry(json.dumps(feature["geometry"]), srid=3857))
+                        for feature in batch if feature.get("geometry")]
+                TileFeature.objects.bulk_create(rows)
+                count += len(rows)
+        except Exception:
+            TileFeature.objects.filter(
+                layer=layer, generation=generation).delete()
+            raise
+        layer.features = count
+        layer.generation = generation
+        layer.version += 1
+        layer.loaded = timezone.now()
+        layer.status = Execution.SUCCESS
+        layer.message = None
+        layer.save()
+        TileFeature.objects.filter(
+            layer=layer, generation__lt=generation).delete()
+        return layer
+
+    @staticmethod
+    def invalidate(layer):
+        # Tiles of older versions are never read again and expire
+        TileLayer.objects.filter(pk=layer.pk).update(version=F("version") + 1)
+        layer.refresh_from_db(fields=["version"])
+        return layer
+
+    @staticmethod
+    def isValid(z, x, y):
+        return 0 <= z <= settings.TILE_MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+    @staticmethod
+    def tile(layer, z, x, y):
+        cache = caches[settings.TILE_CACHE]
+        key = "tile:%d:%d:%d:%d:%d" % (layer.pk, layer.version, z, x, y)
+        data = cache.get(key)
+        if data is not None:
+            return data
+        # Simplified to one unit of the tile grid, features within the
+        # buffer are included so lines and labels continue across tiles
+        resolution = WORLD_SIZE / 2 ** z / settings.TILE_EXTENT
+        buffer = resolution * settings.TILE_BUFFER
+        with connection.cursor() as cursor:
+            cursor.execute(TILE_QUERY, [z, x, y, resolution, settings.TILE_EXTENT, settings.TILE_BUFFER,
+                                        layer.pk, layer.generation, buffer, TILE_LAYER_NAME, settings.TILE_EXTENT])
+            row = cursor.fetchone()
+        data = bytes(row[0]) if row and row[0] is not None else b""
+        cache.set(key, data, settings.TILE_CACHE_TTL)
+        return data
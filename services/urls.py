@@ -1,9 +1,10 @@
+from django.urls import path
 from rest_framework import routers
 from services.viewsets import (
     WpsCapabilityViewSet,
     WfsCapabilityViewSet, WcsCapabilityViewSet, SosCapabilityViewSet, ServerViewSet,
     GeoJsonViewSet, SosObservationsViewSet, ExecutionViewSet, ServerCapabilitiesViewSet,
-    ProcessViewSet, WorkflowViewSet
+    ProcessViewSet, WorkflowViewSet, MetricsViewSet, TileLayerViewSet, TileViewSet
 )
 
 routes = routers.DefaultRouter()
@@ -20,7 +21,11 @@ routes.register("json", GeoJsonViewSet, "geojson")
 routes.register("workflow", ExecutionViewSet, "workflow")
 routes.register("models", WorkflowViewSet, "models")
 routes.register("process", ProcessViewSet, "process")
+routes.register("metrics", MetricsViewSet, "metrics")
+routes.register("tiles", TileLayerViewSet, "tiles")
 
 urlpatterns = [
+    path("tiles/<int:pk>/<int:z>/<int:x>/<int:y>.mvt",
+         TileViewSet.as_view({"get": "tile"}), name="tile"),
     *routes.urls,
 ]
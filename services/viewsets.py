@@ -1,20 +1,44 @@
 from rest_framework.viewsets import ModelViewSet, ViewSet
-import requests
 from rest_framework import status
 import json
+from urllib.parse import urlparse
 from rest_framework_simplejwt.tokens import RefreshToken, AccessToken
 from services.serializers import (
     WpsCapabilitySerializer, WfsCapabilitySerializer,
     WcsCapabilitySerializer, SosCapabilitySerializer, SosObservationsSerializer,
     ServerSerializer, GeoJsonSerializer, ExecutionSerializer, ServerCapabilitiesSerializer,
-    WorkflowSerializer 
+    WorkflowSerializer, ExecutionStatusSerializer, TileLayerSerializer
 )
 from rest_framework.decorators import action
-from rest_framework.permissions import BasePermission, IsAuthenticatedOrReadOnly, IsAuthenticated, SAFE_METHODS, IsAdminUser
+from rest_framework.permissions import AllowAny, BasePermission, IsAuthenticatedOrReadOnly, IsAuthenticated, SAFE_METHODS, IsAdminUser
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import threading
+import time
+from django.conf import settings
 from django.db import connection
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from rasterio.errors import RasterioIOError
 from rest_framework.response import Response
 from utils import Util
-from services.models import Server, Workflow, Execution, User, Task, UserServers
+from utils.cache import ResultCache
+from utils.capabilities import CapabilitiesCache
+from utils.exceptions import CycleError, WorkflowError
+from utils.geoserver import GeoServerCredentials
+from utils.executor import Deferred, WorkflowExecutor
+from utils.http import HttpClient
+from utils.raster import RasterFetcher
+from utils.store import ResultStore
+from utils.graph import WorkflowGraph
+from utils import classification, timeseries
+from utils.transform import TransformService
+from utils.xmlstream import responseStream
+from services.models import Server, Workflow, Execution, User, Task, UserServers, TileLayer
+from services.observations import ObservationStore
+from services.renderers import VECTOR_RENDERERS
+from services.tiles import TileStore
+from services.tasks import loadTileLayer, publishRasters, runExecution
 
 
 class ReadOnly(BasePermission):
@@ -33,7 +57,7 @@ class WpsCapabilityViewSet(ViewSet):
         identifier = request.GET.get("identifier")
         response = None
         if dtype == "ILWIS":
-            response = json.loads(requests.get(url).text)
+            response = json.loads(HttpClient.default().get(url).text)
         else:
             if identifier is not None:
                 response = Util.getWpsCapabilities(url, identifier)
@@ -51,7 +75,7 @@ class WpsCapabilityViewSet(ViewSet):
         dtype = request.POST.get("resource")
         identifier = request.POST.get("identifier")
         if dtype == "ILWIS":
-            response = json.loads(requests.get(url).text)
+            response = json.loads(HttpClient.default().get(url).text)
         elif dtype == "GeoServer":
             response = "Geoserver"
         else:
@@ -104,6 +128,20 @@ class WcsCapabilityViewSet(ViewSet):
         serializer = WcsCapabilitySerializer(instance=records, many=False)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'], name='Raster metadata')
+    def metadata(self, request):
+        # CRS, bounds and layout read from the header of a remote raster,
+        # without downloading it
+        url = request.GET.get("url")
+        # Anything but http(s) would let GDAL open local files or other
+        # virtual file systems
+        if not url or not Util.is_url(url) or urlparse(url).scheme.lower() not in ("http", "https"):
+            return Response({"message": "An http or https raster url is required"}, status=400)
+        try:
+            return Response(RasterFetcher.metadata(url))
+        except RasterioIOError as error:
+            return Response({"message": str(error)}, status=400)
+
 
 class SosCapabilityViewSet(ViewSet):
     permission_classes = [ReadOnly]
@@ -132,12 +170,30 @@ class SosObservationsViewSet(ViewSet):
 
     def list(self, request):
         url = request.GET.get("url")
-
-        response = Util.getSosObservations(url)
+        layout = request.GET.get("layout", "rows")
+        downsample = request.GET.get("downsample")
+        bucket = request.GET.get("bucket", "day")
+        try:
+            points = int(request.GET.get("points", 1000))
+            if downsample:
+                timeseries.validate(downsample, points, bucket)
+        except ValueError as e:
+            return Response({"message": str(e)}, status=400)
+
+        fetching = False
+        if url and ObservationStore.isStorable(url):
+            observations, fetching = ObservationStore.observations(url)
+            response = None if observations is None else Util.formatSosObservations(
+                *observations, layout, downsample, points, bucket)
+        else:
+            response = Util.getSosObservations(
+                url, layout, downsample, points, bucket)
         if response is None:
-            records = {"success": False, "observations": []}
+            records = {"success": False, "observations": [], "fetching": fetching}
         else:
-            records = {"success": True, "observations": response}
+            # fetching: part of the range is still being fetched by another
+            # request, asking again later returns more observations
+            records = {"success": True, "observations": response, "fetching": fetching}
 
         serializer = SosObservationsSerializer(instance=records, many=False)
         return Response(serializer.data)
@@ -178,6 +234,10 @@ class ServerCapabilitiesViewSet(ViewSet):
     http_method_names = ["get"]
 
     serializer_class = ServerCapabilitiesSerializer
+    # Shared by all requests, fetches that miss their deadline keep one of
+    # CAPABILITIES_MAX_WORKERS threads until their HTTP timeout at most
+    pool = None
+    lock = threading.Lock()
 
     def list(self, request):
         url = request.GET.get("url")
@@ -197,70 +257,100 @@ class ServerCapabilitiesViewSet(ViewSet):
 
             servers = [server]
 
-        results = []
-        for server in servers:
-            if server.is_process and server.type == "WPS":
-                response = Util.getWpsProcesses(server.url, limit,  "gs:")
-                if response:
-                    results.append(
-                        {
-                            "name": server.name,
-                            "records": response,
-                            "is_process": True,
-                            "type": "WPS",
-                            "url": server.url
-                        }
-                    )
-            elif server.type == "WCS":
-                response = Util.getWcsCapabilities(server.url, limit)
-                if response:
-                    results.append(
-                        {
-                            "name": server.name,
-                            "records": response,
-                            "is_process": False,
-                            "type": "WCS",
-                            "url": server.url
-                        }
-                    )
-            elif server.type == "WFS":
-                response = Util.getWfsCapabilities(server.url, limit)
-                if response:
-                    results.append(
-                        {
-                            "name": server.name,
-                            "records": response,
-                            "is_process": False,
-                            "type": "WFS",
-                            "url": server.url
-                        }
-                    )
-            elif server.type == "SOS":
-                response = Util.getSosCapabilities(server.url, 100)
-                if response:
-                    results.append(
-                        {
-                            "name": server.name,
-                            "records": response,
-                            "is_process": False,
-                            "type": "SOS",
-                            "url": server.url
-                        }
-                    )
-            elif server.type == "STAC":
-                response = Util.getStacCapabilities(server.url, limit)
-                if response:
-                    results.append(
-                        {
-                            "name": server.name,
-                            "records": response,
-                            "is_process": False,
-                            "type": "STAC",
-                            "url": server.url
-                        }
-                    )
         # serializer = ServerCapabilitiesSerializer(instance=results, many=True)
-        return Response(results)
+        return Response(self.fetchCapabilities(list(servers), limit))
+
+    @staticmethod
+    def executor():
+        with ServerCapabilitiesViewSet.lock:
+            if ServerCapabilitiesViewSet.pool is None:
+                ServerCapabilitiesViewSet.pool = ThreadPoolExecutor(
+                    max_workers=settings.CAPABILITIES_MAX_WORKERS, thread_name_prefix="capabilities-fetch")
+            return ServerCapabilitiesViewSet.pool
+
+    @staticmethod
+    def getRecords(server, limit):
+        if server.is_process and server.type == "WPS":
+            return Util.getWpsProcesses(server.url, limit,  "gs:")
+        elif server.type == "WCS":
+            return Util.getWcsCapabilities(server.url, limit)
+        elif server.type == "WFS":
+            return Util.getWfsCapabilities(server.url, limit)
+        elif server.type == "SOS":
+            return Util.getSosCapabilities(server.url, 100)
+        elif server.type == "STAC":
+            return Util.getStacCapabilities(server.url, limit)
+        return None
+
+    @staticmethod
+    def fetchCapabilities(servers, limit):
+        """
+        Fetches the capabilities of all servers concurrently. A server gets
+        CAPABILITIES_SERVER_TIMEOUT seconds from the moment its fetch starts,
+        the whole catalog CAPABILITIES_REQUEST_TIMEOUT seconds. Servers that
+        miss their deadline or fail are listed with an empty records list
+        and status "timeout" or "error".
+        """
+        if not servers:
+            return []
+        started = {}
+
+        def fetch(i):
+            started[i] = time.monotonic()
+            return ServerCapabilitiesViewSet.getRecords(servers[i], limit)
+
+        pool = ServerCapabilitiesViewSet.executor()
+        futures = {pool.submit(fetch, i): i for i in range(len(servers))}
+        requestDeadline = time.monotonic() + settings.CAPABILITIES_REQUEST_TIMEOUT
+        pending = set(futures)
+        expired = set()
+        while pending:
+            now = time.monotonic()
+            for future in list(pending):
+                i = futures[future]
+                if not future.done() and i in started and now - started[i] >= settings.CAPABILITIES_SERVER_TIMEOUT:
+                    pending.discard(future)
+                    expired.add(future)
+            if not pending or now >= requestDeadline:
+                break
+            deadlines = [requestDeadline] + [started[futures[future]] + settings.CAPABILITIES_SERVER_TIMEOUT
+                                             for future in pending if futures[future] in started]
+            # Queued fetches have no start time yet, wake up regularly to
+            # give them their own deadline once they start
+            timeout = min(deadlines) - now
+            if len(started) < len(servers):
+                timeout = min(timeout, 0.5)
+            done, pending = wait(
+                pending, timeout=max(timeout, 0), return_when=FIRST_COMPLETED)
+        expired.update(pending)
+        # Fetches that did not start yet never will, running ones are not
+        # waited for
+        for future in expired:
+            future.cancel()
+
+        results = []
+        for future, i in sorted(futures.items(), key=lambda item: item[1]):
+            server = servers[i]
+            result = {
+                "name": server.name,
+                "records": [],
+                "is_process": bool(server.is_process and server.type == "WPS"),
+                "type": server.type,
+                "url": server.url
+            }
+            if future in expired:
+                result["status"] = "timeout"
+            elif future.exception() is not None:
+                result["status"] = "error"
+                result["message"] = str(future.exception())
+            else:
+                response = future.result()
+                if not response:
+                    continue
+                result["status"] = "ok"
+                result["records"] = response
+            results.append(result)
+        return results
 
 
 class WorkflowViewSet(ModelViewSet):
@@ -287,6 +377,35 @@ class WorkflowViewSet(ModelViewSet):
         models_to_delete.delete()
         return Response({'count': deleted_count}, status=status.HTTP_200_OK)
 
+    @action(detail=True, methods=['post'], name='Run stored workflow')
+    def run(self, request, pk=None):
+        model = self.get_object()
+        content = model.content
+        if isinstance(content, dict) and "workflows" in content:
+            content = content["workflows"][0]
+        if not content:
+            return Response({"message": "Workflow has no content"}, status=400)
+        try:
+            WorkflowGraph(content).levels()
+            maxWorkers = WorkflowExecutor.resolveMaxWorkers(
+                content, request.data.get("maxWorkers"))
+        except CycleError as e:
+            return Response({"message": str(e), "cycle": e.cycle}, status=400)
+        except ValueError as e:
+            return Response({"message": str(e)}, status=400)
+
+        execution = Execution.objects.create(
+            workflow=model,
+            user=request.user,
+            content=content,
+            status=Execution.PENDING
+        )
+        # Only operations that changed since the last successful run, and
+        # everything downstream of them, are executed unless full=true
+        incremental = request.data.get("full") not in ("true", "True", "1", True)
+        runExecution.delay(execution.id, maxWorkers, incremental)
+        return Response({"id": execution.key, "status": execution.status}, status=202)
+
 
 class GeoJsonViewSet(ViewSet):
     http_method_names = ["get", "post"]
@@ -297,7 +416,7 @@ class GeoJsonViewSet(ViewSet):
     def list(self, request):
         return Response({})
 
-    @action(detail=False, methods=['get'], name='Transform vector data to target crs')
+    @action(detail=False, methods=['get'], name='Transform vector data to target crs', renderer_classes=VECTOR_RENDERERS)
     def transform(self, request, pk=None):
         url = request.GET.get("url")
         if url is None:
@@ -305,7 +424,10 @@ class GeoJsonViewSet(ViewSet):
         srid = request.GET.get("srid")
         if srid is None:
             return Response({"msg": "Target SRID is required"}, status=400)
-        response = requests.get(url)
+        mode = request.GET.get("stream")
+        if mode is not None:
+            return self.streamTransform(url, srid, request.GET.get("sourceSrid"), mode)
+        response = HttpClient.default().get(url)
         if response.text == "" or response.status_code > 200:
             return Response({"msg": "No data found"}, status=400)
         # transformed = response.json()
@@ -319,9 +441,33 @@ class GeoJsonViewSet(ViewSet):
         results = GeoJsonSerializer(transformed, many=False).data
         return Response(results)
 
+    def streamTransform(self, url, srid, sourceSrid, mode):
+        # Features are read, reprojected and written in batches, the layer
+        # is never held in memory as a whole
+        if mode not in ("geojson", "ndjson"):
+            return Response({"msg": "stream must be geojson or ndjson"}, status=400)
+        response = HttpClient.default().get(url, stream=True)
+        if response.status_code > 200:
+            response.close()
+            return Response({"msg": "No data found"}, status=400)
+        return StreamingHttpResponse(
+            GeoJsonViewSet.streamFeatures(
+                response, srid, sourceSrid, mode == "ndjson"),
+            content_type="application/x-ndjson" if mode == "ndjson" else "application/geo+json")
+
+    @staticmethod
+    def streamFeatures(response, srid, sourceSrid, ndjson):
+        try:
+            yield from TransformService.streamGeoJSON(responseStream(response), srid, sourceSrid, ndjson)
+        finally:
+            response.close()
+
 
 class ExecutionViewSet(ViewSet):
     http_method_names = ["get", "post"]
+    # Workflows may be submitted anonymously, executions are only found by
+    # their key and executions of a user only by that user
+    permission_classes = [AllowAny]
     serializer_class = ExecutionSerializer
 
     def list(self, request):
@@ -333,16 +479,106 @@ class ExecutionViewSet(ViewSet):
         if workflow:
             workflow = json.loads(workflow)['workflows'][0]
 
-        outputs = Util.executeWorkflow(workflow)
-        results = []
-        results = []
-        for output in outputs:
-            results.append({
-                "id": output["id"],
-                "result": output["data"],
-                "type": output["type"]
-            })
-        return Response(results, status=200)
+        try:
+            maxWorkers = WorkflowExecutor.resolveMaxWorkers(
+                workflow, request.POST.get("maxWorkers"))
+        except ValueError as e:
+            return Response({"message": str(e)}, status=400)
+        try:
+            outputs = Util.executeWorkflow(workflow, maxWorkers)
+        except CycleError as e:
+            return Response({"message": str(e), "cycle": e.cycle}, status=400)
+        except WorkflowError as e:
+            return Response({"message": str(e)}, status=502)
+        return Response(Util.formatWorkflowResults(outputs), status=200)
+
+    @action(detail=False, methods=['post'], name='Submit workflow')
+    def submit(self, request):
+        workflow = request.POST.get("workflow")
+        if not workflow:
+            return Response({"message": "Workflow required"}, status=400)
+        workflow = json.loads(workflow)['workflows'][0]
+        try:
+            WorkflowGraph(workflow).levels()
+            maxWorkers = WorkflowExecutor.resolveMaxWorkers(
+                workflow, request.POST.get("maxWorkers"))
+        except CycleError as e:
+            return Response({"message": str(e), "cycle": e.cycle}, status=400)
+        except ValueError as e:
+            return Response({"message": str(e)}, status=400)
+
+        user = request.user if request.user.is_authenticated else None
+        model = None
+        if user and request.POST.get("model"):
+            model = Workflow.objects.filter(
+                pk=request.POST.get("model"), user=user).first()
+        execution = Execution.objects.create(
+            workflow=model,
+            user=user,
+            content=workflow,
+            status=Execution.PENDING
+        )
+        runExecution.delay(execution.id, maxWorkers)
+        return Response({"id": execution.key, "status": execution.status}, status=202)
+
+    @action(detail=False, methods=['post'], name='Publish rasters')
+    def publish(self, request):
+        # Rasters are published to GeoServer in the background, progress is
+        # tracked like a submitted workflow with one task per raster
+        rasters = request.data.get("rasters")
+        if isinstance(rasters, str):
+            try:
+                rasters = json.loads(rasters)
+            except json.JSONDecodeError:
+                rasters = None
+        if not isinstance(rasters, list) or not rasters:
+            return Response({"message": "A list of rasters is required"}, status=400)
+        rasters = [{"url": raster} if isinstance(raster, str) else raster for raster in rasters]
+        if not all(isinstance(raster, dict) and raster.get("url") for raster in rasters):
+            return Response({"message": "Every raster requires a url"}, status=400)
+        try:
+            for raster in rasters:
+                if raster.get("classification"):
+                    classification.validate(raster["classification"])
+        except ValueError as e:
+            return Response({"message": str(e)}, status=400)
+        host = request.data.get("host")
+        if not host:
+            return Response({"message": "GeoServer host required"}, status=400)
+
+        # The password is handed to the task through the credentials cache,
+        # it is neither stored with the execution nor sent to the broker
+        execution = Execution.objects.create(
+            user=request.user if request.user.is_authenticated else None,
+            content={
+                "host": host,
+                "workspace": request.data.get("workspace") or "maris_mamase",
+                "username": request.data.get("username"),
+                "rasters": rasters
+            },
+            status=Execution.PENDING
+        )
+        publishRasters.delay(execution.id, GeoServerCredentials.put(request.data.get("password")))
+        return Response({"id": execution.key, "status": execution.status}, status=202)
+
+    def retrieve(self, request, pk=None):
+        execution = Execution.findVisible(pk, request.user.id)
+        if execution is None:
+            return Response({"message": "Execution not found"}, status=404)
+        serializer = ExecutionStatusSerializer(instance=execution)
+        return Response(serializer.data)
+
+    @action(detail=True, methods=['get'], url_path=r'outputs/(?P<operation>[^/.]+)',
+            name='Output of an operation', renderer_classes=VECTOR_RENDERERS)
+    def output(self, request, pk=None, operation=None):
+        execution = Execution.findVisible(pk, request.user.id)
+        if execution is None:
+            return Response({"message": "Execution not found"}, status=404)
+        task = Task.objects.filter(
+            execution=execution, uuid=operation).order_by("-started").first()
+        if task is None or task.status not in (Execution.SUCCESS, Execution.REUSED):
+            return Response({"message": "Output not found"}, status=404)
+        return Response(task.outputs)
 
     @action(detail=False, methods=['post'], name='Download workflow')
     def download(self, request):
@@ -371,7 +607,7 @@ class ExecutionViewSet(ViewSet):
             return Response({"message": "Workflow required"}, status=500)
 
         if url:
-            req = requests.get(url)
+            req = HttpClient.default().get(url)
             if req.status_code > 200:
                 return Response({"message": "UR: not found"}, status=404)
             workflow = req.text
@@ -389,6 +625,19 @@ class ExecutionViewSet(ViewSet):
             return Response(workflowJSON, status=200)
 
 
+class MetricsViewSet(ViewSet):
+    http_method_names = ["get"]
+    permission_classes = [IsAdminUser]
+
+    def list(self, request):
+        return Response({
+            "results": ResultCache.default().stats(),
+            "capabilities": CapabilitiesCache.default().stats(),
+            "store": ResultStore.default().stats(),
+            "http": HttpClient.default().stats()
+        })
+
+
 class ProcessViewSet(ViewSet):
     http_method_names = ["get", "post"]
     serializer_class = ExecutionSerializer
@@ -403,6 +652,67 @@ class ProcessViewSet(ViewSet):
         except json.JSONDecodeError:
             process = None
         if process:
-            return Response(Util.executeOperation(process), status=200)
+            try:
+                return Response(Deferred.resolve(Util.executeOperation(process)), status=200)
+            except WorkflowError as e:
+                return Response({"message": str(e)}, status=502)
         else:
             return Response({"message": "Process required"}, status=500)
+
+
+class TileLayerViewSet(ModelViewSet):
+    """
+    Layers served as Mapbox vector tiles. Creating or reloading a layer
+    loads its features in the background, tiles are served from
+    tiles/<id>/<z>/<x>/<y>.mvt.
+    """
+    http_method_names = ["get", "post", "delete"]
+    permission_classes = [IsAuthenticated]
+    serializer_class = TileLayerSerializer
+
+    def get_queryset(self):
+        return TileLayer.objects.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        layer = serializer.save(user=self.request.user)
+        loadTileLayer.delay(layer.id)
+
+    @action(detail=True, methods=['post'], name='Fetch the features again')
+    def reload(self, request, pk=None):
+        layer = self.get_object()
+        layer.status = Execution.PENDING
+        layer.save()
+        loadTileLayer.delay(layer.id)
+        return Response(TileLayerSerializer(layer).data, status=202)
+
+    @action(detail=True, methods=['post'], name='Drop the cached tiles')
+    def invalidate(self, request, pk=None):
+        layer = TileStore.invalidate(self.get_object())
+        return Response(TileLayerSerializer(layer).data)
+
+
+class TileViewSet(ViewSet):
+    permission_classes = []
+
+    def tile(self, request, pk=None, z=None, x=None, y=None):
+        layer = get_object_or_404(TileLayer, pk=pk)
+        if layer.user and layer.user != request.user:
+            return Response({"message": "Layer not found"}, status=404)
+        if not TileStore.isValid(z, x, y):
+            return Response({"message": "Tile out of range"}, status=400)
+        # The url does not change when the layer is reloaded, clients
+        # revalidate every tile and get a 304 while the version is the same
+        etag = '"%d-%d-%d-%d-%d"' % (layer.pk, layer.version, z, x, y)
+        cacheControl = ("private" if layer.user else "public") + ", no-cache"
+        # Weak comparison, CompressionMiddleware sends the tag as W/"..."
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            data = TileStore.tile(layer, z, x, y)
+            if not data:
+                response = HttpResponse(status=204)
+            else:
+                response = HttpResponse(
+                    data, content_type="application/vnd.mapbox-vector-tile")
+        response["Cache-Control"] = cacheControl
+        response["ETag"] = etag
+        return response
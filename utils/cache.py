@@ -0,0 +1,264 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import redis
+from django.conf import settings
+from utils.executor import Deferred
+from utils.store import ResultStore
+
+
+def canonicalHash(value):
+    """SHA-256 of the canonical (sorted, compact) JSON form of value."""
+    data = json.dumps(value, sort_keys=True,
+                      separators=(",", ":"), default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class FileSystemBackend:
+    """
+    One JSON file per entry. The modification time doubles as the last
+    access time, entries are evicted least recently used first once the
+    directory grows beyond maxSize bytes.
+    """
+
+    def __init__(self, directory, ttl, maxSize):
+        self.directory = directory
+        self.ttl = ttl
+        self.maxSize = maxSize
+        self.size = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.count(hit=False)
+            return False, None
+        if time.time() - entry["created"] > self.ttl:
+            self.delete(path)
+            self.count(hit=False)
+            return False, None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.count(hit=True)
+        return True, entry["value"]
+
+    def set(self, key, value):
+        path = self.path(key)
+        data = json.dumps({"created": time.time(), "value": value})
+        temp = path + "." + str(threading.get_ident()) + ".tmp"
+        with open(temp, "w") as f:
+            f.write(data)
+        os.replace(temp, path)
+        with self.lock:
+            if self.size is not None:
+                self.size += len(data)
+            if self.size is None or self.size > self.maxSize:
+                self.evict()
+
+    def delete(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def entries(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".json"):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self):
+        entries = self.entries()
+        self.size = sum(size for _, size, _ in entries)
+        if self.size <= self.maxSize:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            if self.size <= self.maxSize:
+                break
+            self.delete(path)
+            self.size -= size
+
+    def count(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        entries = self.entries()
+        return {
+            "backend": "filesystem",
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(entries),
+            "size": sum(size for _, size, _ in entries),
+            "maxSize": self.maxSize
+        }
+
+
+class RedisBackend:
+    """
+    Values expire through Redis TTLs. A sorted set keeps the last access
+    time of every entry and a hash its size, so the least recently used
+    entries can be evicted once the total size exceeds maxSize.
+    """
+
+    def __init__(self, url, ttl, maxSize, prefix="results:"):
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.maxSize = maxSize
+        self.prefix = prefix
+
+    def key(self, name):
+        return self.prefix + name
+
+    def get(self, key):
+        data = self.client.get(self.key("entry:" + key))
+        if data is None:
+            self.forget(key)
+            self.client.hincrby(self.key("stats"), "misses", 1)
+            return False, None
+        self.client.zadd(self.key("lru"), {key: time.time()})
+        self.client.hincrby(self.key("stats"), "hits", 1)
+        return True, json.loads(data)
+
+    def set(self, key, value):
+        data = json.dumps(value)
+        pipe = self.client.pipeline()
+        pipe.set(self.key("entry:" + key), data, ex=self.ttl)
+        pipe.zadd(self.key("lru"), {key: time.time()})
+        pipe.hget(self.key("sizes"), key)
+        pipe.hset(self.key("sizes"), key, len(data))
+        previous = pipe.execute()[2]
+        size = self.client.incrby(
+            self.key("size"), len(data) - int(previous or 0))
+        while size > self.maxSize:
+            oldest = self.client.zpopmin(self.key("lru"))
+            if not oldest:
+                break
+            name = oldest[0][0].decode()
+            self.client.delete(self.key("entry:" + name))
+            size = self.forget(name)
+
+    def forget(self, key):
+        # Drop the bookkeeping of an entry that expired or was evicted
+        size = self.client.hget(self.key("sizes"), key)
+        self.client.zrem(self.key("lru"), key)
+        if size is None:
+            return int(self.client.get(self.key("size")) or 0)
+        self.client.hdel(self.key("sizes"), key)
+        return self.client.decrby(self.key("size"), int(size))
+
+    def stats(self):
+        counters = self.client.hgetall(self.key("stats"))
+        return {
+            "backend": "redis",
+            "hits": int(counters.get(b"hits", 0)),
+            "misses": int(counters.get(b"misses", 0)),
+            "entries": self.client.zcard(self.key("lru")),
+            "size": int(self.client.get(self.key("size")) or 0),
+            "maxSize": self.maxSize
+        }
+
+
+class ResultCache:
+    """
+    Memoizes operation results by a hash of resource type, server url,
+    process label and the resolved input values.
+    """
+    instance = None
+    lock = threading.Lock()
+
+    def __init__(self, backend, exclude=(), excludeResources=()):
+        self.backend = backend
+        self.exclude = set(exclude)
+        self.excludeResources = set(excludeResources)
+
+    @staticmethod
+    def default():
+        with ResultCache.lock:
+            if ResultCache.instance is None:
+                if settings.RESULT_CACHE_BACKEND == "redis":
+                    backend = RedisBackend(
+                        settings.RESULT_CACHE_URL, settings.RESULT_CACHE_TTL, settings.RESULT_CACHE_MAX_SIZE)
+                elif settings.RESULT_CACHE_BACKEND == "filesystem":
+                    backend = FileSystemBackend(
+                        settings.RESULT_CACHE_DIR, settings.RESULT_CACHE_TTL, settings.RESULT_CACHE_MAX_SIZE)
+                else:
+                    backend = None
+                ResultCache.instance = ResultCache(
+                    backend, settings.RESULT_CACHE_EXCLUDE, settings.RESULT_CACHE_EXCLUDE_RESOURCES)
+            return ResultCache.instance
+
+    @staticmethod
+    def key(operation):
+        metadata = operation["metadata"]
+        return canonicalHash({
+            "resource": metadata.get("resource"),
+            "url": metadata.get("url"),
+            "label": metadata.get("label"),
+            "inputs": [[input.get("identifier"), input.get("type"), input.get("url"), input.get("value")]
+                       for input in operation["inputs"]],
+            "outputs": [[output.get("identifier"), output.get("type")]
+                        for output in operation["outputs"]]
+        })
+
+    def isCacheable(self, operation):
+        metadata = operation["metadata"]
+        if self.backend is None or metadata.get("cache") is False:
+            return False
+        return metadata.get("resource") not in self.excludeResources and metadata.get("label") not in self.exclude
+
+    def memoize(self, operation, execute):
+        if not self.isCacheable(operation):
+            return execute(operation)
+        key = ResultCache.key(operation)
+        found, output = self.backend.get(key)
+        if found and ResultCache.isAvailable(output):
+            return output
+        output = execute(operation)
+        if isinstance(output, Deferred):
+            return output.map(lambda value: self.store(key, value))
+        return self.store(key, output)
+
+    @staticmethod
+    def isAvailable(output):
+        # A ResultStore URL outlives its file once the store evicts it, the
+        # operation is executed again then
+        store = ResultStore.default()
+        key = store.keyOf(output)
+        return key is None or store.stat(key) is not None
+
+    def store(self, key, output):
+        if output not in (None, "", [], "Failed"):
+            self.backend.set(key, output)
+        return output
+
+    def stats(self):
+        if self.backend is None:
+            return {"backend": None}
+        stats = self.backend.stats()
+        total = stats["hits"] + stats["misses"]
+        stats["hitRatio"] = stats["hits"] / total if total else None
+        return stats
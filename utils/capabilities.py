@@ -0,0 +1,153 @@
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.cache import caches
+from utils.http import HttpClient
+
+logger = logging.getLogger(__name__)
+
+
+def baseUrl(url):
+    """Server url without query string, shared by all documents of a server."""
+    return url.split("?")[0].rstrip("/")
+
+
+class CapabilitiesCache:
+    """
+    Parsed GetCapabilities/DescribeProcess documents in the Django cache.
+    Entries younger than freshTtl are served as is, older ones up to maxStale
+    are served while a background thread revalidates them with the stored
+    ETag/Last-Modified. Every key contains a version number per server url
+    that is bumped to invalidate everything cached for that server.
+    """
+    instance = None
+    lock = threading.Lock()
+
+    def __init__(self, cache, freshTtl, maxStale, workers=2):
+        self.cache = cache
+        self.freshTtl = freshTtl
+        self.maxStale = maxStale
+        self.workers = workers
+        self.pool = None
+        self.refreshing = set()
+        self.refreshLock = threading.Lock()
+
+    @staticmethod
+    def default():
+        with CapabilitiesCache.lock:
+            if CapabilitiesCache.instance is None:
+                CapabilitiesCache.instance = CapabilitiesCache(
+                    caches[settings.CAPABILITIES_CACHE], settings.CAPABILITIES_CACHE_TTL,
+                    settings.CAPABILITIES_CACHE_MAX_STALE)
+            return CapabilitiesCache.instance
+
+    @staticmethod
+    def hash(value):
+        return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+    def versionKey(self, url):
+        return "capabilities:version:" + CapabilitiesCache.hash(baseUrl(url))
+
+    def key(self, url, requestUrl, variant):
+        version = self.cache.get(self.versionKey(url), 0)
+        return "capabilities:entry:" + CapabilitiesCache.hash(
+            str(version) + "|" + requestUrl + "|" + str(variant))
+
+    def invalidate(self, url):
+        # Old entries are never read again and expire by themselves
+        self.cache.set(self.versionKey(url), time.time_ns(), None)
+
+    def fetch(self, url, requestUrl, parse, variant=None, stream=False, ttl=None):
+        """
+        Parsed document behind requestUrl. parse receives the response and
+        returns the parsed value, None results (failed requests) are not
+        cached. With stream the body is not read in advance, so parse can
+        stop reading early. ttl overrides the fresh lifetime for documents
+        that change less often.
+        """
+        ttl = ttl or self.freshTtl
+        key = self.key(url, requestUrl, variant)
+        entry = self.cache.get(key)
+        if entry is not None:
+            age = time.time() - entry["fetched"]
+            if age < ttl:
+                self.count("hits")
+                return entry["value"]
+            if age < ttl + self.maxStale:
+                self.count("stale")
+                self.refreshInBackground(
+                    key, requestUrl, parse, entry, stream, ttl)
+                return entry["value"]
+        self.count("misses")
+        return self.load(key, requestUrl, parse, entry, stream, ttl)
+
+    def load(self, key, requestUrl, parse, entry=None, stream=False, ttl=None):
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("lastModified"):
+                headers["If-Modified-Since"] = entry["lastModified"]
+        response = HttpClient.default().get(
+            requestUrl, headers=headers, stream=stream)
+        try:
+            if entry is not None and response.status_code == 304:
+                self.count("revalidated")
+                entry["fetched"] = time.time()
+                self.store(key, entry, ttl)
+                return entry["value"]
+            value = parse(response)
+        finally:
+            response.close()
+        if value is not None:
+            self.store(key, {
+                "value": value,
+                "etag": response.headers.get("ETag"),
+                "lastModified": response.headers.get("Last-Modified"),
+                "fetched": time.time()
+            }, ttl)
+        return value
+
+    def store(self, key, entry, ttl=None):
+        self.cache.set(key, entry, (ttl or self.freshTtl) + self.maxStale)
+
+    def refreshInBackground(self, key, requestUrl, parse, entry, stream, ttl):
+        with self.refreshLock:
+            if key in self.refreshing:
+                return
+            self.refreshing.add(key)
+            if self.pool is None:
+                self.pool = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="capabilities")
+        self.pool.submit(self.refresh, key, requestUrl,
+                         parse, entry, stream, ttl)
+
+    def refresh(self, key, requestUrl, parse, entry, stream, ttl):
+        try:
+            self.load(key, requestUrl, parse, entry, stream, ttl)
+        except Exception:
+            # The stale entry stays in place and is retried on the next request
+            logger.exception("Could not refresh %s", requestUrl)
+        finally:
+            with self.refreshLock:
+                self.refreshing.discard(key)
+
+    def count(self, name):
+        key = "capabilities:stats:" + name
+        self.cache.add(key, 0, None)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.set(key, 1, None)
+
+    def stats(self):
+        stats = {}
+        for name in ("hits", "stale", "misses", "revalidated"):
+            stats[name] = self.cache.get("capabilities:stats:" + name, 0)
+        total = stats["hits"] + stats["stale"] + stats["misses"]
+        stats["hitRatio"] = (stats["hits"] + stats["stale"]) / \
+            total if total else None
+        return stats
@@ -0,0 +1,112 @@
+import random
+import numpy as np
+from rasterio.enums import Resampling
+
+METHODS = ("quantile", "equal", "jenks")
+# Fewest blocks a sample of a raster without overviews is taken from
+MIN_BLOCKS = 256
+
+
+def sample(ds, size, band=1, seed=0):
+    """
+    Valid values of a band, about size of them. Read from the overview
+    closest to size pixels when the raster has overviews, otherwise from
+    randomly chosen blocks. Nodata, masked and non-finite pixels are
+    dropped. Memory use depends on size, not on the raster.
+    """
+    if ds.width * ds.height <= size:
+        values = ds.read(band, masked=True).compressed()
+    elif ds.overviews(band):
+        # GDAL serves decimated reads from the best matching overview
+        factor = (ds.width * ds.height / size) ** 0.5
+        shape = (max(int(ds.height / factor), 1), max(int(ds.width / factor), 1))
+        values = ds.read(band, out_shape=shape, masked=True,
+                         resampling=Resampling.nearest).compressed()
+    else:
+        # Spread over at least MIN_BLOCKS blocks, a few whole blocks would
+        # only describe a few spots of the raster
+        windows = [window for _, window in ds.block_windows(band)]
+        random.Random(seed).shuffle(windows)
+        blockSize = max(windows[0].width * windows[0].height, 1)
+        windows = windows[:max(MIN_BLOCKS, -(-size // blockSize))]
+        share = -(-size // len(windows))
+        rng = np.random.default_rng(seed)
+        parts = []
+        for window in windows:
+            part = ds.read(band, window=window, masked=True).compressed()
+            if part.size > share:
+                part = rng.choice(part, share, replace=False)
+            parts.append(part)
+        values = np.concatenate(parts)
+    values = values[np.isfinite(values)].astype(np.float64)
+    if values.size > size:
+        values = np.random.default_rng(seed).choice(values, size, replace=False)
+    return values
+
+
+def quantile(values, classes):
+    return np.quantile(values, np.linspace(0, 1, classes + 1))
+
+
+def equal(values, classes):
+    return np.linspace(values.min(), values.max(), classes + 1)
+
+
+def jenks(values, classes):
+    """
+    Fisher-Jenks natural breaks, classes minimizing the sum of squared
+    deviations from their means. O(classes * n^2), values is a sample.
+    """
+    x = np.sort(values)
+    n = len(x)
+    if n <= classes:
+        return np.concatenate((x, [x[-1]]))
+    s1 = np.concatenate(([0.0], np.cumsum(x)))
+    s2 = np.concatenate(([0.0], np.cumsum(x * x)))
+    # cost[i, j]: squared deviations of x[i:j], only defined for i < j
+    i = np.arange(n + 1)[:, None]
+    j = np.arange(n + 1)[None, :]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cost = (s2[j] - s2[i]) - (s1[j] - s1[i]) ** 2 / (j - i)
+    cost[i >= j] = np.inf
+
+    # error[j]: best error of x[:j] split into the classes so far
+    error = cost[0]
+    starts = []
+    for _ in range(1, classes):
+        total = error[:, None] + cost
+        start = np.argmin(total, axis=0)
+        error = total[start, np.arange(n + 1)]
+        starts.append(start)
+    # Walk back from the end to the first index of every class
+    edges = [n]
+    for start in reversed(starts):
+        edges.append(int(start[edges[-1]]))
+    edges = [0] + edges[::-1]
+    return np.concatenate((x[edges[:-1]], [x[-1]]))
+
+
+def validate(method):
+    if method not in METHODS:
+        raise ValueError("Unknown classification method " + str(method) +
+                         ", expected one of " + ", ".join(METHODS))
+
+
+def breaks(ds, method, classes, size, jenksSize, band=1):
+    """
+    classes + 1 ascending class edges of a band, the first is the minimum
+    and the last the maximum. Edges that coincide are merged.
+    """
+    validate(method)
+    values = sample(ds, size, band)
+    if values.size == 0:
+        raise ValueError("The raster has no valid pixels")
+    if method == "jenks":
+        if values.size > jenksSize:
+            values = np.random.default_rng(0).choice(values, jenksSize, replace=False)
+        edges = jenks(values, classes)
+    elif method == "equal":
+        edges = equal(values, classes)
+    else:
+        edges = quantile(values, classes)
+    return np.unique(edges)
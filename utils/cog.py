@@ -0,0 +1,106 @@
+import multiprocessing
+import os
+import threading
+import time
+import rasterio
+from rasterio.shutil import copy as copyRaster
+from django.conf import settings
+
+
+def convert(source, target, blockSize, compression, resampling):
+    """Writes source as a tiled, compressed GeoTIFF with internal overviews."""
+    temp = target + ".%d.tmp" % os.getpid()
+    with rasterio.Env(GDAL_NUM_THREADS="ALL_CPUS"):
+        copyRaster(source, temp, driver="COG", BLOCKSIZE=blockSize, COMPRESS=compression,
+                   OVERVIEWS="AUTO", OVERVIEW_RESAMPLING=resampling, BIGTIFF="IF_SAFER")
+    os.replace(temp, target)
+    return target
+
+
+def convertInChild(connection, *args):
+    # Runs in a process of its own, reports the error back to the parent
+    try:
+        convert(*args)
+        connection.send(None)
+    except Exception as e:
+        connection.send(repr(e))
+    finally:
+        connection.close()
+
+
+class CogConverter:
+    """
+    Conversion of GeoTIFFs to Cloud-Optimized GeoTIFFs, so that later reads
+    (SLD statistics, tiles, GeoServer rendering) use overviews and blocks
+    instead of full resolution scans. Every conversion runs in a process of
+    its own, at most COG_WORKERS at a time, started by a fork server
+    (spawned where there is none) and never forked from the threaded server
+    process. A conversion that takes longer than COG_TIMEOUT seconds is
+    killed. Processes that cannot have children, such as Celery prefork
+    workers, convert inline.
+    """
+    slots = None
+    lock = threading.Lock()
+
+    @staticmethod
+    def semaphore():
+        with CogConverter.lock:
+            if CogConverter.slots is None:
+                CogConverter.slots = threading.BoundedSemaphore(settings.COG_WORKERS)
+            return CogConverter.slots
+
+    @staticmethod
+    def context():
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        return multiprocessing.get_context(method)
+
+    @staticmethod
+    def isOptimized(path):
+        with rasterio.open(path) as ds:
+            if ds.driver != "GTiff":
+                return False
+            if ds.width <= settings.COG_BLOCK_SIZE and ds.height <= settings.COG_BLOCK_SIZE:
+                # A single block needs neither tiles nor overviews
+                return True
+            return ds.profile.get("tiled", False) and bool(ds.overviews(1))
+
+    @staticmethod
+    def convert(source, target):
+        args = (source, target, settings.COG_BLOCK_SIZE,
+                settings.COG_COMPRESSION, settings.COG_OVERVIEW_RESAMPLING)
+        if multiprocessing.current_process().daemon:
+            return convert(*args)
+        # Waiting for a free slot counts against the timeout as well
+        deadline = time.monotonic() + settings.COG_TIMEOUT
+        slots = CogConverter.semaphore()
+        if not slots.acquire(timeout=settings.COG_TIMEOUT):
+            raise TimeoutError("No COG conversion slot within " + str(settings.COG_TIMEOUT) + " seconds")
+        try:
+            context = CogConverter.context()
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(target=convertInChild, args=(sender,) + args, daemon=True)
+            process.start()
+            sender.close()
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                # Callers keep the original file, the slot is free again
+                process.terminate()
+                process.join()
+                try:
+                    os.remove(target + ".%d.tmp" % process.pid)
+                except OSError:
+                    pass
+                raise TimeoutError("COG conversion of " + source + " took longer than " +
+                                   str(settings.COG_TIMEOUT) + " seconds")
+            try:
+                error = receiver.recv()
+            except EOFError:
+                # The child died before it could report anything
+                error = "exit code " + str(process.exitcode)
+            finally:
+                receiver.close()
+            if error is not None:
+                raise RuntimeError("COG conversion of " + source + " failed: " + error)
+            return target
+        finally:
+            slots.release()
@@ -0,0 +1,38 @@
+class WorkflowError(Exception):
+    """Base class for errors raised while executing a workflow."""
+
+
+class CycleError(WorkflowError):
+    def __init__(self, cycle):
+        self.cycle = cycle
+        super().__init__("Workflow contains a cycle: " +
+                         " -> ".join(str(id) for id in cycle))
+
+
+class JobFailed(WorkflowError):
+    def __init__(self, url, message):
+        self.url = url
+        super().__init__("Remote job " + url + " failed: " + str(message))
+
+
+class JobTimeout(WorkflowError):
+    def __init__(self, url, timeout):
+        self.url = url
+        super().__init__("Remote job " + url +
+                         " did not finish within " + str(timeout) + " seconds")
+
+
+class OperationFailed(WorkflowError):
+    def __init__(self, url, status, message):
+        self.url = url
+        self.status = status
+        super().__init__("Operation " + url + " failed (HTTP " +
+                         str(status) + "): " + str(message)[:500])
+
+
+class GeoServerError(WorkflowError):
+    def __init__(self, url, status, message):
+        self.url = url
+        self.status = status
+        super().__init__("GeoServer request " + url + " failed (HTTP " +
+                         str(status) + "): " + str(message)[:500])
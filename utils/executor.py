@@ -0,0 +1,175 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from django.conf import settings
+from utils.exceptions import WorkflowError
+
+
+class ExecutionListener:
+    """
+    Receives the progress of a WorkflowExecutor. Callbacks are made from the
+    thread that called run(), never from the pool threads.
+    """
+
+    def operationStarted(self, id, operation):
+        pass
+
+    def operationFinished(self, id, operation, output):
+        pass
+
+    def operationFailed(self, id, operation, error):
+        pass
+
+    def operationReused(self, id, operation, output):
+        pass
+
+
+class Deferred:
+    """
+    Output of an operation that finishes outside the pool, such as a remote
+    job. The executor waits for future without holding a pool thread, then
+    runs then(result) on the pool to build the output.
+    """
+
+    def __init__(self, future, then=None):
+        self.future = future
+        self.then = then if then is not None else (lambda result: result)
+
+    def map(self, function):
+        """Deferred of function applied to the output."""
+        then = self.then
+        return Deferred(self.future, lambda result: function(then(result)))
+
+    @staticmethod
+    def resolve(output):
+        """Blocks until a deferred output is available, for callers outside the executor."""
+        if isinstance(output, Deferred):
+            return output.then(output.future.result())
+        return output
+
+
+class WorkflowExecutor:
+    """
+    Runs the operations of a workflow as a DAG: every operation is submitted
+    to a bounded thread pool as soon as all of its upstream operations have
+    finished, so independent branches run concurrently. An operation that
+    returns a Deferred gives its pool thread back until the deferred future
+    is done. Operations listed in reuse (operation key -> output) are not
+    executed, their stored output is used instead.
+    """
+
+    def __init__(self, workflow, graph, execute, maxWorkers=None, listener=None, reuse=None):
+        self.workflow = workflow
+        self.listener = listener if listener is not None else ExecutionListener()
+        self.reuse = reuse if reuse is not None else {}
+        self.graph = graph
+        self.levels = graph.levels()
+        self.execute = execute
+        self.maxWorkers = WorkflowExecutor.resolveMaxWorkers(
+            workflow, maxWorkers)
+
+    @staticmethod
+    def resolveMaxWorkers(workflow, maxWorkers=None):
+        """
+        Pool size of a workflow: maxWorkers of the request, of the workflow
+        metadata or WORKFLOW_MAX_WORKERS, at most WORKFLOW_MAX_WORKERS_LIMIT.
+        Raises ValueError for anything but a positive integer.
+        """
+        if maxWorkers in (None, ""):
+            maxWorkers = (workflow or {}).get("metadata", {}).get("maxWorkers")
+        if maxWorkers in (None, ""):
+            maxWorkers = settings.WORKFLOW_MAX_WORKERS
+        try:
+            maxWorkers = int(maxWorkers)
+        except (TypeError, ValueError):
+            maxWorkers = 0
+        if maxWorkers < 1:
+            raise ValueError("maxWorkers must be a positive integer")
+        return min(maxWorkers, settings.WORKFLOW_MAX_WORKERS_LIMIT)
+
+    def bindInputs(self, operation, outputs):
+        for i in range(0, len(operation["inputs"])):
+            if isinstance(operation["inputs"][i]["value"], str) and "_to_" in operation["inputs"][i]["value"]:
+                value = operation["inputs"][i]["value"].split("_to_")
+                if value[0] in outputs:
+                    operation["inputs"][i]["value"] = outputs[value[0]][0]
+
+    def release(self, key, pending, ready):
+        for child in self.graph.downstream[key]:
+            pending[child] -= 1
+            if pending[child] == 0:
+                ready.append(child)
+
+    def cancel(self, running, continuations):
+        # Remote jobs are not waited for once the workflow has failed
+        for future in list(continuations):
+            if future.cancel():
+                key = running.pop(future)
+                del continuations[future]
+                self.listener.operationFailed(self.graph.ids[key], self.graph.operations[key],
+                                              WorkflowError("Cancelled after another operation failed"))
+
+    def run(self):
+        outputs = {}
+        pending = {key: len(deps) for key, deps in self.graph.upstream.items()}
+        ready = deque(self.levels[0]) if self.levels else deque()
+        running = {}
+        # Deferred futures -> the function that turns their result into the output
+        continuations = {}
+        error = None
+
+        with ThreadPoolExecutor(max_workers=self.maxWorkers) as pool:
+            while ready or running:
+                while ready and error is None:
+                    key = ready.popleft()
+                    operation = self.graph.operations[key]
+                    if key in self.reuse:
+                        outputs[key] = [self.reuse[key]]
+                        self.listener.operationReused(
+                            self.graph.ids[key], operation, self.reuse[key])
+                        self.release(key, pending, ready)
+                        continue
+                    self.bindInputs(operation, outputs)
+                    self.listener.operationStarted(
+                        self.graph.ids[key], operation)
+                    running[pool.submit(self.execute, operation)] = key
+                ready.clear()
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = running.pop(future)
+                    then = continuations.pop(future, None)
+                    operation = self.graph.operations[key]
+                    try:
+                        output = future.result()
+                    except Exception as e:
+                        self.listener.operationFailed(
+                            self.graph.ids[key], operation, e)
+                        if error is None:
+                            error = e
+                        continue
+                    if then is not None:
+                        running[pool.submit(then, output)] = key
+                        continue
+                    if isinstance(output, Deferred):
+                        running[output.future] = key
+                        continuations[output.future] = output.then
+                        continue
+                    outputs[key] = [output]
+                    self.listener.operationFinished(
+                        self.graph.ids[key], operation, output)
+                    self.release(key, pending, ready)
+                if error is not None:
+                    self.cancel(running, continuations)
+
+        if error is not None:
+            raise error
+
+        # In the order of the workflow operations, as callers and stored
+        # executions expect, whatever order they finished in
+        result = []
+        for key, operation in self.graph.operations.items():
+            result.append(
+                {"type": operation["outputs"][0]["type"], "data": outputs[key][0], "id": self.graph.ids[key]})
+        return result
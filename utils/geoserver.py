@@ -0,0 +1,105 @@
+import secrets
+from urllib.parse import quote, urlsplit, urlunsplit
+from django.conf import settings
+from django.core.cache import caches
+from utils.exceptions import GeoServerError
+from utils.http import HttpClient
+
+SLD_CONTENT_TYPE = "application/vnd.ogc.sld+xml"
+
+
+class GeoServerCredentials:
+    """
+    Passwords handed from a publish request to its background task. Only a
+    random one-time token goes through the broker, the password waits for
+    the task in the credentials cache for GEOSERVER_CREDENTIALS_TTL seconds.
+    """
+
+    @staticmethod
+    def put(password):
+        if not password:
+            return None
+        token = secrets.token_urlsafe(32)
+        caches[settings.GEOSERVER_CREDENTIALS_CACHE].set(
+            "password:" + token, password, settings.GEOSERVER_CREDENTIALS_TTL)
+        return token
+
+    @staticmethod
+    def pop(token):
+        if not token:
+            return None
+        cache = caches[settings.GEOSERVER_CREDENTIALS_CACHE]
+        password = cache.get("password:" + token)
+        cache.delete("password:" + token)
+        return password
+
+
+class GeoServerClient:
+    """
+    Publishes GeoTIFF coverages and SLD styles through the GeoServer REST
+    API. Requests go through the shared HttpClient, every publish reuses
+    the pooled connections to the server.
+    """
+
+    def __init__(self, host, username, password):
+        self.url = GeoServerClient.restUrl(host)
+        self.auth = (username, password)
+        self.http = HttpClient.default()
+
+    @staticmethod
+    def restUrl(host):
+        # Hosts are given as "example.org", "http://example.org:8080" or
+        # the full URL of the GeoServer web application
+        if "://" not in host:
+            host = "http://" + host
+        parts = urlsplit(host)
+        path = parts.path.rstrip("/") or "/geoserver"
+        if not path.endswith("/rest"):
+            path += "/rest"
+        return urlunsplit((parts.scheme, parts.netloc, path, "", ""))
+
+    def request(self, method, path, expected=(200, 201), **kwargs):
+        response = self.http.request(method, self.url + path, auth=self.auth, **kwargs)
+        if response.status_code not in expected:
+            raise GeoServerError(self.url + path, response.status_code, response.text)
+        return response
+
+    def ensureWorkspace(self, workspace):
+        response = self.request("GET", "/workspaces/" + quote(workspace, safe="") + ".json", expected=(200, 404))
+        if response.status_code == 404:
+            self.request("POST", "/workspaces", json={"workspace": {"name": workspace}})
+
+    def publishCoverage(self, workspace, name, file, srs=None):
+        """Creates or replaces the coverage store name and its coverage from a GeoTIFF."""
+        store = "/workspaces/" + quote(workspace, safe="") + "/coveragestores/" + quote(name, safe="")
+        # The file body cannot be rewound for a retry
+        with open(file, "rb") as f:
+            self.request("PUT", store + "/file.geotiff", data=f, retry=False,
+                         params={"configure": "first", "coverageName": name},
+                         headers={"Content-Type": "image/tiff"}, timeout=HttpClient.executeTimeout())
+        if srs and srs.startswith("EPSG:"):
+            self.request("PUT", store + "/coverages/" + quote(name, safe="") + ".json", json={"coverage": {
+                "srs": srs, "projectionPolicy": "REPROJECT_TO_DECLARED"}})
+
+    def publishStyle(self, workspace, name, sld):
+        """Creates or replaces the style name from an SLD file."""
+        with open(sld, "rb") as f:
+            body = f.read()
+        styles = "/workspaces/" + quote(workspace, safe="") + "/styles"
+        headers = {"Content-Type": SLD_CONTENT_TYPE}
+        response = self.request("PUT", styles + "/" + quote(name, safe=""), data=body, headers=headers,
+                                params={"raw": "true"}, expected=(200, 201, 404))
+        if response.status_code == 404:
+            self.request("POST", styles, data=body, headers=headers, params={"name": name})
+
+    def setDefaultStyle(self, workspace, layer, style):
+        self.request("PUT", "/layers/" + quote(workspace, safe="") + ":" + quote(layer, safe="") + ".json", json={
+            "layer": {"defaultStyle": {"name": style, "workspace": workspace}}})
+
+    def publishRaster(self, workspace, name, file, sld, srs=None, style=None):
+        """Publishes a GeoTIFF as layer workspace:name styled with sld as style (default name)."""
+        style = style or name
+        self.publishStyle(workspace, style, sld)
+        self.publishCoverage(workspace, name, file, srs)
+        self.setDefaultStyle(workspace, name, style)
+        return workspace + ":" + name
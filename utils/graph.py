@@ -0,0 +1,112 @@
+from utils.cache import canonicalHash
+from utils.exceptions import CycleError
+
+
+class WorkflowGraph:
+    """
+    Adjacency-list representation of a workflow, built once from its
+    operations, connections and "<id>_to_<param>" input bindings. Operation
+    ids are compared as strings, the original ids are kept for the results.
+    """
+
+    def __init__(self, workflow):
+        self.ids = {}
+        self.operations = {}
+        self.upstream = {}
+        self.downstream = {}
+        for operation in workflow["operations"]:
+            key = str(operation["id"])
+            self.ids[key] = operation["id"]
+            self.operations[key] = operation
+            self.upstream[key] = set()
+            self.downstream[key] = []
+
+        for connection in workflow.get("connections", []):
+            self.addEdge(str(connection["fromOperationID"]),
+                         str(connection["toOperationID"]))
+        for key, operation in self.operations.items():
+            for input in operation["inputs"]:
+                if isinstance(input["value"], str) and "_to_" in input["value"]:
+                    self.addEdge(input["value"].split("_to_")[0], key)
+
+    def addEdge(self, fromID, toID):
+        if fromID not in self.upstream or toID not in self.upstream:
+            return
+        if fromID in self.upstream[toID]:
+            return
+        self.upstream[toID].add(fromID)
+        self.downstream[fromID].append(toID)
+
+    def levels(self):
+        """
+        Kahn's algorithm: returns lists of operation keys, every operation of
+        a level only depends on operations of earlier levels.
+        """
+        indegree = {key: len(deps) for key, deps in self.upstream.items()}
+        level = [key for key, count in indegree.items() if count == 0]
+        levels = []
+        visited = 0
+        while level:
+            levels.append(level)
+            visited += len(level)
+            following = []
+            for key in level:
+                for child in self.downstream[key]:
+                    indegree[child] -= 1
+                    if indegree[child] == 0:
+                        following.append(child)
+            level = following
+        if visited < len(indegree):
+            raise CycleError(self.findCycle(
+                [key for key, count in indegree.items() if count > 0]))
+        return levels
+
+    def order(self):
+        """Topologically sorted operation ids (original ids, not keys)."""
+        return [self.ids[key] for level in self.levels() for key in level]
+
+    def fingerprints(self):
+        """
+        Hash of every operation that covers its process, its own input
+        values and the fingerprints of everything upstream, so an edit
+        changes the fingerprint of the operation and all its descendants.
+        """
+        fingerprints = {}
+        for level in self.levels():
+            for key in level:
+                operation = self.operations[key]
+                metadata = operation["metadata"]
+                inputs = []
+                for input in operation["inputs"]:
+                    value = input.get("value")
+                    if isinstance(value, str) and "_to_" in value and value.split("_to_")[0] in fingerprints:
+                        value = {"from": fingerprints[value.split("_to_")[0]]}
+                    inputs.append([input.get("identifier"), input.get(
+                        "type"), input.get("url"), value])
+                fingerprints[key] = canonicalHash({
+                    "resource": metadata.get("resource"),
+                    "url": metadata.get("url"),
+                    "label": metadata.get("label"),
+                    "inputs": inputs,
+                    "outputs": [[output.get("identifier"), output.get("type")]
+                                for output in operation["outputs"]],
+                    "upstream": sorted(fingerprints[parent] for parent in self.upstream[key])
+                })
+        return fingerprints
+
+    def findCycle(self, keys):
+        # Every remaining node has an unresolved parent that is remaining as
+        # well, walking upstream therefore always ends in a cycle
+        remaining = set(keys)
+        path = []
+        position = {}
+        key = keys[0]
+        while key not in position:
+            position[key] = len(path)
+            path.append(key)
+            key = next(parent for parent in self.upstream[key]
+                       if parent in remaining)
+        cycle = path[position[key]:]
+        cycle.reverse()
+        cycle.append(cycle[0])
+        return [self.ids[key] for key in cycle]
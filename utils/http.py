@@ -0,0 +1,112 @@
+import threading
+import time
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+
+# Only requests that can safely be repeated are retried
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE"])
+
+
+class HttpClient:
+    """
+    Shared client for all upstream OGC/REST calls. Connections are kept alive
+    in one pool per host, every request gets connect/read timeouts and
+    idempotent requests are retried with backoff on connection errors and
+    502/503/504 responses. Requests made with retry=False, such as a GET
+    that starts a remote process, are sent exactly once.
+    """
+    instance = None
+    lock = threading.Lock()
+
+    def __init__(self, poolConnections, poolMaxSize, connectTimeout, readTimeout, retries, backoff):
+        self.timeout = (connectTimeout, readTimeout)
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=IDEMPOTENT_METHODS,
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=poolConnections,
+                              pool_maxsize=poolMaxSize, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        once = HTTPAdapter(pool_connections=poolConnections,
+                           pool_maxsize=poolMaxSize, max_retries=Retry(0, read=False))
+        self.onceSession = requests.Session()
+        self.onceSession.mount("http://", once)
+        self.onceSession.mount("https://", once)
+        self.hosts = {}
+        self.statsLock = threading.Lock()
+
+    @staticmethod
+    def default():
+        with HttpClient.lock:
+            if HttpClient.instance is None:
+                HttpClient.instance = HttpClient(
+                    settings.HTTP_POOL_CONNECTIONS, settings.HTTP_POOL_MAXSIZE,
+                    settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_READ_TIMEOUT,
+                    settings.HTTP_RETRIES, settings.HTTP_RETRY_BACKOFF)
+            return HttpClient.instance
+
+    @staticmethod
+    def executeTimeout():
+        """Timeout for calls that run a remote process and may take long."""
+        return (settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_EXECUTE_READ_TIMEOUT)
+
+    def request(self, method, url, retry=True, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        session = self.session if retry else self.onceSession
+        start = time.monotonic()
+        try:
+            response = session.request(method, url, **kwargs)
+        except requests.RequestException:
+            self.record(url, time.monotonic() - start, None, 0)
+            raise
+        size = response.headers.get("Content-Length")
+        if size is None and not kwargs.get("stream"):
+            size = len(response.content)
+        self.record(url, time.monotonic() - start,
+                    response.status_code, int(size or 0))
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request("HEAD", url, **kwargs)
+
+    def record(self, url, elapsed, status, size):
+        host = urlparse(url).netloc
+        with self.statsLock:
+            stats = self.hosts.setdefault(host, {
+                "requests": 0, "errors": 0, "bytes": 0, "time": 0.0, "maxTime": 0.0
+            })
+            stats["requests"] += 1
+            stats["time"] += elapsed
+            stats["maxTime"] = max(stats["maxTime"], elapsed)
+            stats["bytes"] += size
+            if status is None or status >= 400:
+                stats["errors"] += 1
+
+    def stats(self):
+        with self.statsLock:
+            hosts = {}
+            for host, stats in self.hosts.items():
+                hosts[host] = dict(stats)
+                hosts[host]["meanTime"] = stats["time"] / stats["requests"]
+            return hosts
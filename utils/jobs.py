@@ -0,0 +1,156 @@
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+import requests
+from django.conf import settings
+from utils.exceptions import JobFailed, JobTimeout
+from utils.http import HttpClient
+
+PENDING_STATUSES = ("Accepted", "Running")
+
+
+class RemoteJob:
+    def __init__(self, url, timeout, interval):
+        self.url = url
+        self.timeout = timeout
+        self.deadline = time.monotonic() + timeout
+        self.interval = interval
+        self.future = Future()
+
+
+class JobPoller:
+    """
+    Monitors the status documents of asynchronous WPS 2.0 jobs. One
+    background thread hands the jobs that are due to a pool of worker
+    threads, every status request is made once with a short read timeout,
+    so a slow server only delays its own jobs. Every job is polled with
+    exponential backoff, a Retry-After header from the server takes
+    precedence, and the future returned by submit() resolves to the final
+    StatusInfo, or fails with JobFailed or JobTimeout.
+    """
+    instance = None
+    lock = threading.Lock()
+
+    def __init__(self, interval, maxInterval, factor, timeout, workers=4, requestTimeout=10):
+        self.interval = interval
+        self.maxInterval = maxInterval
+        self.factor = factor
+        self.timeout = timeout
+        self.workers = workers
+        self.requestTimeout = requestTimeout
+        self.queue = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.thread = None
+        self.pool = None
+
+    @staticmethod
+    def default():
+        with JobPoller.lock:
+            if JobPoller.instance is None:
+                JobPoller.instance = JobPoller(
+                    settings.WPS_JOB_POLL_INTERVAL, settings.WPS_JOB_POLL_MAX_INTERVAL,
+                    settings.WPS_JOB_POLL_FACTOR, settings.WPS_JOB_TIMEOUT,
+                    settings.WPS_JOB_POLL_WORKERS, settings.WPS_JOB_POLL_TIMEOUT)
+            return JobPoller.instance
+
+    def submit(self, url, timeout=None):
+        job = RemoteJob(url, timeout or self.timeout, self.interval)
+        with self.condition:
+            # The threads do not survive a fork (e.g. Celery prefork
+            # workers), start them in the process that uses them
+            if self.thread is None or not self.thread.is_alive():
+                self.pool = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="wps-job-poll")
+                self.thread = threading.Thread(
+                    target=self.run, name="wps-job-poller", daemon=True)
+                self.thread.start()
+            self.schedule(job, 0)
+        return job.future
+
+    def schedule(self, job, delay):
+        heapq.heappush(self.queue, (time.monotonic() +
+                       delay, next(self.counter), job))
+        self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.queue or self.queue[0][0] > time.monotonic():
+                    timeout = self.queue[0][0] - \
+                        time.monotonic() if self.queue else None
+                    self.condition.wait(timeout)
+                _, _, job = heapq.heappop(self.queue)
+            self.pool.submit(self.check, job)
+
+    def check(self, job):
+        try:
+            delay = self.poll(job)
+        except Exception as e:
+            # Never let one job stop the polling of the others
+            if not job.future.done():
+                job.future.set_exception(JobFailed(job.url, e))
+            delay = None
+        if delay is not None:
+            with self.condition:
+                self.schedule(job, delay)
+
+    def poll(self, job):
+        """Returns the delay until the next poll, None once the job is done."""
+        if job.future.cancelled():
+            return None
+        retryAfter = None
+        try:
+            # Failed requests are not retried here but at the next poll
+            response = HttpClient.default().get(job.url, retry=False, timeout=(
+                settings.HTTP_CONNECT_TIMEOUT, self.requestTimeout))
+            retryAfter = JobPoller.getRetryAfter(response)
+            if response.status_code in (429, 502, 503, 504):
+                statusInfo = None
+            elif 400 <= response.status_code < 500:
+                # The job is unknown or gone, asking again will not change that
+                job.future.set_exception(JobFailed(
+                    job.url, "HTTP " + str(response.status_code)))
+                return None
+            else:
+                response.raise_for_status()
+                statusInfo = response.json()["StatusInfo"]
+        except (requests.RequestException, ValueError, KeyError) as e:
+            # Transient errors are retried until the deadline
+            statusInfo = None
+            if time.monotonic() >= job.deadline:
+                job.future.set_exception(JobFailed(job.url, e))
+                return None
+
+        if statusInfo is not None and statusInfo.get("Status") not in PENDING_STATUSES:
+            if statusInfo.get("Status") == "Failed":
+                job.future.set_exception(JobFailed(
+                    job.url, statusInfo.get("Message", statusInfo)))
+            else:
+                job.future.set_result(statusInfo)
+            return None
+
+        remaining = job.deadline - time.monotonic()
+        if remaining <= 0:
+            job.future.set_exception(JobTimeout(job.url, job.timeout))
+            return None
+        delay = retryAfter if retryAfter is not None else job.interval
+        job.interval = min(job.interval * self.factor, self.maxInterval)
+        return min(delay, remaining)
+
+    @staticmethod
+    def getRetryAfter(response):
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
@@ -0,0 +1,305 @@
+import base64
+import fcntl
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import rasterio
+import requests
+from django.conf import settings
+from utils.http import HttpClient
+from utils.transform import TransformService
+
+CHUNK_SIZE = 1024 * 1024
+CONTENT_RANGE = re.compile(r"bytes\s+\d+-\d+/(\d+)")
+# Digest algorithm names of Repr-Digest / Digest headers and hashlib
+DIGESTS = {"sha-256": "sha256", "sha-512": "sha512", "md5": "md5"}
+
+
+class IntegrityError(Exception):
+    pass
+
+
+def expectedDigests(headers, checksum=None):
+    """
+    (algorithm, digest bytes) pairs the download must match: a checksum
+    "<algorithm>:<hex>" of the caller and Repr-Digest, Digest or
+    Content-MD5 headers of a full response.
+    """
+    digests = []
+    if checksum:
+        algorithm, _, value = checksum.partition(":")
+        digests.append((algorithm.lower().replace("-", ""), bytes.fromhex(value)))
+    for header in ("Repr-Digest", "Digest"):
+        for item in headers.get(header, "").split(","):
+            name, _, value = item.strip().partition("=")
+            if name.lower() in DIGESTS and value:
+                try:
+                    digests.append((DIGESTS[name.lower()], base64.b64decode(value.strip(":"))))
+                except ValueError:
+                    pass
+    if headers.get("Content-MD5"):
+        try:
+            digests.append(("md5", base64.b64decode(headers["Content-MD5"])))
+        except ValueError:
+            pass
+    return digests
+
+
+def fileDigest(path, algorithm):
+    digest = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+
+class RasterFetcher:
+    """
+    Downloads of remote rasters into RASTER_DOWNLOAD_DIR, keyed by URL.
+    Servers that accept range requests are fetched in parts of
+    RASTER_DOWNLOAD_PART_SIZE bytes by RASTER_DOWNLOAD_WORKERS threads.
+    Interrupted parts resume from the last byte written, completed parts
+    survive failed downloads, and a finished file is reused while the
+    server reports the same ETag or Last-Modified date.
+    """
+
+    @staticmethod
+    def paths(url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        path = os.path.join(settings.RASTER_DOWNLOAD_DIR, key + ".tif")
+        return path, path + ".part", path + ".json"
+
+    @staticmethod
+    def download(url, checksum=None):
+        os.makedirs(settings.RASTER_DOWNLOAD_DIR, exist_ok=True)
+        RasterFetcher.prune()
+        path, partPath, statePath = RasterFetcher.paths(url)
+        # Workers downloading the same URL wait for each other
+        with open(path + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            response = HttpClient.default().get(url, stream=True, headers={"Range": "bytes=0-0"},
+                                                timeout=HttpClient.executeTimeout())
+            try:
+                if response.status_code >= 400:
+                    raise requests.HTTPError("Could not fetch " + url + ": HTTP " +
+                                             str(response.status_code), response=response)
+                match = CONTENT_RANGE.match(response.headers.get("Content-Range", ""))
+                if response.status_code == 206 and match:
+                    response.close()
+                    return RasterFetcher.downloadParts(url, int(match.group(1)), response.headers,
+                                                       checksum, path, partPath, statePath)
+                if response.status_code != 200:
+                    # A range answer without the size, such as "bytes 0-0/*",
+                    # only holds the probed byte
+                    response.close()
+                    response = HttpClient.default().get(url, stream=True, timeout=HttpClient.executeTimeout())
+                    if response.status_code != 200:
+                        raise requests.HTTPError("Could not fetch " + url + ": HTTP " +
+                                                 str(response.status_code), response=response)
+                # Without range support the probe already is the download
+                return RasterFetcher.downloadStream(url, response, checksum, path, partPath)
+            finally:
+                response.close()
+
+    @staticmethod
+    def validator(headers):
+        # If-Range only accepts strong ETags
+        etag = headers.get("ETag")
+        if etag and not etag.startswith("W/"):
+            return etag
+        return headers.get("Last-Modified")
+
+    @staticmethod
+    def downloadParts(url, size, headers, checksum, path, partPath, statePath):
+        if size > settings.RASTER_DOWNLOAD_MAX_SIZE:
+            raise IntegrityError(url + " is larger than " + str(settings.RASTER_DOWNLOAD_MAX_SIZE) + " bytes")
+        validator = RasterFetcher.validator(headers)
+        state = {"url": url, "size": size, "validator": validator, "done": [], "complete": False}
+        try:
+            with open(statePath) as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            stored = None
+        if validator and stored and all(stored.get(name) == state[name] for name in ("url", "size", "validator")):
+            if stored["complete"] and os.path.exists(path):
+                os.utime(path)
+                return path
+            if os.path.exists(partPath):
+                state["done"] = stored["done"]
+        if not state["done"]:
+            with open(partPath, "wb") as f:
+                f.truncate(size)
+
+        partSize = settings.RASTER_DOWNLOAD_PART_SIZE
+        parts = [(index, start, min(start + partSize, size) - 1)
+                 for index, start in enumerate(range(0, size, partSize)) if index not in state["done"]]
+        stateLock = threading.Lock()
+
+        def fetch(part):
+            index, start, end = part
+            RasterFetcher.downloadPart(url, partPath, start, end, validator)
+            with stateLock:
+                state["done"].append(index)
+                RasterFetcher.writeState(statePath, state)
+
+        if parts:
+            with ThreadPoolExecutor(min(settings.RASTER_DOWNLOAD_WORKERS, len(parts))) as executor:
+                # list() raises the first failed part
+                list(executor.map(fetch, parts))
+
+        if os.path.getsize(partPath) != size:
+            raise IntegrityError(url + ": expected " + str(size) + " bytes")
+        # Content-MD5 of a 206 response only covers the part
+        representation = {name: headers[name] for name in ("Repr-Digest", "Digest") if name in headers}
+        for algorithm, digest in expectedDigests(representation, checksum):
+            if fileDigest(partPath, algorithm) != digest:
+                RasterFetcher.discard(partPath, statePath)
+                raise IntegrityError(url + ": " + algorithm + " digest does not match")
+        os.replace(partPath, path)
+        state["complete"] = True
+        RasterFetcher.writeState(statePath, state)
+        return path
+
+    @staticmethod
+    def downloadPart(url, partPath, start, end, validator):
+        offset = start
+        attempts = 0
+        while offset <= end:
+            headers = {"Range": "bytes=%d-%d" % (offset, end)}
+            if validator:
+                headers["If-Range"] = validator
+            try:
+                with HttpClient.default().get(url, stream=True, headers=headers) as response:
+                    if response.status_code != 206:
+                        # A full response to If-Range: the file changed upstream
+                        raise IntegrityError(url + " changed during the download (HTTP " +
+                                             str(response.status_code) + ")")
+                    with open(partPath, "r+b") as f:
+                        f.seek(offset)
+                        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                            if offset + len(chunk) > end + 1:
+                                raise IntegrityError(url + ": range " + headers["Range"] + " is too long")
+                            f.write(chunk)
+                            offset += len(chunk)
+                if offset <= end:
+                    raise requests.ConnectionError("Connection closed at byte " + str(offset))
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+                attempts += 1
+                if attempts > settings.RASTER_DOWNLOAD_RETRIES:
+                    raise
+                time.sleep(settings.HTTP_RETRY_BACKOFF * 2 ** (attempts - 1))
+
+    @staticmethod
+    def downloadStream(url, response, checksum, path, partPath):
+        attempts = 0
+        while True:
+            expected = response.headers.get("Content-Length")
+            if expected is not None and int(expected) > settings.RASTER_DOWNLOAD_MAX_SIZE:
+                raise IntegrityError(url + " is larger than " + str(settings.RASTER_DOWNLOAD_MAX_SIZE) + " bytes")
+            digests = expectedDigests(response.headers, checksum)
+            hashes = {algorithm: hashlib.new(algorithm) for algorithm, _ in digests}
+            size = 0
+            try:
+                with response, open(partPath, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        size += len(chunk)
+                        if size > settings.RASTER_DOWNLOAD_MAX_SIZE:
+                            raise IntegrityError(url + " is larger than " +
+                                                 str(settings.RASTER_DOWNLOAD_MAX_SIZE) + " bytes")
+                        f.write(chunk)
+                        for digest in hashes.values():
+                            digest.update(chunk)
+                if expected is not None and size != int(expected):
+                    raise requests.ConnectionError("Received " + str(size) + " of " + expected + " bytes")
+                break
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+                attempts += 1
+                if attempts > settings.RASTER_DOWNLOAD_RETRIES:
+                    raise
+                # Not resumable, start again
+                time.sleep(settings.HTTP_RETRY_BACKOFF * 2 ** (attempts - 1))
+                response = HttpClient.default().get(url, stream=True, timeout=HttpClient.executeTimeout())
+                if response.status_code >= 400:
+                    response.close()
+                    raise requests.HTTPError("Could not fetch " + url + ": HTTP " +
+                                             str(response.status_code), response=response)
+
+        for algorithm, digest in digests:
+            if hashes[algorithm].digest() != digest:
+                RasterFetcher.discard(partPath)
+                raise IntegrityError(url + ": " + algorithm + " digest does not match")
+        os.replace(partPath, path)
+        return path
+
+    @staticmethod
+    def writeState(statePath, state):
+        temp = statePath + "." + str(threading.get_ident()) + ".tmp"
+        with open(temp, "w") as f:
+            json.dump(state, f)
+        os.replace(temp, statePath)
+
+    @staticmethod
+    def discard(*paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def prune():
+        """Removes downloads and partial downloads unused for RASTER_DOWNLOAD_TTL seconds."""
+        limit = time.time() - settings.RASTER_DOWNLOAD_TTL
+        with os.scandir(settings.RASTER_DOWNLOAD_DIR) as it:
+            for entry in it:
+                try:
+                    if entry.stat().st_mtime < limit:
+                        os.remove(entry.path)
+                except OSError:
+                    pass
+
+    @staticmethod
+    def metadata(source):
+        """
+        CRS, bounds and layout of a raster file or URL. Remote rasters are
+        opened through GDAL's /vsicurl/, which reads only the header (and
+        the overview directory) with range requests.
+        """
+        remote = source.startswith(("http://", "https://"))
+        options = {}
+        if remote:
+            source = "/vsicurl/" + source
+            options = {
+                "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR",
+                "GDAL_HTTP_CONNECTTIMEOUT": int(settings.HTTP_CONNECT_TIMEOUT),
+                "GDAL_HTTP_TIMEOUT": int(settings.HTTP_READ_TIMEOUT),
+                "GDAL_HTTP_MAX_RETRY": settings.HTTP_RETRIES,
+                "GDAL_HTTP_RETRY_DELAY": settings.HTTP_RETRY_BACKOFF,
+            }
+        with rasterio.Env(**options):
+            with rasterio.open(source) as ds:
+                bounds = [ds.bounds.left, ds.bounds.bottom, ds.bounds.right, ds.bounds.top]
+                epsg = ds.crs.to_epsg() if ds.crs else None
+                extent = None
+                if epsg is not None:
+                    corners = TransformService.transformArray(
+                        [bounds[:2], bounds[2:]], epsg, 3857).tolist()
+                    extent = corners[0] + corners[1]
+                return {
+                    "crs": ds.crs.to_string() if ds.crs else None,
+                    "epsg": epsg,
+                    "bounds": bounds,
+                    "extent": extent,
+                    "width": ds.width,
+                    "height": ds.height,
+                    "count": ds.count,
+                    "dtypes": list(ds.dtypes),
+                    "nodata": ds.nodata,
+                    "resolution": list(ds.res),
+                    "overviews": ds.overviews(1) if ds.count else [],
+                    "blockShapes": [list(shape) for shape in ds.block_shapes],
+                }
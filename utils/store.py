@@ -0,0 +1,196 @@
+import collections
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class ResultStore:
+    """
+    Content-addressed store for raster and vector results. Files are kept
+    under the SHA-256 of their content, so identical outputs are stored
+    once. The modification time doubles as the last access time: once the
+    store grows beyond maxSize bytes the least recently used files are
+    evicted, except those pinned() reports as still referenced and those
+    held by a caller of this process. The size is always read from disk,
+    several processes share one store.
+    """
+    instance = None
+    lock = threading.Lock()
+    # Replaced by the services app with the keys referenced by tasks and
+    # executions
+    pinned = set
+
+    def __init__(self, directory, maxSize, baseUrl=""):
+        self.directory = directory
+        self.maxSize = maxSize
+        self.baseUrl = baseUrl.rstrip("/")
+        self.evictLock = threading.Lock()
+        # Keys put with hold=True and not released yet
+        self.held = collections.Counter()
+        os.makedirs(os.path.join(directory, "tmp"), exist_ok=True)
+
+    @staticmethod
+    def default():
+        with ResultStore.lock:
+            if ResultStore.instance is None:
+                ResultStore.instance = ResultStore(
+                    settings.STORE_DIR, settings.STORE_MAX_SIZE, settings.STORE_BASE_URL)
+            return ResultStore.instance
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def temporary(self, suffix=""):
+        """Path for a file that is put into the store with move=True afterwards."""
+        return os.path.join(self.directory, "tmp", "%d.%d.%d%s" % (
+            os.getpid(), threading.get_ident(), time.time_ns(), suffix))
+
+    def put(self, source, extension="", move=False, link=False, hold=False):
+        """
+        Stores a file (path) or bytes and returns its key, the hex digest
+        followed by extension. A file is moved into the store instead of
+        copied when move is set, and hard-linked when link is set and it is
+        on the same file system. With hold set the file is not evicted until
+        release(key) is called.
+        """
+        digest = hashlib.sha256()
+        if isinstance(source, (bytes, bytearray)):
+            digest.update(source)
+        else:
+            with open(source, "rb") as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    digest.update(chunk)
+        key = digest.hexdigest() + extension
+        path = self.path(key)
+        with self.evictLock:
+            # Checked and held at once, an eviction cannot come in between
+            stored = os.path.exists(path)
+            if stored:
+                os.utime(path)
+                if hold:
+                    self.held[key] += 1
+        if stored:
+            if move:
+                os.remove(source)
+            return key
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp = self.temporary()
+        if isinstance(source, (bytes, bytearray)):
+            with open(temp, "wb") as f:
+                f.write(source)
+        elif move:
+            os.replace(source, temp)
+        else:
+            try:
+                if not link:
+                    raise OSError
+                os.link(source, temp)
+            except OSError:
+                shutil.copyfile(source, temp)
+        if hold:
+            with self.evictLock:
+                self.held[key] += 1
+        try:
+            os.replace(temp, path)
+        except OSError:
+            if hold:
+                self.release(key)
+            raise
+        self.evict(keep=key)
+        return key
+
+    def release(self, key):
+        """Ends a hold of put(..., hold=True), key may be evicted again."""
+        with self.evictLock:
+            self.held[key] -= 1
+            if self.held[key] <= 0:
+                del self.held[key]
+
+    def get(self, key):
+        """Path of the stored file, None when it is not (or no longer) stored."""
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def stat(self, key):
+        try:
+            stat = os.stat(self.path(key))
+        except OSError:
+            return None
+        return {"key": key, "size": stat.st_size, "accessed": stat.st_mtime,
+                "url": self.url(key)}
+
+    def url(self, key):
+        return self.baseUrl + "/" + key[:2] + "/" + key if self.baseUrl else None
+
+    def keyOf(self, url):
+        """Key of a store URL, None for any other value."""
+        if not self.baseUrl or not isinstance(url, str) or not url.startswith(self.baseUrl + "/"):
+            return None
+        return url[len(self.baseUrl) + 1:].split("/")[-1] or None
+
+    def entries(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for folder in it:
+                if not folder.is_dir() or folder.name == "tmp":
+                    continue
+                with os.scandir(folder.path) as files:
+                    for entry in files:
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue
+                        entries.append((stat.st_mtime, stat.st_size, entry.name))
+        return entries
+
+    def evict(self, keep=None):
+        with self.evictLock:
+            # Leftovers of puts that did not finish
+            limit = time.time() - 24 * 3600
+            with os.scandir(os.path.join(self.directory, "tmp")) as it:
+                for entry in it:
+                    try:
+                        if entry.stat().st_mtime < limit:
+                            os.remove(entry.path)
+                    except OSError:
+                        pass
+            entries = self.entries()
+            size = sum(size for _, size, _ in entries)
+            if size <= self.maxSize:
+                return
+            pinned = ResultStore.pinned()
+            entries.sort()
+            for _, entrySize, key in entries:
+                if size <= self.maxSize:
+                    break
+                if key in pinned or key in self.held or key == keep:
+                    continue
+                try:
+                    os.remove(self.path(key))
+                except OSError:
+                    continue
+                size -= entrySize
+            if size > self.maxSize:
+                logger.warning("Result store holds %d bytes of referenced results, more than %d",
+                               size, self.maxSize)
+
+    def stats(self):
+        entries = self.entries()
+        return {
+            "entries": len(entries),
+            "size": sum(size for _, size, _ in entries),
+            "maxSize": self.maxSize
+        }
@@ -0,0 +1,114 @@
+import numpy as np
+
+METHODS = ("lttb", "minmax", "mean")
+# Calendar periods of the mean downsampling and their datetime64 units
+BUCKETS = {"hour": "h", "day": "D", "month": "M"}
+
+
+def lttb(x, y, points):
+    """
+    Largest-Triangle-Three-Buckets: indices of the points that keep the
+    visual shape of the series. Every bucket keeps the point forming the
+    largest triangle with the previously kept point and the mean of the
+    next bucket. y must not contain NaN.
+    """
+    n = len(x)
+    if points >= n or points < 3:
+        return np.arange(n)
+    # points - 2 buckets between the fixed first and last point
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    selected = np.empty(points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+    for i in range(points - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            nextX = x[end:edges[i + 2]].mean()
+            nextY = y[end:edges[i + 2]].mean()
+        else:
+            nextX, nextY = x[-1], y[-1]
+        area = np.abs((x[previous] - nextX) * (y[start:end] - y[previous]) -
+                      (x[previous] - x[start:end]) * (nextY - y[previous]))
+        previous = start + int(np.argmax(area))
+        selected[i + 1] = previous
+    return selected
+
+
+def minmax(x, y, points):
+    """Indices of the minimum and maximum of points / 2 equally sized buckets."""
+    n = len(x)
+    if points >= n:
+        return np.arange(n)
+    buckets = max(points // 2, 1)
+    bucket = (np.arange(n) * buckets) // n
+    # Sorted by bucket, then value: the first and last entry of every
+    # bucket are its minimum and maximum
+    order = np.lexsort((y, bucket))
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(bucket[order])) + 1))
+    ends = np.concatenate((starts[1:] - 1, [n - 1]))
+    return np.unique(np.concatenate((order[starts], order[ends])))
+
+
+def mean(x, y, bucket):
+    """
+    Mean value per calendar period, x are epoch milliseconds. Returns the
+    start of every period that has values and the mean of its values.
+    """
+    valid = ~np.isnan(y)
+    periods = x[valid].astype("datetime64[ms]").astype(
+        "datetime64[" + BUCKETS[bucket] + "]")
+    keys, inverse = np.unique(periods.astype(np.int64), return_inverse=True)
+    inverse = inverse.reshape(-1)
+    sums = np.bincount(inverse, weights=y[valid])
+    counts = np.bincount(inverse)
+    starts = keys.astype("datetime64[" + BUCKETS[bucket] + "]")
+    return starts.astype("datetime64[ms]").astype(np.int64), sums / counts
+
+
+def validate(method, points, bucket):
+    if method not in METHODS:
+        raise ValueError("Unknown downsampling method " + str(method) +
+                         ", expected one of " + ", ".join(METHODS))
+    if method == "mean" and bucket not in BUCKETS:
+        raise ValueError("Unknown bucket " + str(bucket) +
+                         ", expected one of " + ", ".join(BUCKETS))
+    if method != "mean" and int(points) < 3:
+        raise ValueError("At least 3 points are required")
+
+
+def downsample(x, y, method, points=1000, bucket="day"):
+    """
+    Downsampled copy of the series (x in epoch milliseconds), x and y are
+    sorted by time first and missing (NaN) values are left out.
+    """
+    validate(method, points, bucket)
+    order = np.argsort(x, kind="stable")
+    x = np.asarray(x)[order]
+    y = np.asarray(y, dtype=float)[order]
+    valid = ~np.isnan(y)
+    x, y = x[valid], y[valid]
+    if method == "mean":
+        return mean(x, y, bucket)
+    if method == "lttb":
+        indices = lttb(x.astype(float), y, int(points))
+    else:
+        indices = minmax(x, y, int(points))
+    return x[indices], y[indices]
+
+
+def downsampleGroups(x, groups, y, method, points=1000, bucket="day"):
+    """
+    Downsamples the series of every group (e.g. sensor) on its own, returns
+    x, groups and y of the kept points.
+    """
+    validate(method, points, bucket)
+    groups = np.asarray(groups)
+    names = np.unique(groups)
+    if not len(names):
+        return np.asarray(x), groups, np.asarray(y, dtype=float)
+    parts = [downsample(np.asarray(x)[groups == name], np.asarray(y)[groups == name],
+                        method, points, bucket) for name in names]
+    return (np.concatenate([part[0] for part in parts]),
+            np.repeat(names, [len(part[0]) for part in parts]),
+            np.concatenate([part[1] for part in parts]))
@@ -0,0 +1,154 @@
+import threading
+import ijson
+import numpy as np
+import orjson
+from pyproj import Transformer
+
+
+class TransformService:
+    """
+    Coordinate transformations between EPSG codes. pyproj Transformer
+    objects are expensive to create and not thread safe, every thread keeps
+    one per (source, target) pair. Coordinates are always x/y (lon/lat)
+    ordered, as in GeoJSON.
+    """
+    local = threading.local()
+
+    @staticmethod
+    def transformer(fromSRID, toSRID):
+        transformers = getattr(TransformService.local, "transformers", None)
+        if transformers is None:
+            transformers = TransformService.local.transformers = {}
+        key = (int(fromSRID), int(toSRID))
+        transformer = transformers.get(key)
+        if transformer is None:
+            transformer = transformers[key] = Transformer.from_crs(
+                "EPSG:" + str(key[0]), "EPSG:" + str(key[1]), always_xy=True)
+        return transformer
+
+    @staticmethod
+    def transformArray(coords, fromSRID, toSRID):
+        """
+        Transformed copy of an (n, 2) or (n, 3) array of coordinates, a
+        third column is kept as is.
+        """
+        coords = np.array(coords, dtype=float)
+        if len(coords) == 0 or int(fromSRID) == int(toSRID):
+            return coords
+        x, y = TransformService.transformer(fromSRID, toSRID).transform(
+            coords[:, 0], coords[:, 1])
+        coords[:, 0] = x
+        coords[:, 1] = y
+        return coords
+
+    @staticmethod
+    def transformGeoJSON(geojson, fromSRID, toSRID):
+        """
+        Transforms every geometry of a FeatureCollection, Feature or
+        geometry in place. All positions are collected first and transformed
+        with a single call.
+        """
+        if int(fromSRID) == int(toSRID):
+            return geojson
+        positions = []
+        if geojson.get("type") == "FeatureCollection":
+            for feature in geojson.get("features", []):
+                TransformService.geometryPositions(
+                    feature.get("geometry"), positions)
+        elif geojson.get("type") == "Feature":
+            TransformService.geometryPositions(
+                geojson.get("geometry"), positions)
+        else:
+            TransformService.geometryPositions(geojson, positions)
+        if not positions:
+            return geojson
+
+        coords = np.array([position[:2] for position in positions], dtype=float)
+        coords = TransformService.transformArray(coords, fromSRID, toSRID)
+        for position, (x, y) in zip(positions, coords.tolist()):
+            position[0] = x
+            position[1] = y
+        return geojson
+
+    @staticmethod
+    def geometryPositions(geometry, positions):
+        if not geometry:
+            return
+        if geometry.get("type") == "GeometryCollection":
+            for member in geometry.get("geometries", []):
+                TransformService.geometryPositions(member, positions)
+        elif geometry.get("type") == "Point":
+            if geometry.get("coordinates"):
+                geometry["coordinates"] = list(geometry["coordinates"])
+                positions.append(geometry["coordinates"])
+        else:
+            TransformService.collectPositions(
+                geometry.get("coordinates") or [], positions)
+
+    @staticmethod
+    def collectPositions(coordinates, positions):
+        for i, item in enumerate(coordinates):
+            if item and isinstance(item[0], (int, float)):
+                # Positions are updated in place, tuples are replaced by lists
+                if not isinstance(item, list):
+                    item = coordinates[i] = list(item)
+                positions.append(item)
+            else:
+                TransformService.collectPositions(item, positions)
+
+    @staticmethod
+    def featureBatches(stream, toSRID, fromSRID=None, batchSize=1000):
+        """
+        Reads the features of a GeoJSON FeatureCollection one by one from a
+        file-like stream and yields them reprojected in lists of batchSize.
+        The source system is fromSRID, otherwise a "crs" member that comes
+        before the features, otherwise EPSG:3857.
+        """
+        srid = fromSRID
+        builder = None
+        batch = []
+        for prefix, event, value in ijson.parse(stream, use_float=True):
+            if builder is not None:
+                builder.event(event, value)
+                if prefix == "features.item" and event == "end_map":
+                    batch.append(builder.value)
+                    builder = None
+                    if len(batch) >= batchSize:
+                        yield TransformService.transformFeatures(batch, srid or 3857, toSRID)
+                        batch = []
+            elif prefix == "features.item" and event == "start_map":
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+            elif prefix == "crs.properties.name" and event == "string" and srid is None:
+                srid = value.split(":")[-1]
+        if batch:
+            yield TransformService.transformFeatures(batch, srid or 3857, toSRID)
+
+    @staticmethod
+    def transformFeatures(features, fromSRID, toSRID):
+        TransformService.transformGeoJSON(
+            {"type": "FeatureCollection", "features": features}, fromSRID, toSRID)
+        return features
+
+    @staticmethod
+    def streamGeoJSON(stream, toSRID, fromSRID=None, ndjson=False, batchSize=1000):
+        """
+        Reprojected features of a streamed FeatureCollection as chunks of a
+        FeatureCollection or as newline-delimited features.
+        """
+        if not ndjson:
+            yield ('{"type": "FeatureCollection", "crs": {"type": "name", "properties": {"name": "urn:ogc:def:crs:EPSG::' +
+                   str(toSRID) + '"}}, "features": [').encode("utf-8")
+        started = False
+        for batch in TransformService.featureBatches(stream, toSRID, fromSRID, batchSize):
+            yield TransformService.encodeBatch(batch, ndjson, started)
+            started = True
+        if not ndjson:
+            yield b"]}"
+
+    @staticmethod
+    def encodeBatch(features, ndjson, started):
+        if ndjson:
+            return b"".join(orjson.dumps(feature) + b"\n" for feature in features)
+        chunk = b", ".join(orjson.dumps(feature) for feature in features)
+        return (b", " if started else b"") + chunk
@@ -1,48 +1,75 @@
-import requests
-import urllib.request
 from urllib.parse import quote, urlparse
 import xmltodict
 import string
 import random
-import math
 from xml.etree.ElementTree import Element, SubElement
 from xml.etree.ElementTree import fromstring
 from xml.etree import ElementTree
 from xml.dom import minidom
 import json
+import logging
 import datetime
+import threading
 import time
-from django.contrib.gis.geos import Point, GEOSGeometry
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
 import os
 import rasterio
 import numpy as np
-from osgeo import osr, ogr
+from utils import classification
+from utils.cache import ResultCache
+from utils.capabilities import CapabilitiesCache
+from utils.cog import CogConverter
+from utils.exceptions import JobFailed, OperationFailed
+from utils.geoserver import GeoServerClient
+from utils.executor import Deferred, WorkflowExecutor
+from utils.graph import WorkflowGraph
+from utils.http import HttpClient
+from utils.jobs import JobPoller
+from utils.raster import RasterFetcher
+from utils.store import ResultStore
+from utils.timeseries import downsample as downsampleSeries, downsampleGroups
+from utils.transform import TransformService
+from utils.xmlstream import XmlStream, childText, children, localAttribute, localName, responseStream
 min_attributes = ('scheme', 'netloc')
 
+logger = logging.getLogger(__name__)
+# Stands for the current time in cached SOS catalogs, replaced whenever a
+# catalog is read so its ranges always end now
+SOS_NOW = "__now__"
+
 
 class Util:
+    # DescribeSensor requests of all SOS catalogs share one bounded pool
+    sensorPool = None
+    lock = threading.Lock()
+
+    @staticmethod
+    def sensorExecutor():
+        with Util.lock:
+            if Util.sensorPool is None:
+                Util.sensorPool = ThreadPoolExecutor(
+                    max_workers=settings.SOS_DESCRIBE_SENSOR_WORKERS, thread_name_prefix="describe-sensor")
+            return Util.sensorPool
+
     @staticmethod
     def getWpsProcesses(url, limit=100, prefix="gs:"):
         if url is None:
             url = "https://mara.rangelands.itc.utwente.nl/geoserver/ows?"
         if "?" not in url:
             url = url + "?"
-        results = requests.get(url + "service=WPS&request=GetCapabilities")
-        if results.text == "" or results.status_code > 200:
-            return None
-        xpars = xmltodict.parse(results.text)
-        d = json.loads(json.dumps(xpars))
-        gsProcesses = []
+        return CapabilitiesCache.default().fetch(
+            url, url + "service=WPS&request=GetCapabilities",
+            lambda results: Util.parseWpsProcesses(results, url, limit, prefix), [limit, prefix], stream=True)
 
+    @staticmethod
+    def parseWpsProcesses(results, url, limit, prefix):
+        if results.status_code > 200:
+            return None
+        document = XmlStream(responseStream(results), 'Capabilities')
         processes = []
-        if isinstance(d['wps:Capabilities']['wps:ProcessOfferings']['wps:Process'], dict):
-            gsProcesses.append(d['wps:Capabilities']
-                               ['wps:ProcessOfferings']['wps:Process'])
-        else:
-            gsProcesses = d['wps:Capabilities']['wps:ProcessOfferings']['wps:Process']
-        for row in gsProcesses:
-            identifier = row['ows:Identifier']
+        for row in document.elements(['Process']):
+            identifier = childText(row, 'Identifier')
 
             if len(processes) > int(limit):
                 break
@@ -52,22 +79,25 @@ class Util:
                 'id': identifier,
                 'metadata': {
                     'label':  identifier,
-                    'longname': row['ows:Title'],
+                    'longname': childText(row, 'Title'),
                     'resource': 'WPS',
                     'url': url,
-                    'description': row.get('ows:Abstract', '')
+                    'description': childText(row, 'Abstract', '')
                 }
             })
-
+        if not document.valid:
+            return None
         return processes
 
     @staticmethod
     def getWpsCapabilities(url, identifier):
-        response = requests.get(
-            url + "service=WPS&request=DescribeProcess&identifier=" + identifier)
-        response = xmltodict.parse(response.text)
-        json2 = json.dumps(response)
-        b = json.loads(json2)
+        return CapabilitiesCache.default().fetch(
+            url, url + "service=WPS&request=DescribeProcess&identifier=" + identifier,
+            lambda response: Util.parseWpsCapabilities(response, url, identifier), stream=True)
+
+    @staticmethod
+    def parseWpsCapabilities(response, url, identifier):
+        b = xmltodict.parse(responseStream(response))
 
         process = {
             'id': identifier,
@@ -168,44 +198,42 @@ class Util:
             url += "?"
 
         # Result of the GetCapabilities
-        results = requests.get(url+"service=WFS&request=GetCapabilities")
-        if results.text == "" or results.status_code > 200:
+        return CapabilitiesCache.default().fetch(
+            url, url + "service=WFS&request=GetCapabilities",
+            lambda results: Util.parseWfsCapabilities(results, url, limit), limit, stream=True)
+
+    @staticmethod
+    def parseWfsCapabilities(results, url, limit):
+        if results.status_code > 200:
             return None
         features = []
-        jsonResponse = xmltodict.parse(results.text)
-
-        root = 'wfs:WFS_Capabilities'
-        if root not in jsonResponse:
-            root = 'WFS_Capabilities'
-            if root not in jsonResponse:
-                return None
-
-        version = jsonResponse[root].get(
-            'ows:ServiceIdentification', {}).get('ows:ServiceTypeVersion')
-        if isinstance(version, list) and len(version) > 0:
-            version = version[0]
-
-        if version:
-            version = "&version=" + version
-        else:
-            version = ''
-
-        for row in jsonResponse[root]['FeatureTypeList']['FeatureType']:
-            if len(features) > limit:
+        document = XmlStream(responseStream(results), 'WFS_Capabilities')
+        version = ''
+        # ServiceIdentification comes before the FeatureTypeList, the
+        # version is known before the first feature type is read
+        for row in document.elements(['ServiceTypeVersion', 'FeatureType']):
+            if localName(row.tag) == 'ServiceTypeVersion':
+                if not version and row.text:
+                    version = "&version=" + row.text.strip()
                 continue
+            if len(features) > int(limit):
+                break
 
+            name = childText(row, 'Name')
             feature = {}
             if "mapserv" in url:
                 feature['url'] = url + "service=WFS&request=GetFeature&typeName=" + \
-                    row['Name']+"&outputFormat=geojson&srsname=EPSG:3857" + version
+                    name + "&outputFormat=geojson&srsname=EPSG:3857" + version
             else:
                 feature['url'] = url + "service=WFS&request=GetFeature&typeName=" + \
-                    row['Name'] + "&outputFormat=application/json" + version
-            feature['name'] = row['Name']
-            feature['title'] = row['Title']
-            feature['abstract'] = row['Abstract']
-            feature['defaultCRS'] = row['DefaultCRS']
+                    name + "&outputFormat=application/json" + version
+            feature['name'] = name
+            feature['title'] = childText(row, 'Title')
+            feature['abstract'] = childText(row, 'Abstract')
+            feature['defaultCRS'] = childText(row, 'DefaultCRS')
             features.append(feature)
+        if not document.valid:
+            return None
         return features
 
     @staticmethod
@@ -216,42 +244,39 @@ class Util:
             url += "?"
 
         # Result of the GetCapabilities
-        results = requests.get(
-            url + "version=1.0.0&service=WCS&request=DescribeCoverage")
-        if results.text == "" or results.status_code > 200:
+        return CapabilitiesCache.default().fetch(
+            url, url + "version=1.0.0&service=WCS&request=DescribeCoverage",
+            lambda results: Util.parseWcsCapabilities(results, url, limit), limit, stream=True)
+
+    @staticmethod
+    def parseWcsCapabilities(results, url, limit):
+        if results.status_code > 200:
             return None
         coverages = []
-        jsonResponse = xmltodict.parse(results.text)
-
-        root = 'wcs:CoverageDescription'
-        if root not in jsonResponse:
-            root = 'CoverageDescription'
-            if root not in jsonResponse:
-                return None
-
-        version = jsonResponse[root].get(
-            'ows:ServiceIdentification', {}).get('ows:ServiceTypeVersion')
-        if isinstance(version, list) and len(version) > 0:
-            version = version[0]
-
-        if version:
-            version = "&version=" + version
-        else:
-            version = ''
-
-        for row in jsonResponse[root].get('wcs:CoverageOffering', []):
-            if len(coverages) > limit:
+        document = XmlStream(responseStream(results), 'CoverageDescription')
+        version = ''
+        for row in document.elements(['ServiceTypeVersion', 'CoverageOffering']):
+            if localName(row.tag) == 'ServiceTypeVersion':
+                if not version and row.text:
+                    version = "&version=" + row.text.strip()
                 continue
+            if len(coverages) > int(limit):
+                break
+            name = childText(row, 'name')
+            envelope = children(row, 'lonLatEnvelope')[0]
+            positions = [[float(value) for value in position.text.split()]
+                         for position in children(envelope, 'pos')]
             coverage = {}
-            coverage['name'] = row['wcs:name']
+            coverage['name'] = name
             coverage['url'] = url + "version=2.0.0&service=WCS&request=GetCoverage&coverageId=" + \
-                row['wcs:name'] + "&format=image/geotiff" + version
-            coverage['title'] = row['wcs:label']
-            coverage['abstract'] = row['wcs:description']
-            coverage['defaultCRS'] = row['wcs:lonLatEnvelope']['@srsName']
-            coverage['properties'] = {"min": [float((row['wcs:lonLatEnvelope']['gml:pos'][0]).split(" ")[0]), float((row['wcs:lonLatEnvelope']['gml:pos'][0]).split(
-                " ")[1])], "max": [float((row['wcs:lonLatEnvelope']['gml:pos'][1]).split(" ")[0]), float((row['wcs:lonLatEnvelope']['gml:pos'][1]).split(" ")[1])]}
+                name + "&format=image/geotiff" + version
+            coverage['title'] = childText(row, 'label')
+            coverage['abstract'] = childText(row, 'description')
+            coverage['defaultCRS'] = localAttribute(envelope, 'srsName')
+            coverage['properties'] = {"min": positions[0][:2], "max": positions[1][:2]}
             coverages.append(coverage)
+        if not document.valid:
+            return None
         return coverages
 
     @staticmethod
@@ -264,18 +289,29 @@ class Util:
             url += "?"
 
         # Result of the GetCapabilities
-        results = requests.get(
-            url + "service=SOS&request=GetCapabilities")
-        if results.text == "" or results.status_code > 200:
+        catalog = CapabilitiesCache.default().fetch(
+            url, url + "service=SOS&request=GetCapabilities",
+            # Own variant, entries parsed with a fixed end time are not read
+            lambda results: Util.parseSosCapabilities(results, url, limit), str(limit) + ":" + SOS_NOW,
+            stream=True)
+        if catalog is None:
+            return None
+        now = datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
+        return json.loads(json.dumps(catalog).replace(SOS_NOW, now))
+
+    @staticmethod
+    def parseSosCapabilities(results, url, limit):
+        if results.status_code > 200:
             return None
-        root = fromstring(results.text)
+        document = XmlStream(responseStream(results), 'Capabilities')
         colors = ['#e41a1c', '#377eb8', '#4daf4a',
                   '#984ea3', '#4dacff', '#f47671', '#0088ff']
         count = 0
         observations = []
-        for child in root[4][0]:
-            if len(observations) > limit:
-                continue
+        sensors = []
+        for child in document.elements(['ObservationOffering']):
+            if len(observations) > int(limit):
+                break
             if "sos.py" in url or list(child.attrib.values())[0] == "LUFTTEMPERATUR" or list(child.attrib.values())[0] == "WASSERTEMPERATUR" or list(child.attrib.values())[0] == "LUFTFEUCHTE":
                 feature = {}
                 feature["offering"] = list(child.attrib.values())[0]
@@ -288,19 +324,18 @@ class Util:
                         beginTime = item[0][0].text
                         endTime = item[0][1].text
                         feature["beginTime"] = beginTime+"T00:00:00"
-                        feature["endTime"] = str(
-                            datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S'))
+                        # Cached catalogs are revalidated and served stale,
+                        # the current time is filled in when they are read
+                        feature["endTime"] = SOS_NOW
                         if "sos.py" in url:
                             feature["url"] = url + "service=SOS&request=GetObservation&version=1.0.0&observedProperty=" + \
                                 feature["offering"].capitalize() + "&offering=" + feature["offering"]+"&eventTime=" + \
-                                beginTime+"/" + \
-                                str(datetime.datetime.now().strftime(
-                                    '%Y-%m-%dT%H:%M:%S'))
+                                beginTime+"/" + SOS_NOW
                         else:
                             feature["url"] = url + "service=SOS&request=GetObservation&version=1.0.0&observedProperty=" + \
                                 feature[
                                 "offering"].capitalize() + "&offering=" + feature[
-                                "offering"] + "&responseformat=text/xml;subtype=%22om/1.0.0%22"+"&eventTime="+beginTime+"/"+str(datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S'))
+                                "offering"] + "&responseformat=text/xml;subtype=%22om/1.0.0%22"+"&eventTime="+beginTime+"/"+SOS_NOW
 
                     if "observedProperty" in item.tag:
                         observedProperty = list(item.attrib.values())[0]
@@ -322,74 +357,179 @@ class Util:
                             describeURL = url + 'service=SOS&request=DescribeSensor&procedure=' + \
                                 procedure + '&outputformat=text/xml;subtype="sensorML/1.0.1"&version=1.0.0'
 
-                        result = requests.get(describeURL)
-                        xmlstring = result.text
-                        if result.status_code < 300:
-                            xml = fromstring(xmlstring)
-                            for x in xml[0][0]:
-                                if "position" in x.tag:
-                                    coord = [float(x[0][0][0][0][0][1].text), float(
-                                        x[0][0][0][1][0][1].text)]
-                                    coords = Util.coordinateTransform(coord, int(
-                                        x[0].attrib['referenceFrame'].split("EPSG::")[1]), 3857)
-                                    featuresOfInterest.append({
-                                        "name": featureOfInterest,
-                                        "abstract": xml[0][0][0].text,
-                                        "location": coords,
-                                        "defaultCRS": x[0].attrib['referenceFrame'],
-                                        "beginTime": feature["beginTime"]+"T00:00:00",
-                                        "endTime": feature["endTime"],
-                                        "url": url + "service=SOS&request=GetObservation&procedure="+procedure+"&version=1.0.0&offering="+feature["offering"]+"&observedProperty="+observedProperty+"&featureOfInterest="+featureOfInterest+'&responseformat=text/xml;subtype=%22om/1.0.0%22'
-                                    })
-                                    feature["defaultCRS"] = x[0].attrib['referenceFrame']
+                        # Described after the whole document is read, all
+                        # sensors at once
+                        sensors.append((feature, featuresOfInterest, featureOfInterest,
+                                        procedure, observedProperty, describeURL))
                         feature["featuresOfInterest"] = featuresOfInterest
                 observations.append(feature)
+        if not document.valid:
+            return None
+        Util.addSensorLocations(url, sensors)
         return observations
 
     @staticmethod
-    def getSosObservations(url):
+    def addSensorLocations(url, sensors):
+        describeURLs = list(dict.fromkeys(sensor[5] for sensor in sensors))
+        positions = dict(zip(describeURLs, Util.sensorExecutor().map(
+            lambda describeURL: Util.describeSensor(url, describeURL), describeURLs)))
+
+        # One transformation per reference system instead of one per sensor
+        coords = {}
+        for sensor in sensors:
+            for position in positions[sensor[5]] or []:
+                coords.setdefault(position["referenceFrame"], []).append(
+                    position["coord"])
+        transformed = {}
+        for referenceFrame, values in coords.items():
+            transformed[referenceFrame] = iter(Util.coordinatesTransform(
+                values, int(referenceFrame.split("EPSG::")[1]), 3857))
+
+        for feature, featuresOfInterest, featureOfInterest, procedure, observedProperty, describeURL in sensors:
+            for position in positions[describeURL] or []:
+                featuresOfInterest.append({
+                    "name": featureOfInterest,
+                    "abstract": position["abstract"],
+                    "location": next(transformed[position["referenceFrame"]]),
+                    "defaultCRS": position["referenceFrame"],
+                    "beginTime": feature["beginTime"]+"T00:00:00",
+                    "endTime": feature["endTime"],
+                    "url": url + "service=SOS&request=GetObservation&procedure="+procedure+"&version=1.0.0&offering="+feature["offering"]+"&observedProperty="+observedProperty+"&featureOfInterest="+featureOfInterest+'&responseformat=text/xml;subtype=%22om/1.0.0%22'
+                })
+                feature["defaultCRS"] = position["referenceFrame"]
+
+    @staticmethod
+    def describeSensor(url, describeURL):
+        # Sensors rarely move, their positions are kept much longer than
+        # the capabilities documents. A sensor that cannot be described is
+        # left out of the catalog instead of failing it.
+        try:
+            return CapabilitiesCache.default().fetch(
+                url, describeURL, Util.parseSensorPositions, ttl=settings.SOS_SENSOR_CACHE_TTL)
+        except Exception:
+            logger.warning("Could not describe sensor %s", describeURL, exc_info=True)
+            return None
+
+    @staticmethod
+    def parseSensorPositions(result):
+        # None is not cached: failed requests, including 429, are retried
+        # with the next catalog request
+        if result.status_code != 200:
+            return None
+        positions = []
+        try:
+            xml = fromstring(result.text)
+            for x in xml[0][0]:
+                if "position" in x.tag:
+                    positions.append({
+                        "abstract": xml[0][0][0].text,
+                        "coord": [float(x[0][0][0][0][0][1].text), float(x[0][0][0][1][0][1].text)],
+                        "referenceFrame": x[0].attrib['referenceFrame']
+                    })
+        except (ElementTree.ParseError, IndexError, KeyError, TypeError, ValueError):
+            logger.warning("Unexpected DescribeSensor response from %s", result.url)
+            return None
+        return positions
+
+    @staticmethod
+    def getSosObservations(url, layout="rows", downsample=None, points=1000, bucket="day"):
         if url is None:
             url = "https://gip.itc.utwente.nl/services/ogc/sos.py?service=SOS&request=GetObservation&version=1.0.0&observedProperty=Rainfall_sensors&offering=rainfall_SENSORS&responseformat=text/xml;subtype=%22om/1.0.0%22"
 
+        observations = Util.fetchSweValues(url)
+        if observations is None:
+            return None
+        return Util.formatSosObservations(*observations, layout, downsample, points, bucket)
+
+    @staticmethod
+    def fetchSweValues(url):
         # Result of the GetObservations
-        results = requests.get(url)
+        results = HttpClient.default().get(url)
         if results.text == "" or results.status_code > 200:
             return None
-        obersevations = []
-        chartData = []
         xmlstring = results.text
         root = fromstring(xmlstring)
-        for child in root[1][0][4][0]:
-            if "values" not in child.tag:
-                continue
-            values = child.text.split(";")
-            for item in values:
-                if item == "":
-                    continue
-                item = item.split(",")
-                date = item[0]
-                if "\n" in date:
-                    date = date.split("\n")[1]
-                date = datetime.datetime.strptime(
-                    date.split(".")[0], '%Y-%m-%dT%H:%M:%S')
-                pattern = '%Y-%m-%d %H:%M:%S'
-                epoch = int(time.mktime(time.strptime(
-                    date.strftime(pattern), pattern)))
-
-                obersevations.append({
-                    "timestamp": epoch,
-                    "sensor": item[1],
-                    "value": item[2]
-                })
-                chartData.append([epoch*1000, float(item[2])])
+        blocks = [child.text or "" for child in root[1][0]
+                  [4][0] if "values" in child.tag]
+        return Util.parseSweValues(";".join(blocks))
+
+    @staticmethod
+    def formatSosObservations(timestamps, sensors, values, layout="rows", downsample=None, points=1000, bucket="day"):
+        if layout == "columnar":
+            return Util.formatColumnarObservations(timestamps, sensors, values, downsample, points, bucket)
+        return Util.formatObservations(timestamps, sensors, values, downsample, points, bucket)
+
+    @staticmethod
+    def parseSweValues(text):
+        """
+        Splits a SWE values block ("time,sensor,value;...") into arrays of
+        epoch seconds, sensor names and the values as they were sent.
+        """
+        rows = [record.split(",")[:3]
+                for record in text.split(";") if record.strip()]
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=str), np.empty(0, dtype=str)
+        fields = np.array(rows)
+        # Fractional seconds are dropped, "YYYY-MM-DDTHH:MM:SS" is 19 long
+        dates = np.char.strip(fields[:, 0]).astype("U19")
+        naive = dates.astype("datetime64[s]").astype(np.int64)
+        return Util.localEpochs(naive), fields[:, 1], fields[:, 2]
+
+    @staticmethod
+    def localEpochs(naive):
+        # Timestamps are local times of the server time zone, as with
+        # time.mktime. The offset only changes on full hours, so mktime is
+        # called once per distinct hour instead of once per observation.
+        hours, inverse = np.unique(naive // 3600, return_inverse=True)
+        offsets = np.array([int(time.mktime(time.gmtime(int(hour) * 3600)[:8] + (-1,))) - int(hour) * 3600
+                            for hour in hours], dtype=np.int64)
+        return naive + offsets[inverse.reshape(-1)]
+
+    @staticmethod
+    def formatObservations(timestamps, sensors, values, downsample=None, points=1000, bucket="day"):
+        # The chart draws a fixed number of points whatever the time range,
+        # the rows keep that many points per sensor
+        chartX, chartY = timestamps * 1000, values.astype(float)
+        if downsample and len(chartX):
+            chartX, chartY = downsampleSeries(
+                chartX, chartY, downsample, points, bucket)
+            timestamps, sensors, values = Util.downsampleObservations(
+                timestamps, sensors, values, downsample, points, bucket)
+        obersevations = [{"timestamp": timestamp, "sensor": sensor, "value": value}
+                         for timestamp, sensor, value in zip(timestamps.tolist(), sensors.tolist(), values.tolist())]
+        chartData = [[x, y] for x, y in zip(chartX.tolist(), chartY.tolist())]
         return {"obersevations": obersevations, "chartdata": chartData}
 
+    @staticmethod
+    def formatColumnarObservations(timestamps, sensors, values, downsample=None, points=1000, bucket="day"):
+        # Parallel arrays, one entry per observation
+        if downsample and len(timestamps):
+            timestamps, sensors, values = Util.downsampleObservations(
+                timestamps, sensors, values, downsample, points, bucket)
+        return {
+            "timestamps": timestamps.tolist(),
+            "sensors": sensors.tolist(),
+            "values": values.astype(float).tolist()
+        }
+
+    @staticmethod
+    def downsampleObservations(timestamps, sensors, values, downsample, points, bucket):
+        # Per sensor, timestamps are epoch seconds
+        milliseconds, sensors, values = downsampleGroups(
+            timestamps * 1000, sensors, values.astype(float), downsample, points, bucket)
+        return milliseconds // 1000, sensors, values
+
     @staticmethod
     def getStacCapabilities(url, limit=100):
         if url is None:
             url = "https://earth-search.aws.element84.com/v1"
 
-        results = requests.get(url + "/collections")
+        return CapabilitiesCache.default().fetch(
+            url, url + "/collections",
+            lambda results: Util.parseStacCapabilities(results, url, limit), limit)
+
+    @staticmethod
+    def parseStacCapabilities(results, url, limit):
         if results.text == "" or results.status_code > 200:
             return None
         jsonResponse = results.json()
@@ -419,9 +559,13 @@ class Util:
 
     @staticmethod
     def coordinateTransform(coord, fromSRID=4326, toSRID=32736):
-        point = Point(coord[0], coord[1], srid=fromSRID)
-        point.transform(toSRID)
-        return [point.x, point.y]
+        return Util.coordinatesTransform([coord], fromSRID, toSRID)[0]
+
+    @staticmethod
+    def coordinatesTransform(coords, fromSRID=4326, toSRID=32736):
+        if len(coords) == 0:
+            return []
+        return TransformService.transformArray([coord[:2] for coord in coords], fromSRID, toSRID).tolist()
 
     @staticmethod
     def jsonTransform(geojson, toSRID=3857):
@@ -443,81 +587,29 @@ class Util:
         if int(srid) == int(toSRID):
             return geojson
 
-        transformed_features = []
-        features = geojson.get("features")
-
-        source = osr.SpatialReference()
-        source.ImportFromEPSG(int(srid))
-
-        target = osr.SpatialReference()
-        target.ImportFromEPSG(int(toSRID))
-
-        transform = osr.CoordinateTransformation(source, target)
-
-        for feature in features:
-            geometry = ogr.CreateGeometryFromJson(
-                json.dumps(feature.get("geometry")))
-            # geometry = GEOSGeometry(json.dumps(
-            #    feature.get("geometry")), srid=int(srid))
-            geometry.Transform(transform)
-            # feature['geometry'] = geometry.json
-            feature['geometry'] = json.loads(geometry.ExportToJson())
-            transformed_features.append(feature)
-
-        geojson['features'] = transformed_features
-        return geojson
+        return TransformService.transformGeoJSON(geojson, srid, toSRID)
 
     @staticmethod
-    def executeWorkflow(workflow):
-        operations = workflow["operations"]
-        orderedIDs = Util.getExecutionOrder(workflow)
-        outputs = {}
-        j = 1
-        result = []
-        for id in orderedIDs:
-            operation = Util.getOperationByID(id, operations)
-            if len(outputs) > 0:
-                for i in range(0, len(operation["inputs"])):
-                    if "_to_" in operation["inputs"][i]["value"]:
-                        value = operation["inputs"][i]["value"].split("_to_")
-                        operation["inputs"][i]["value"] = outputs[value[0]][0]
-            output = Util.executeOperation(operation)
-            outputs[str(id)] = [output]
-            result.append(
-                {"type": operation["outputs"][0]["type"], "data": output, "id": id})
-            j = j + 1
-        return result
+    def executeWorkflow(workflow, maxWorkers=None, listener=None, reuse=None):
+        graph = WorkflowGraph(workflow)
+        executor = WorkflowExecutor(
+            workflow, graph, Util.executeOperation, maxWorkers, listener, reuse)
+        return executor.run()
 
     @staticmethod
-    def getExecutionOrder(workflow):
-        operations = workflow["operations"]
-        connections = workflow["connections"]
-        nodeIDs = set()
-        operIDs = set()
-        for operation in operations:
-            operIDs.add(operation["id"])
-            for connection in connections:
-                if connection["fromOperationID"] == operation["id"]:
-                    nodeIDs.add(operation["id"])
-                    break
-
-        leafIDs = list(operIDs.difference(nodeIDs))
-        orderID = []
-        orderID.extend(leafIDs)
-        for id in leafIDs:
-            Util.recursiveF(connections, orderID, id)
-        return orderID
+    def formatWorkflowResults(outputs):
+        results = []
+        for output in outputs:
+            results.append({
+                "id": output["id"],
+                "result": output["data"],
+                "type": output["type"]
+            })
+        return results
 
     @staticmethod
-    def recursiveF(connections, orderID, id):
-        for connection in connections:
-            if connection["toOperationID"] == id:
-                if connection["fromOperationID"] in orderID:
-                    orderID.remove(connection["fromOperationID"])
-                orderID.insert(0, connection["fromOperationID"])
-                Util.recursiveF(connections, orderID,
-                                connection["fromOperationID"])
-        return orderID
+    def getExecutionOrder(workflow):
+        return WorkflowGraph(workflow).order()
 
     @staticmethod
     def getOperationByID(id, operations):
@@ -551,6 +643,10 @@ class Util:
 
     @staticmethod
     def executeOperation(operation):
+        return ResultCache.default().memoize(operation, Util.runOperation)
+
+    @staticmethod
+    def runOperation(operation):
         output = ""
         if operation["metadata"]["resource"] == "WPS":
             if operation['outputs'][0]['type'] == "geom":
@@ -583,13 +679,45 @@ class Util:
             output = Util.publishRaster(operation)
             if output:
                 output = output
+        elif operation['outputs'][0]['type'] == "coverage":
+            if isinstance(output, Deferred):
+                return output.map(Util.optimizeCoverage)
+            output = Util.optimizeCoverage(output)
         return output
 
+    @staticmethod
+    def optimizeCoverage(url):
+        """
+        URL of a Cloud-Optimized copy of the GeoTIFF coverage output at url,
+        kept in the ResultStore. url itself when conversion is disabled,
+        not needed or fails.
+        """
+        store = ResultStore.default()
+        if not settings.COG_CONVERT_OUTPUTS or not store.baseUrl or \
+                not isinstance(url, str) or not Util.is_url(url) or store.keyOf(url) is not None:
+            return url
+        try:
+            file = RasterFetcher.download(url)
+            if CogConverter.isOptimized(file):
+                return url
+            key = store.put(CogConverter.convert(
+                file, store.temporary(".tif")), ".tif", move=True)
+        except Exception:
+            # An optional stage, the original output still works
+            logger.exception("Could not convert %s to a COG", url)
+            return url
+        return store.url(key)
+
     @staticmethod
     def executeREST(operation):
         headers = {'content-type': 'application/json'}
-        results = requests.post(
-            operation["metadata"]["url"], data=json.dumps(operation), headers=headers)
+        results = HttpClient.default().post(
+            operation["metadata"]["url"], data=json.dumps(operation), headers=headers,
+            timeout=HttpClient.executeTimeout())
+        # Error answers fail the operation, they are neither passed on
+        # downstream nor cached as its result
+        if results.status_code >= 400:
+            raise OperationFailed(operation["metadata"]["url"], results.status_code, results.text)
         if results.text == "":
             results = []
         else:
@@ -645,8 +773,8 @@ class Util:
         ows_Identifier.text = 'result'
         url = operation['metadata']['url']
         headers = {'content-type': 'text/xml'}
-        response = requests.post(
-            url, data=Util.prettify(root), headers=headers)
+        response = HttpClient.default().post(
+            url, data=Util.prettify(root), headers=headers, timeout=HttpClient.executeTimeout())
         if response.status_code < 300:
             return response.json() if operation['outputs'][0]['type'] == 'geom' else response.text
 
@@ -710,23 +838,21 @@ class Util:
         wpsExecuteBody["Execute"] = body
         headers = {'content-type': 'application/json'}
 
-        r = requests.post(operation['metadata']['url'] + "/jobs",
-                          data=json.dumps(wpsExecuteBody), headers=headers)
-        url = r.headers["Location"]
-        response = requests.get(url)
-        statusInfo = response.json()["StatusInfo"]
-        status = statusInfo["Status"]
-        while status == "Running":
-            r = requests.get(url)
-            statusInfo = response.json()["StatusInfo"]
-            status = statusInfo["Status"]
-
-        if status == "Failed":
-            return "Failed"
-        else:
-            responseOutput = statusInfo["Output"]
-            response = requests.get(responseOutput)
-            return response.json()["Result"]["Output"][0]
+        r = HttpClient.default().post(operation['metadata']['url'] + "/jobs",
+                                      data=json.dumps(wpsExecuteBody), headers=headers)
+        url = r.headers.get("Location")
+        if r.status_code >= 300 or not url:
+            raise JobFailed(operation['metadata']['url'] + "/jobs",
+                            "job was not accepted (HTTP " + str(r.status_code) + ")")
+
+        # The shared poller resolves the future once the job is finished or
+        # fails it with JobFailed or JobTimeout, no thread waits meanwhile
+        return Deferred(JobPoller.default().submit(url), Util.fetchJobOutput)
+
+    @staticmethod
+    def fetchJobOutput(statusInfo):
+        response = HttpClient.default().get(statusInfo["Output"])
+        return response.json()["Result"]["Output"][0]
 
     @staticmethod
     def executeILWIS(operation):
@@ -741,8 +867,12 @@ class Util:
         maps = ";".join(maps)
         texts = "$".join(texts)
         inputs = quote(maps + "textinputs" + texts)
-        results = requests.get(
-            operation["metadata"]["url"] + "/execute/" + inputs + "/" + label)
+        # A GET that runs the process, a retry would run it again
+        results = HttpClient.default().get(
+            operation["metadata"]["url"] + "/execute/" + inputs + "/" + label,
+            retry=False, timeout=HttpClient.executeTimeout())
+        if results.status_code >= 400:
+            raise OperationFailed(operation["metadata"]["url"], results.status_code, results.text)
         if results.text == "":
             results = []
         else:
@@ -793,60 +923,61 @@ class Util:
 
     @staticmethod
     def publishRaster(operation):
-        file = Util.downloadRasterFile(operation["inputs"][0]["value"])
-        file = file["file"]
-        base = os.path.basename(file)
-        projection = "EPSG:32736"
-        if os.path.exists(file):
-            with rasterio.open(file) as ds:
-                projection = ds.crs
-                host = quote(operation["inputs"][1]["value"])
-                host = operation["inputs"][1]["value"]
-                workspace = operation["inputs"][2]["value"]
-                if workspace is None or workspace == "":
-                    workspace = "maris_mamase"
-                username = operation["inputs"][3]["value"]
-                password = operation["inputs"][4]["value"]
-
-                sld_file = Util.generateSLD(file, os.path.splitext(base)[0])
-
-                config_file = settings.MEDIA_ROOT + os.path.sep + \
-                    Util.id_generator() + str(int(time.time())) + ".json"
-                with open(config_file, "w") as f:
-                    f.write(json.dumps({
-                        "geoserver": [
-                            {
-                                "host": host,
-                                "port": 80,
-                                "user": username,
-                                "password": password
-                            }
-                        ],
-                        "developer": "robertohuru@gmail.com"
-                    }))
-
-                publishcommand = f"java -jar {settings.GEOJAR_FILE} {workspace} {file} {sld_file} {projection} {config_file} No"
-                os.system(publishcommand)
-                extent = ds.bounds
-                southwest = [extent.left, extent.bottom]
-                northeast = [extent.right, extent.top]
-
-                southwest = Util.coordinateTransform(
-                    southwest, projection.to_epsg(), toSRID=3857)
-                northeast = Util.coordinateTransform(
-                    northeast, projection.to_epsg(), toSRID=3857)
-                extent = southwest + northeast
-                os.remove(sld_file)
-                os.remove(file)
-                os.remove(config_file)
-                return {"extent": extent, "layer": workspace + ":" + os.path.splitext(base)[0]}
+        host = operation["inputs"][1]["value"]
+        workspace = operation["inputs"][2]["value"]
+        if workspace is None or workspace == "":
+            workspace = "maris_mamase"
+        username = operation["inputs"][3]["value"]
+        password = operation["inputs"][4]["value"]
+        method = next((input["value"] for input in operation["inputs"]
+                       if input.get("identifier") == "classification" and input.get("value")), None)
+        if method is not None and method not in classification.METHODS:
+            logger.warning("Unknown classification method %s, using %s",
+                           method, settings.SLD_CLASSIFICATION)
+            method = None
+
+        client = GeoServerClient(host, username, password)
+        client.ensureWorkspace(workspace)
+        return Util.publishRasterFile(client, workspace, operation["inputs"][0]["value"], method)
 
     @staticmethod
-    def downloadRasterFile(url):
-        path = settings.MEDIA_ROOT + os.path.sep + \
-            Util.id_generator() + str(int(time.time())) + ".tif"
-        urllib.request.urlretrieve(url, path)
-        return {"file": path}
+    def publishRasterFile(client, workspace, url, method=None):
+        """
+        Downloads the raster at url into the ResultStore and publishes it
+        with a generated style as a layer of workspace. Identical rasters
+        are stored once and published as the same layer. The stored file is
+        held until it is published, a concurrent put cannot evict it.
+        """
+        store = ResultStore.default()
+        file = RasterFetcher.download(url)
+        key = None
+        if settings.COG_CONVERT_PUBLISH and not CogConverter.isOptimized(file):
+            try:
+                key = store.put(CogConverter.convert(
+                    file, store.temporary(".tif")), ".tif", move=True, hold=True)
+            except Exception:
+                # GeoServer serves the original file as well, only slower
+                logger.exception("Could not convert %s to a COG", url)
+        if key is None:
+            # Shares the disk space of the download instead of copying it
+            key = store.put(file, ".tif", link=True, hold=True)
+        file = store.get(key)
+        name = "ds" + key[:16]
+        method = method or settings.SLD_CLASSIFICATION
+        sld_file = store.temporary(".xml")
+        try:
+            # CRS and extent from the header, the file is not kept open
+            # while it is published
+            metadata = RasterFetcher.metadata(file)
+            Util.generateSLD(file, sld_file, method)
+            # One style per classification, concurrent publishes of the same
+            # raster with different methods do not overwrite each other
+            layer = client.publishRaster(
+                workspace, name, file, sld_file, metadata["crs"], style=name + "_" + method)
+        finally:
+            RasterFetcher.discard(sld_file)
+            store.release(key)
+        return {"extent": metadata["extent"], "layer": layer}
 
     @staticmethod
     def id_generator(size=6, chars=string.ascii_uppercase + string.digits):
@@ -866,10 +997,12 @@ class Util:
                     for qualifying_attr in qualifying])
 
     @staticmethod
-    def generateSLD(file, sldName):
+    def generateSLD(file, sldFile, method=None):
+        """Writes the SLD of the raster file to the path sldFile and returns it."""
         with rasterio.open(file) as ds:
-            pixArr = ds.read(1)
-            pixArr = pixArr.flatten()
+            # Class edges from a bounded sample of the valid pixels
+            edges = classification.breaks(ds, method or settings.SLD_CLASSIFICATION, 7,
+                                          settings.SLD_SAMPLE_SIZE, settings.SLD_JENKS_SAMPLE_SIZE)
             root = Element('StyledLayerDescriptor')
             root.set('version', '1.0.0')
             root.set('xmlns:xsi', 'http://www.w3.org/2001/XMLSchema-instance')
@@ -899,17 +1032,10 @@ class Util:
             opacity.text = "1"
             colorMap = SubElement(rasterSymbolizer, "ColorMap")
             colorMap.set("type", "intervals")
-            pixArr = set(pixArr)
-            pixArr = list(pixArr)
-            pixArr.sort()
-            pixArr = np.array(pixArr)
-            n = int(len(pixArr) / 7)
             colors = ["#FFFFFF", "#8c510a", "#d8b365", "#f6e8c3",
                       "#f5f5f5", "#c7eae5", "#5ab4ac", "#01665e"]
-            divisions = pixArr[list(range(0, len(pixArr) - 1, n))]
-            divisions[divisions == -np.inf] = math.floor(pixArr[1])
-            divisions[divisions == np.inf] = math.ceil(pixArr[-2])
-            max = np.nanmax(divisions)
+            divisions = edges[:-1].tolist() if len(edges) > 1 else edges.tolist()
+            max = float(edges[-1])
             for idx, div in enumerate(divisions):
                 colorMapEntry = SubElement(colorMap, "ColorMapEntry")
                 colorMapEntry.set("color", colors[idx])
@@ -923,11 +1049,9 @@ class Util:
             colorMapEntry.set("label", str(max))
             colorMapEntry.set("opacity", "1")
             xml = Util.prettify(root)
-            sldFile = open(settings.MEDIA_ROOT +
-                           os.path.sep + sldName + ".xml", "w")
-            sldFile.write(xml)
-            sldFile.close()
-            return settings.MEDIA_ROOT + os.path.sep + sldName + ".xml"
+            with open(sldFile, "w") as f:
+                f.write(xml)
+            return sldFile
 
     @staticmethod
     def piwToQgisWorkflow(workflowJSON):
@@ -0,0 +1,75 @@
+from xml.etree import ElementTree
+
+
+def localName(tag):
+    """Tag without its "{namespace}" prefix."""
+    return tag.rsplit("}", 1)[-1]
+
+
+def childText(element, name, default=None):
+    for child in element:
+        if localName(child.tag) == name:
+            return child.text.strip() if child.text else default
+    return default
+
+
+def children(element, name):
+    return [child for child in element if localName(child.tag) == name]
+
+
+def localAttribute(element, name, default=None):
+    for key, value in element.attrib.items():
+        if localName(key) == name:
+            return value
+    return default
+
+
+class XmlStream:
+    """
+    Incremental parser over a file-like response body. elements() yields
+    every complete element with one of the given local names and detaches
+    it from the tree afterwards, so memory stays bounded by the largest
+    element and the caller can stop reading as soon as it has enough.
+    """
+
+    def __init__(self, stream, root=None):
+        self.stream = stream
+        self.expectedRoot = root
+        self.root = None
+
+    @property
+    def valid(self):
+        # False for empty bodies and documents with an unexpected root
+        # element such as ows:ExceptionReport
+        if self.root is None:
+            return False
+        return self.expectedRoot is None or self.root == self.expectedRoot
+
+    def elements(self, names):
+        names = set(names)
+        parents = []
+        try:
+            for event, element in ElementTree.iterparse(self.stream, events=("start", "end")):
+                if event == "start":
+                    if self.root is None:
+                        self.root = localName(element.tag)
+                        if not self.valid:
+                            return
+                    parents.append(element)
+                    continue
+                parents.pop()
+                if localName(element.tag) in names:
+                    yield element
+                    element.clear()
+                    if parents:
+                        parents[-1].remove(element)
+        except ElementTree.ParseError:
+            if self.root is None:
+                return
+            raise
+
+
+def responseStream(response):
+    """Raw body of a streamed requests response, decompressed."""
+    response.raw.decode_content = True
+    return response.raw